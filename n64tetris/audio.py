@@ -0,0 +1,85 @@
+"""
+Sample import: any integer PCM wav to a rom sample's rate, width and length.
+"""
+
+import sys
+import numpy as np
+
+from . import utils
+
+ZERO_CROSSINGS = 16
+PHASES = 256
+KAISER_BETA = 8.0
+BLOCK_SIZE = 4096
+
+def filter_bank(cutoff, zero_crossings=ZERO_CROSSINGS, phases=PHASES):
+    """
+    Kaiser windowed sinc low pass filter, one row of taps per fractional phase.
+    cutoff is relative to the input nyquist.  Returns (offsets, table).
+    """
+    half = int(np.ceil(zero_crossings / cutoff))
+    offsets = np.arange(-half + 1, half + 1)
+    t = offsets[None, :] - (np.arange(phases + 1) / phases)[:, None]
+    window = np.i0(KAISER_BETA * np.sqrt(np.clip(1 - (t / half) ** 2, 0, None))) / np.i0(KAISER_BETA)
+    table = cutoff * np.sinc(cutoff * t) * window
+    table /= table.sum(axis=1, keepdims=True)
+    return offsets, table.astype(np.float32)
+
+def resample(pcm, src_rate, dst_rate, block_size=BLOCK_SIZE):
+    """
+    Polyphase resampling of float pcm from src_rate to dst_rate.  Each output
+    frame uses the filter phase nearest its fractional input position, and
+    blocks of output frames are computed as one gather and one row-wise dot.
+    """
+    if src_rate == dst_rate or len(pcm) == 0:
+        return np.asarray(pcm, dtype=np.float32)
+
+    ratio = src_rate / dst_rate
+    # 0.95: leave room for the transition band below the output nyquist
+    offsets, table = filter_bank(min(1.0, dst_rate / src_rate) * 0.95)
+    pad = len(offsets)
+    padded = np.pad(np.asarray(pcm, dtype=np.float32), (pad, pad))
+
+    n_out = int(round(len(pcm) / ratio))
+    out = np.empty(n_out, dtype=np.float32)
+    for start in range(0, n_out, block_size):
+        pos = np.arange(start, min(start + block_size, n_out)) * ratio
+        base = np.floor(pos).astype(np.int64)
+        phase = np.rint((pos - base) * PHASES).astype(np.int64)
+        taps = padded[base[:, None] + offsets[None, :] + pad]
+        out[start : start + len(pos)] = np.einsum('ij,ij->i', taps, table[phase])
+    return out
+
+def float_to_pcm(pcm, fmt):
+    """
+    fmt: 0 = signed 8-bit, 1 = signed 16-bit little endian, the inverse of dcm.pcm_to_float().
+    """
+    if fmt == 0:
+        return np.clip(np.rint(pcm * 128), -128, 127).astype(np.int8).tobytes()
+    else:
+        return np.clip(np.rint(pcm * 32768), -32768, 32767).astype('<i2').tobytes()
+
+def fit(pcm, nframes):
+    """
+    Trims or zero pads pcm to nframes.
+    """
+    if len(pcm) >= nframes:
+        return pcm[:nframes]
+    return np.pad(pcm, (0, nframes - len(pcm)))
+
+def import_wave(filename, fmt, sample_rate, nframes=None, verbose=False):
+    """
+    Reads a wav file and returns raw sample data in fmt at sample_rate,
+    trimmed or padded to nframes if given.
+    """
+    pcm, src_rate = utils.read_wave(filename)
+    pcm = resample(pcm, src_rate, sample_rate)
+    if verbose:
+        print(f"{filename}: {src_rate} Hz -> {sample_rate} Hz, {len(pcm)} frames", file=sys.stderr)
+
+    if nframes is not None:
+        if verbose and len(pcm) != nframes:
+            print(f"{filename}: {'trimmed' if len(pcm) > nframes else 'padded'} to {nframes} frames", file=sys.stderr)
+        pcm = fit(pcm, nframes)
+
+    return float_to_pcm(pcm, fmt)
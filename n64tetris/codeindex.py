@@ -0,0 +1,169 @@
+"""
+Bulk decoding of the code loaded at boot, to find patch sites without Ghidra.
+
+The words of the segment are decoded once into numpy arrays of their fields
+(opcode, rs, rt, rd, sa, funct, imm, target), so a query is a few vectorized
+comparisons over all of them.  Mnemonics are those of n64tetris.mips;
+anything else (floating point, 64-bit) can still be matched by its fields.
+
+Addresses are usually built by a lui and a later addiu/ori, or a load/store
+using the lui's register as base.  pairs() finds them within PAIR_WINDOW
+instructions of the lui, until its register is overwritten or the code after
+an unconditional jump is reached.
+"""
+
+import numpy as np
+
+from . import mips
+
+# rom range of the code and data copied to ram at boot (1 MB from the boot address)
+CODE_SEGMENT = (0x1000, 0x101000)
+
+PAIR_WINDOW = 16
+
+# opcodes that add a signed immediate to rs: addiu and the loads/stores
+# (including the cop1 and 64-bit ones), and ori which or's it in
+ADDIU_OPCODES = [0x09] + list(range(0x20, 0x28)) + [0x28, 0x29, 0x2A, 0x2B, 0x2E, 0x31, 0x35, 0x37, 0x39, 0x3D, 0x3F]
+ORI_OPCODE = 0x0D
+# opcodes whose rt is a destination: the immediate alu ops, lui and the loads
+RT_DEST_OPCODES = list(range(0x08, 0x10)) + list(range(0x20, 0x28)) + [0x37]
+# SPECIAL functs without a destination: jr, mthi, mtlo, mult(u), div(u)
+NO_DEST_FUNCTS = [0x08, 0x11, 0x13, 0x18, 0x19, 0x1A, 0x1B]
+
+REGISTERS = {name: i for i, name in enumerate(mips.REG_NAMES)}
+
+def register(x):
+    """
+    A register by name ($a0, a0) or number.
+    """
+    x = x.lstrip('$')
+    if x in REGISTERS:
+        return REGISTERS[x]
+    if x.isdigit() and int(x) < 32:
+        return int(x)
+    raise ValueError(f"Unknown register: {x}")
+
+class CodeIndex:
+    def __init__(self, rom, start=CODE_SEGMENT[0], end=CODE_SEGMENT[1]):
+        """
+        [start, end): word-aligned rom addresses to decode.
+        """
+        self.rom = rom
+        self.start = start
+        self.end = min(end, len(rom.data)) & ~3
+        self.base = rom.virt(start)
+
+        self.words = np.frombuffer(rom.data, dtype='>u4', count=(self.end - start) // 4, offset=start).astype(np.uint32)
+        w = self.words
+        self.op = (w >> 26).astype(np.uint8)
+        self.rs = ((w >> 21) & 31).astype(np.uint8)
+        self.rt = ((w >> 16) & 31).astype(np.uint8)
+        self.rd = ((w >> 11) & 31).astype(np.uint8)
+        self.sa = ((w >> 6) & 31).astype(np.uint8)
+        self.funct = (w & 0x3F).astype(np.uint8)
+        self.imm = (w & 0xFFFF).astype(np.uint16)
+        self.target = w & 0x3FFFFFF
+        self._pairs = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def rom_addrs(self, rows):
+        return self.start + 4 * np.asarray(rows, dtype=np.int64)
+
+    def vaddrs(self, rows):
+        return self.base + 4 * np.asarray(rows, dtype=np.int64)
+
+    def rows(self, rom_addrs):
+        return (np.asarray(rom_addrs, dtype=np.int64) - self.start) // 4
+
+    def mnemonic_mask(self, name):
+        if name == 'nop':
+            return self.words == 0
+        for table, op, field in ((mips.SPECIAL, 0x00, self.funct), (mips.REGIMM, 0x01, self.rt), (mips.COP0, 0x10, self.rs)):
+            codes = [code for code, n in table.items() if n == name]
+            if codes:
+                return (self.op == op) & (field == codes[0])
+        codes = [op for op, n in mips.OPCODES.items() if n == name]
+        if codes:
+            return self.op == codes[0]
+        raise ValueError(f"Unknown mnemonic: {name}")
+
+    def find(self, name=None, rs=None, rt=None, rd=None, sa=None, imm=None, target=None):
+        """
+        Rows of the instructions matching a mnemonic and/or fields.  imm is
+        compared as 16 bits (so -1 matches 0xFFFF); target is a jump's vaddr.
+        """
+        mask = np.ones(len(self.words), dtype=bool) if name is None else self.mnemonic_mask(name)
+        for field, value in ((self.rs, rs), (self.rt, rt), (self.rd, rd), (self.sa, sa)):
+            if value is not None:
+                mask &= field == value
+        if imm is not None:
+            mask &= self.imm == (imm & 0xFFFF)
+        if target is not None:
+            mask &= self.target == ((target >> 2) & 0x3FFFFFF)
+        return np.flatnonzero(mask)
+
+    def dests(self):
+        """
+        Destination register of each instruction (0 if none).
+        """
+        dest = np.zeros(len(self.words), dtype=np.uint8)
+        special = (self.op == 0) & ~np.isin(self.funct, NO_DEST_FUNCTS)
+        dest[special] = self.rd[special]
+        rt_dest = np.isin(self.op, RT_DEST_OPCODES) | (np.isin(self.op, [0x10, 0x11, 0x12]) & np.isin(self.rs, [0, 1, 2]))
+        dest[rt_dest] = self.rt[rt_dest]
+        dest[self.op == 0x03] = mips.RA
+        return dest
+
+    def pairs(self):
+        """
+        (lui rows, rows of the instructions completing them, 32-bit values formed),
+        sorted by lui row.
+        """
+        if self._pairs is not None:
+            return self._pairs
+
+        n = len(self.words)
+        luis = np.flatnonzero((self.op == 0x0F) & (self.rt != 0))
+        regs = self.rt[luis]
+        his = self.imm[luis].astype(np.uint32) << 16
+        dests = self.dests()
+        adds = np.isin(self.op, ADDIU_OPCODES)
+        ors = self.op == ORI_OPCODE
+        # the instruction after the delay slot of j/jr is not reached from above
+        jumps = (self.op == 0x02) | ((self.op == 0) & (self.funct == 0x08))
+        simm = self.imm.astype(np.int16).astype(np.int64)
+
+        alive = np.ones(len(luis), dtype=bool)
+        hi_rows, lo_rows, values = [], [], []
+        for k in range(1, PAIR_WINDOW + 1):
+            rows = luis + k
+            alive &= rows < n
+            rows = np.minimum(rows, n - 1)
+            uses = alive & (self.rs[rows] == regs)
+            for kind, value in ((adds, (his + simm[rows]) & 0xFFFFFFFF), (ors, his | self.imm[rows])):
+                hits = uses & kind[rows]
+                hi_rows.append(luis[hits])
+                lo_rows.append(rows[hits])
+                values.append(value[hits].astype(np.uint32))
+            alive &= (dests[rows] != regs) & ~jumps[rows - 1]
+
+        hi_rows = np.concatenate(hi_rows)
+        order = np.argsort(hi_rows, kind='stable')
+        self._pairs = (hi_rows[order], np.concatenate(lo_rows)[order], np.concatenate(values)[order])
+        return self._pairs
+
+    def find_pairs(self, value_start, value_end=None):
+        """
+        (lui rows, completing rows, values) of the pairs forming a value in
+        [value_start, value_end) (just value_start by default).
+        """
+        if value_end is None:
+            value_end = value_start + 1
+        hi_rows, lo_rows, values = self.pairs()
+        mask = (values >= value_start) & (values < value_end)
+        return hi_rows[mask], lo_rows[mask], values[mask]
+
+    def disassemble(self, row):
+        return mips.disassemble(int(self.words[row]), int(self.vaddrs(row)))
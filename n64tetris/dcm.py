@@ -0,0 +1,135 @@
+"""
+DCM1 module layout (little endian):
+    0x00  'DCM1'
+    0x04  num_channels      u8
+    0x05  num_samples       u8
+    0x0E  sample headers    16 bytes each, see SAMPLE_HEADER
+
+smp_id is taken to be an index into the game's SAMPLE mapping in rom order;
+this is a guess, so the sample it maps to must have the header's smplen.
+
+The pattern data that follows the sample headers is not decoded yet, so
+render() is driven by an explicit list of note events.  preview_events()
+builds one that plays each of a module's samples in turn.
+"""
+
+import struct
+import numpy as np
+
+HEADER = struct.Struct('<4s2B')
+SAMPLE_HEADERS_OFFSET = 14
+
+SAMPLE_HEADER = np.dtype([
+    ('smplen', '<u4'),
+    ('loopBegin', '<u4'),
+    ('loopEnd', '<u4'),
+    ('flags', '<u2'),
+    ('smp_id', '<u2'),
+])
+
+class Dcm1Module:
+    def __init__(self, raw):
+        magic, self.num_channels, self.num_samples = HEADER.unpack_from(raw, 0)
+        if magic != b'DCM1':
+            raise ValueError(f"Not a DCM1 module: {bytes(magic)}")
+
+        end = SAMPLE_HEADERS_OFFSET + self.num_samples * SAMPLE_HEADER.itemsize
+        if end > len(raw):
+            raise ValueError(f"Truncated DCM1 sample headers ({len(raw)} < {end} bytes)")
+
+        self.raw = raw
+        self.samples = np.frombuffer(raw, dtype=SAMPLE_HEADER, count=self.num_samples, offset=SAMPLE_HEADERS_OFFSET)
+
+    def sample_addrs(self, sample_map):
+        """
+        Rom address of each sample header's sample, or None if smp_id is out of range.
+        """
+        s_addrs = sorted(sample_map)
+        return [s_addrs[smp_id] if smp_id < len(s_addrs) else None for smp_id in self.samples['smp_id'].tolist()]
+
+RENDER_RATE = 32000
+BLOCK_SIZE = 4096
+
+def pcm_to_float(raw, fmt):
+    """
+    fmt: 0 = signed 8-bit, 1 = signed 16-bit (little endian, as written to wav files)
+    """
+    if fmt == 0:
+        return np.frombuffer(raw, dtype=np.int8).astype(np.float32) / 128
+    else:
+        return np.frombuffer(raw, dtype='<i2', count=len(raw) // 2).astype(np.float32) / 32768
+
+def float_to_s16(pcm):
+    return (np.clip(pcm, -1, 1) * 32767).astype('<i2').tobytes()
+
+def preview_events(voices, sample_rate=RENDER_RATE, seconds=1.0):
+    """
+    One event per voice, back to back, each lasting up to seconds (looped
+    voices always last seconds).
+    """
+    events = []
+    start = 0
+    for v, (pcm, s_rate, loop) in enumerate(voices):
+        duration = int(seconds * sample_rate)
+        if loop is None:
+            duration = min(duration, int(len(pcm) * sample_rate / s_rate))
+        events.append((start, duration, v, s_rate, 1.0))
+        start += duration
+    return events
+
+def voice_positions(t, step, nframes, loop):
+    """
+    Read positions into a voice for output frames t (relative to note on), as
+    the two frames to interpolate between and the fraction of the way from
+    the first to the second.  In a loop, the frame after loop_end - 1 is
+    loop_begin.  Returns i0, i1, frac and a mask of the positions that are
+    still sounding (all of them for a looped voice).
+    """
+    pos = t * step
+    if loop is None:
+        i0 = np.minimum(pos.astype(np.int64), nframes - 2)
+        return i0, i0 + 1, pos - i0, pos < nframes - 1
+    loop_begin, loop_end = loop
+    looped = pos >= loop_begin
+    pos[looped] = loop_begin + np.fmod(pos[looped] - loop_begin, loop_end - loop_begin)
+    i0 = pos.astype(np.int64)
+    i1 = np.where(i0 + 1 >= loop_end, loop_begin, i0 + 1)
+    return i0, i1, pos - i0, np.ones(len(pos), dtype=bool)
+
+def render(events, voices, sample_rate=RENDER_RATE, block_size=BLOCK_SIZE):
+    """
+    Mixes note events into a mono float32 buffer, block by block.
+    events: (start, duration, voice, rate, volume), start and duration in output frames,
+            rate is the voice's playback rate in Hz.
+    voices: (pcm, sample_rate, loop), pcm as float32.
+    Each event is resampled with linear interpolation; looping is folded into
+    the read positions so every block of an event is a handful of array ops.
+    """
+    events = sorted(events)
+    total = max((start + duration for start, duration, _, _, _ in events), default=0)
+    out = np.zeros(total, dtype=np.float32)
+
+    first = 0
+    for block_start in range(0, total, block_size):
+        block_end = min(block_start + block_size, total)
+        while first < len(events) and events[first][0] + events[first][1] <= block_start:
+            first += 1
+
+        for start, duration, v, rate, volume in events[first:]:
+            if start >= block_end:
+                break
+            lo = max(start, block_start)
+            hi = min(start + duration, block_end)
+            if hi <= lo:
+                continue
+
+            pcm, _, loop = voices[v]
+            if len(pcm) < 2:
+                continue
+            t = np.arange(lo - start, hi - start, dtype=np.float64)
+            i0, i1, frac, sounding = voice_positions(t, rate / sample_rate, len(pcm), loop)
+            mixed = pcm[i0] + (pcm[i1] - pcm[i0]) * frac.astype(np.float32)
+            mixed[~sounding] = 0
+            out[lo:hi] += volume * mixed
+
+    return out
@@ -0,0 +1,131 @@
+"""
+64-bit fingerprints of PCM samples, and an index of them across roms.
+
+A sample is stretched to a fixed length before it is fingerprinted, so a copy
+resampled to another rate (or stored at another width) gets the same or a
+nearby fingerprint.  Each bit is the sign of an energy difference between
+neighbouring bands in neighbouring frames (as in Haitsma & Kalker's audio
+hashing), so fingerprints are compared by hamming distance.
+"""
+
+import hashlib
+import numpy as np
+
+FRAMES = 9
+FRAME_SIZE = 1024
+BANDS = 9
+
+RECORD = np.dtype([
+    ('game', 'U8'),
+    ('addr', '<u4'),
+    ('format', 'u1'),
+    ('sample_rate', '<u4'),
+    ('nframes', '<u4'),
+    ('digest', 'S20'),
+    ('fp', '<u8'),
+])
+
+POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# octave bands over the rfft bins of a frame, skipping dc; the last band runs to nyquist
+BAND_STARTS = 2 ** np.arange(BANDS)
+
+def fingerprint(pcm):
+    """
+    pcm: float samples.  Returns the fingerprint as an int.
+    """
+    n = FRAMES * FRAME_SIZE
+    pcm = np.asarray(pcm, dtype=np.float64)
+    if len(pcm) < 2:
+        return 0
+    pcm = pcm - pcm.mean()
+    stretched = np.interp(np.linspace(0, len(pcm) - 1, n), np.arange(len(pcm)), pcm)
+
+    frames = stretched.reshape(FRAMES, FRAME_SIZE) * np.hanning(FRAME_SIZE)
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    energy = np.add.reduceat(power, BAND_STARTS, axis=1)
+
+    d = energy[:, :-1] - energy[:, 1:]
+    bits = (d[1:] - d[:-1]) > 0
+    return int.from_bytes(np.packbits(bits).tobytes(), byteorder='big')
+
+def distance(fps, fp):
+    """
+    Hamming distance from fp to each of fps.
+    """
+    x = np.bitwise_xor(np.asarray(fps, dtype=np.uint64), np.uint64(fp))
+    return POPCOUNT8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+def make_record(game, addr, fmt, sample_rate, pcm, raw):
+    return (game, addr, fmt, sample_rate, len(pcm), hashlib.sha1(bytes(raw)).digest(), fingerprint(pcm))
+
+class SampleIndex:
+    def __init__(self, records=()):
+        self.records = np.array(list(records), dtype=RECORD)
+        self.by_fp = {}
+        self.by_digest = {}
+        for i, (fp, digest) in enumerate(zip(self.records['fp'].tolist(), self.records['digest'].tolist())):
+            self.by_fp.setdefault(fp, []).append(i)
+            self.by_digest.setdefault(digest, []).append(i)
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['records'].tolist())
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            np.savez(f, records=self.records)
+
+    def find(self, game, addr):
+        i = np.flatnonzero((self.records['game'] == game) & (self.records['addr'] == addr))
+        return int(i[0]) if len(i) else None
+
+    def query(self, fp, max_distance=0, digest=None):
+        """
+        Returns [(row, distance)] of matching samples, closest first.
+        Identical fingerprints (and raw data, if digest is given) are dict lookups;
+        near matches are a single vectorized hamming distance over the index.
+        """
+        if max_distance == 0:
+            rows = set(self.by_fp.get(fp, []))
+            if digest is not None:
+                rows.update(self.by_digest.get(digest, []))
+            return [(i, 0) for i in sorted(rows)]
+
+        d = distance(self.records['fp'], fp)
+        rows = np.flatnonzero(d <= max_distance)
+        rows = rows[np.argsort(d[rows], kind='stable')]
+        return [(int(i), int(d[i])) for i in rows]
+
+    def groups(self, max_distance=0):
+        """
+        Groups of two or more samples that are identical or within max_distance
+        of each other (transitively).
+        """
+        n = len(self.records)
+        parent = list(range(n))
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for rows in list(self.by_digest.values()) + list(self.by_fp.values()):
+            for i in rows[1:]:
+                parent[root(i)] = root(rows[0])
+
+        if max_distance > 0:
+            fps = self.records['fp']
+            for i in range(n):
+                for j in np.flatnonzero(distance(fps[i + 1:], fps[i]) <= max_distance).tolist():
+                    parent[root(i + 1 + j)] = root(i)
+
+        groups = {}
+        for i in range(n):
+            groups.setdefault(root(i), []).append(i)
+        return [rows for rows in groups.values() if len(rows) > 1]
@@ -0,0 +1,70 @@
+import bisect
+
+class FreeSpaceMap:
+    """
+    Sorted list of free [start, end) regions of a rom, with best-fit allocation.
+    Adjacent and overlapping regions are coalesced when freed.
+    """
+    def __init__(self, align=2):
+        self.align = align
+        self.starts = []
+        self.ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends))
+
+    def total(self):
+        return sum(end - start for start, end in self)
+
+    def largest(self):
+        return max((end - start for start, end in self), default=0)
+
+    def free(self, start, end):
+        if end <= start:
+            return
+
+        i = bisect.bisect_left(self.starts, start)
+        # coalesce with the previous region
+        if i > 0 and self.ends[i-1] >= start:
+            i -= 1
+            start = self.starts[i]
+            end = max(end, self.ends[i])
+            del self.starts[i], self.ends[i]
+        # coalesce with following regions
+        while i < len(self.starts) and self.starts[i] <= end:
+            end = max(end, self.ends[i])
+            del self.starts[i], self.ends[i]
+
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+    def reserve(self, start, end):
+        i = bisect.bisect_right(self.starts, start) - 1
+        if i < 0 or self.ends[i] < end:
+            raise ValueError(f"Region 0x{start:06X}-0x{end:06X} is not free")
+
+        r_start, r_end = self.starts[i], self.ends[i]
+        del self.starts[i], self.ends[i]
+        self.free(r_start, start)
+        self.free(end, r_end)
+
+    def alloc(self, size):
+        """
+        Returns the address of the smallest free region that fits size bytes, or None.
+        """
+        best = None
+        best_slack = None
+        for start, end in self:
+            addr = (start + self.align - 1) & ~(self.align - 1)
+            slack = end - (addr + size)
+            if slack >= 0 and (best_slack is None or slack < best_slack):
+                best, best_slack = addr, slack
+                if slack == 0:
+                    break
+
+        if best is not None:
+            self.reserve(best, best + size)
+        return best
@@ -0,0 +1,148 @@
+"""
+A small linker for the code and static data injected into a rom.
+
+Each unit is an emitter (a method writing with asm()/insert_bytes()) plus the
+names of the units it references.  Only units reachable from the requested
+roots are emitted.  Code units are placed one after another at the rom's
+next_sub_addr cursor, dependencies first (otherwise in registration order), so
+any code symbol a unit references (e.g. display_text for jal_display_text) is
+already resolved when it is emitted.  Data units are pinned at fixed addresses
+and are resolved up front.  Patch units rewrite existing game code and take no
+space in the window.
+
+A code unit may emit several functions; define() names the ones inside it, so
+code_symbols() maps every linked function to its name.
+"""
+
+import sys
+
+class Unit:
+    def __init__(self, name, kind, emit, deps=(), addr=None, size=0):
+        self.name = name
+        self.kind = kind  # 'code', 'data' or 'patch'
+        self.emit = emit
+        self.deps = tuple(deps)
+        self.addr = addr
+        self.size = size
+
+class Linker:
+    def __init__(self, rom, start, end):
+        """
+        [start, end): rom addresses of the window shared by code and pinned data.
+        """
+        self.rom = rom
+        self.start = start
+        self.end = end
+        self.units = {}
+        self.symbols = {}
+        self.defined = []
+        self.layout = []
+
+    def add_code(self, name, emit, deps=()):
+        self.units[name] = Unit(name, 'code', emit, deps)
+
+    def add_data(self, name, addr, size, emit, deps=()):
+        self.units[name] = Unit(name, 'data', emit, deps, addr, size)
+
+    def add_patch(self, name, emit, deps=()):
+        self.units[name] = Unit(name, 'patch', emit, deps)
+
+    def define(self, name, addr):
+        """
+        Names addr, inside the code unit being emitted.
+        """
+        self.symbols[name] = addr
+        self.defined.append(name)
+
+    def code_symbols(self):
+        """
+        {rom address: name} of the linked code units and of the names defined in
+        them (which win over their unit's name).
+        """
+        symbols = {self.symbols[name]: name for name, unit in self.units.items() if unit.kind == 'code' and name in self.symbols}
+        symbols.update((self.symbols[name], name) for name in self.defined)
+        return symbols
+
+    def reachable(self, roots):
+        seen = set()
+        stack = list(roots)
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            if name not in self.units:
+                raise ValueError(f"Undefined symbol: {name}")
+            seen.add(name)
+            stack.extend(self.units[name].deps)
+        return seen
+
+    def order(self, names):
+        """
+        names in registration order, each preceded by its dependencies.
+        """
+        ordered = []
+        state = {}
+
+        def visit(name):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Circular reference: {name}")
+            state[name] = 'visiting'
+            for dep in self.units[name].deps:
+                visit(dep)
+            state[name] = 'done'
+            ordered.append(name)
+
+        for name in self.units:
+            if name in names:
+                visit(name)
+        return ordered
+
+    def link(self, roots):
+        names = self.reachable(roots)
+        for name in names:
+            unit = self.units[name]
+            if unit.kind == 'data':
+                self.symbols[name] = unit.addr
+
+        self.rom.next_sub_addr = self.start
+        for name in self.order(names):
+            unit = self.units[name]
+            if unit.kind == 'code':
+                addr = self.rom.next_sub_addr
+                self.symbols[name] = addr
+                unit.emit()
+                self.layout.append((addr, self.rom.next_sub_addr, unit.kind, name))
+            else:
+                unit.emit()
+                if unit.kind == 'data':
+                    self.layout.append((unit.addr, unit.addr + unit.size, unit.kind, name))
+        self.layout.sort()
+
+        code_end = self.code_end()
+        data_start = self.data_start()
+        if code_end > data_start:
+            print(f"link error: code (0x{self.start:06X}-0x{code_end:06X}) overruns static data at 0x{data_start:06X}", file=sys.stderr)
+            sys.exit(1)
+
+    def code_end(self):
+        return max((end for _, end, kind, _ in self.layout if kind == 'code'), default=self.start)
+
+    def data_start(self):
+        return min((start for start, _, kind, _ in self.layout if kind == 'data'), default=self.end)
+
+    def free_bytes(self):
+        """
+        Bytes of the window not taken by emitted units.
+        """
+        return (self.end - self.start) - sum(end - start for start, end, _, _ in self.layout)
+
+    def print_layout(self):
+        virt = self.rom.virt
+        for start, end, kind, name in self.layout:
+            print(f"0x{start:06X}-0x{end:06X}\t{virt(start):08X}\t{end - start}\t{kind}\t{name}", file=sys.stderr)
+        unused = sorted(set(self.units) - {name for _, _, _, name in self.layout} - {name for name, unit in self.units.items() if unit.kind == 'patch'})
+        if unused:
+            print(f"not linked: {', '.join(unused)}", file=sys.stderr)
+        print(f"free: {self.data_start() - self.code_end()} contiguous bytes at {virt(self.code_end()):08X}, {self.free_bytes()} of {self.end - self.start} bytes in total", file=sys.stderr)
@@ -0,0 +1,459 @@
+"""
+A small interpreter for the subset of the R4300 instruction set used by the
+routines injected into the roms, to count their instructions and cycles
+without an emulator.
+
+Registers hold 32-bit values (the injected code has no 64-bit instructions),
+and add/addi/sub do not trap on overflow.  Calls into the game are not
+executed: each game function used is a stub, a python function that sees the
+cpu state and returns the value for $v0.
+
+Cycles follow the VR4300 pipeline: one per instruction, plus the multiply and
+divide latencies, plus an interlock when a load's result is used by the next
+instruction.  Cache misses and RDRAM contention are not modelled, so the counts
+are a lower bound.
+
+The count register (cop0 $9) follows the cycles, at half the cpu clock.  The
+rcp's registers read as 0 (idle) and ignore writes.
+"""
+
+import re
+
+CPU_HZ = 93750000
+RAM_SIZE = 0x800000
+RCP_REGISTERS = (0x04000000, 0x05000000)
+MASK = 0xFFFFFFFF
+
+# $ra of the outermost call; returning to it ends the run
+RETURN_ADDR = 0x80000000
+
+REG_NAMES = [
+    'zero', 'at', 'v0', 'v1', 'a0', 'a1', 'a2', 'a3',
+    't0', 't1', 't2', 't3', 't4', 't5', 't6', 't7',
+    's0', 's1', 's2', 's3', 's4', 's5', 's6', 's7',
+    't8', 't9', 'k0', 'k1', 'gp', 'sp', 'fp', 'ra',
+]
+SP = 29
+RA = 31
+
+CYCLES = {'mult': 5, 'multu': 5, 'div': 37, 'divu': 37}
+LOAD_USE_CYCLES = 1
+
+SPECIAL = {
+    0x00: 'sll', 0x02: 'srl', 0x03: 'sra', 0x04: 'sllv', 0x06: 'srlv', 0x07: 'srav',
+    0x08: 'jr', 0x09: 'jalr', 0x10: 'mfhi', 0x11: 'mthi', 0x12: 'mflo', 0x13: 'mtlo',
+    0x18: 'mult', 0x19: 'multu', 0x1A: 'div', 0x1B: 'divu',
+    0x20: 'add', 0x21: 'addu', 0x22: 'sub', 0x23: 'subu',
+    0x24: 'and', 0x25: 'or', 0x26: 'xor', 0x27: 'nor', 0x2A: 'slt', 0x2B: 'sltu',
+}
+REGIMM = {0x00: 'bltz', 0x01: 'bgez'}
+COP0 = {0x00: 'mfc0', 0x04: 'mtc0'}
+COUNT = 9
+OPCODES = {
+    0x02: 'j', 0x03: 'jal', 0x04: 'beq', 0x05: 'bne', 0x06: 'blez', 0x07: 'bgtz',
+    0x08: 'addi', 0x09: 'addiu', 0x0A: 'slti', 0x0B: 'sltiu',
+    0x0C: 'andi', 0x0D: 'ori', 0x0E: 'xori', 0x0F: 'lui',
+    0x20: 'lb', 0x21: 'lh', 0x23: 'lw', 0x24: 'lbu', 0x25: 'lhu',
+    0x28: 'sb', 0x29: 'sh', 0x2B: 'sw',
+}
+LOADS = {'lb': (1, True), 'lh': (2, True), 'lw': (4, False), 'lbu': (1, False), 'lhu': (2, False)}
+STORES = {'sb': 1, 'sh': 2, 'sw': 4}
+
+class MipsError(Exception):
+    pass
+
+def s32(x):
+    return x - 0x100000000 if x & 0x80000000 else x
+
+def s16(x):
+    return x - 0x10000 if x & 0x8000 else x
+
+def decode(word):
+    """
+    Returns (mnemonic, rs, rt, rd, sa, imm, target, sources, dest).
+    """
+    op = word >> 26
+    rs = (word >> 21) & 31
+    rt = (word >> 16) & 31
+    rd = (word >> 11) & 31
+    sa = (word >> 6) & 31
+    imm = word & 0xFFFF
+    target = word & 0x3FFFFFF
+
+    if op == 0:
+        name = SPECIAL.get(word & 0x3F)
+    elif op == 1:
+        name = REGIMM.get(rt)
+    elif op == 0x10:
+        name = COP0.get(rs)
+    else:
+        name = OPCODES.get(op)
+    if name is None:
+        raise MipsError(f"Unsupported instruction: {word:08X}")
+
+    if op == 0:
+        if name in ('sll', 'srl', 'sra'):
+            sources, dest = (rt,), rd
+        elif name in ('mfhi', 'mflo'):
+            sources, dest = (), rd
+        elif name in ('jr', 'mthi', 'mtlo'):
+            sources, dest = (rs,), 0
+        elif name == 'jalr':
+            sources, dest = (rs,), rd
+        elif name in CYCLES:
+            sources, dest = (rs, rt), 0
+        else:
+            sources, dest = (rs, rt), rd
+    elif name in ('j', 'jal'):
+        sources, dest = (), RA if name == 'jal' else 0
+    elif name in ('beq', 'bne') or name in STORES:
+        sources, dest = (rs, rt), 0
+    elif name in ('blez', 'bgtz', 'bltz', 'bgez'):
+        sources, dest = (rs,), 0
+    elif name in ('lui', 'mfc0'):
+        sources, dest = (), rt
+    elif name == 'mtc0':
+        sources, dest = (rt,), 0
+    else:
+        sources, dest = (rs,), rt
+
+    return name, rs, rt, rd, sa, imm, target, tuple(r for r in sources if r), dest
+
+class Memory:
+    """
+    RDRAM, seen through kseg0 and kseg1, and the rcp's registers.
+    """
+    def __init__(self, size=RAM_SIZE):
+        self.ram = bytearray(size)
+
+    def offset(self, vaddr, n):
+        offset = vaddr & 0x1FFFFFFF
+        if offset + n > len(self.ram):
+            raise MipsError(f"Bad address: {vaddr:08X}")
+        return offset
+
+    def load(self, vaddr, raw):
+        offset = self.offset(vaddr, len(raw))
+        self.ram[offset : offset + len(raw)] = raw
+
+    def read_bytes(self, vaddr, n):
+        offset = self.offset(vaddr, n)
+        return bytes(self.ram[offset : offset + n])
+
+    def read(self, vaddr, n, signed=False):
+        if vaddr & (n - 1):
+            raise MipsError(f"Unaligned {n}-byte read: {vaddr:08X}")
+        if RCP_REGISTERS[0] <= vaddr & 0x1FFFFFFF < RCP_REGISTERS[1]:
+            return 0
+        return int.from_bytes(self.read_bytes(vaddr, n), byteorder='big', signed=signed)
+
+    def write(self, vaddr, n, value):
+        if vaddr & (n - 1):
+            raise MipsError(f"Unaligned {n}-byte write: {vaddr:08X}")
+        if RCP_REGISTERS[0] <= vaddr & 0x1FFFFFFF < RCP_REGISTERS[1]:
+            return
+        offset = self.offset(vaddr, n)
+        self.ram[offset : offset + n] = (value & ((1 << (8 * n)) - 1)).to_bytes(n, byteorder='big')
+
+    def read_string(self, vaddr, limit=0x1000):
+        offset = self.offset(vaddr, 1)
+        end = self.ram.find(b'\x00', offset, offset + limit)
+        if end < 0:
+            raise MipsError(f"Unterminated string: {vaddr:08X}")
+        return bytes(self.ram[offset : end])
+
+class Cpu:
+    """
+    stubs: {vaddr: (name, func)}, func(cpu) returns $v0 (or None).
+    stub_cycles: {name: cycles} charged per call of a stub (default 0).
+    code_range: [start, end) of the vaddrs that may be executed; calls
+                elsewhere must be stubbed.
+    """
+    def __init__(self, memory, stubs=None, stub_cycles=None, code_range=None):
+        self.mem = memory
+        self.stubs = dict(stubs or {})
+        self.stub_cycles = dict(stub_cycles or {})
+        self.code_range = code_range
+        self.regs = [0] * 32
+        self.hi = 0
+        self.lo = 0
+        self.cop0 = [0] * 32
+        self.decoded = {}
+
+        self.instructions = 0
+        self.cycles = 0
+        self.stub_calls = {}
+        # entry vaddr: [calls, instructions, cycles], including callees
+        self.calls = {}
+        self.frames = []
+
+    def fetch(self, pc):
+        d = self.decoded.get(pc)
+        if d is None:
+            if self.code_range is not None and not (self.code_range[0] <= pc < self.code_range[1]):
+                raise MipsError(f"Call to unstubbed function: {pc:08X}")
+            d = self.decoded[pc] = decode(self.mem.read(pc, 4))
+        return d
+
+    def enter(self, entry, ret):
+        self.frames.append((entry, ret, self.instructions, self.cycles))
+
+    def leave(self):
+        entry, _, instructions, cycles = self.frames.pop()
+        totals = self.calls.setdefault(entry, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += self.instructions - instructions
+        totals[2] += self.cycles - cycles
+
+    def call(self, entry, args=(), sp=None, limit=1000000):
+        """
+        Runs the function at entry until it returns; returns $v0.
+        """
+        for i, value in enumerate(args):
+            self.regs[4 + i] = value & MASK
+        if sp is not None:
+            self.regs[SP] = sp & MASK
+        self.regs[RA] = RETURN_ADDR
+
+        self.enter(entry, RETURN_ADDR)
+        pc, npc = entry, entry + 4
+        load_dest = 0
+        start = self.instructions
+        while True:
+            while self.frames and pc == self.frames[-1][1]:
+                self.leave()
+            if pc == RETURN_ADDR:
+                break
+
+            if self.instructions - start >= limit:
+                raise MipsError(f"No return after {limit} instructions (pc {pc:08X})")
+
+            if pc in self.stubs:
+                name, func = self.stubs[pc]
+                self.stub_calls[name] = self.stub_calls.get(name, 0) + 1
+                self.cycles += self.stub_cycles.get(name, 0)
+                value = func(self)
+                if value is not None:
+                    self.regs[2] = value & MASK
+                ret = self.regs[RA]
+                self.frames.pop()
+                pc, npc = ret, ret + 4
+                load_dest = 0
+                continue
+
+            name, rs, rt, rd, sa, imm, target, sources, dest = self.fetch(pc)
+            self.instructions += 1
+            self.cycles += CYCLES.get(name, 1)
+            if load_dest and load_dest in sources:
+                self.cycles += LOAD_USE_CYCLES
+            load_dest = dest if name in LOADS else 0
+
+            jump = self.execute(pc, name, rs, rt, rd, sa, imm, target)
+            if jump is not None and name in ('jal', 'jalr'):
+                # the frame is left when execution reaches the return address
+                self.enter(jump, pc + 8)
+            pc, npc = npc, (jump if jump is not None else npc + 4)
+
+        return self.regs[2]
+
+    def execute(self, pc, name, rs, rt, rd, sa, imm, target):
+        """
+        Executes one instruction; returns the jump target of a taken branch or jump.
+        """
+        r = self.regs
+        a = r[rs]
+        b = r[rt]
+        value = None
+        jump = None
+
+        if name in LOADS:
+            n, signed = LOADS[name]
+            r[rt] = self.mem.read((a + s16(imm)) & MASK, n, signed) & MASK
+        elif name in STORES:
+            self.mem.write((a + s16(imm)) & MASK, STORES[name], b)
+        elif name in ('addiu', 'addi'):
+            r[rt] = (a + s16(imm)) & MASK
+        elif name in ('addu', 'add'):
+            value = a + b
+        elif name in ('subu', 'sub'):
+            value = a - b
+        elif name == 'or':
+            value = a | b
+        elif name == 'and':
+            value = a & b
+        elif name == 'xor':
+            value = a ^ b
+        elif name == 'nor':
+            value = ~(a | b)
+        elif name == 'slt':
+            value = int(s32(a) < s32(b))
+        elif name == 'sltu':
+            value = int(a < b)
+        elif name == 'sll':
+            value = b << sa
+        elif name == 'srl':
+            value = b >> sa
+        elif name == 'sra':
+            value = s32(b) >> sa
+        elif name == 'sllv':
+            value = b << (a & 31)
+        elif name == 'srlv':
+            value = b >> (a & 31)
+        elif name == 'srav':
+            value = s32(b) >> (a & 31)
+        elif name == 'ori':
+            r[rt] = a | imm
+        elif name == 'andi':
+            r[rt] = a & imm
+        elif name == 'xori':
+            r[rt] = a ^ imm
+        elif name == 'lui':
+            r[rt] = imm << 16
+        elif name == 'slti':
+            r[rt] = int(s32(a) < s16(imm))
+        elif name == 'sltiu':
+            r[rt] = int(a < (s16(imm) & MASK))
+        elif name == 'mfhi':
+            value = self.hi
+        elif name == 'mflo':
+            value = self.lo
+        elif name == 'mfc0':
+            r[rt] = (self.cycles // 2) & MASK if rd == COUNT else self.cop0[rd]
+        elif name == 'mtc0':
+            self.cop0[rd] = b
+        elif name == 'mthi':
+            self.hi = a
+        elif name == 'mtlo':
+            self.lo = a
+        elif name in ('mult', 'multu'):
+            product = s32(a) * s32(b) if name == 'mult' else a * b
+            self.hi = (product >> 32) & MASK
+            self.lo = product & MASK
+        elif name in ('div', 'divu'):
+            # the quotient and remainder of a division by zero are undefined
+            if b:
+                if name == 'div':
+                    q = abs(s32(a)) // abs(s32(b)) * (1 if (s32(a) < 0) == (s32(b) < 0) else -1)
+                    self.lo = q & MASK
+                    self.hi = (s32(a) - q * s32(b)) & MASK
+                else:
+                    self.lo = a // b
+                    self.hi = a % b
+        elif name in ('j', 'jal'):
+            jump = (pc & 0xF0000000) | (target << 2)
+            if name == 'jal':
+                r[RA] = pc + 8
+        elif name in ('jr', 'jalr'):
+            jump = a
+            if name == 'jalr':
+                value = pc + 8
+        else:
+            offset = pc + 4 + (s16(imm) << 2)
+            if name == 'beq':
+                taken = a == b
+            elif name == 'bne':
+                taken = a != b
+            elif name == 'blez':
+                taken = s32(a) <= 0
+            elif name == 'bgtz':
+                taken = s32(a) > 0
+            elif name == 'bltz':
+                taken = s32(a) < 0
+            else:
+                taken = s32(a) >= 0
+            if taken:
+                jump = offset & MASK
+
+        if value is not None and rd:
+            r[rd] = value & MASK
+        r[0] = 0
+        return jump
+
+    def arg(self, i):
+        """
+        i-th 32-bit argument of a call (o32: $a0-$a3, then the stack from $sp + 0x10).
+        """
+        if i < 4:
+            return self.regs[4 + i]
+        return self.mem.read(self.regs[SP] + 4 * i, 4)
+
+CONVERSION = re.compile(rb'%([-+ 0#]*)(\d*)(?:\.(\d+))?([diuxXcs%])')
+
+def sprintf_stub(cpu):
+    """
+    sprintf(buf, fmt, ...) for the %d/%i/%u/%x/%X/%c/%s conversions.
+    """
+    fmt = cpu.mem.read_string(cpu.arg(1))
+    args = iter(range(2, 64))
+    out = []
+    pos = 0
+    for m in CONVERSION.finditer(fmt):
+        out.append(fmt[pos : m.start()])
+        pos = m.end()
+        flags, width, precision, conv = [g.decode() if g is not None else '' for g in m.groups()]
+        if conv == '%':
+            out.append(b'%')
+            continue
+        value = cpu.arg(next(args))
+        spec = '%' + flags + width + ('.' + precision if precision else '')
+        if conv in 'di':
+            text = (spec + 'd') % s32(value)
+        elif conv == 'u':
+            text = (spec + 'd') % value
+        elif conv == 'c':
+            text = (spec + 'c') % chr(value & 0xFF)
+        elif conv == 's':
+            text = (spec + 's') % cpu.mem.read_string(value).decode('latin-1')
+        else:
+            text = (spec + conv) % value
+        out.append(text.encode('latin-1'))
+    out.append(fmt[pos:])
+
+    raw = b''.join(out)
+    cpu.mem.load(cpu.arg(0), raw + b'\x00')
+    return len(raw)
+
+def disassemble(word, pc):
+    """
+    One instruction as text, e.g. "addiu $a0, $zero, 0x14" (".word" if unsupported).
+    """
+    try:
+        name, rs, rt, rd, sa, imm, target, _, _ = decode(word)
+    except MipsError:
+        return f".word   0x{word:08X}"
+    if word == 0:
+        return "nop"
+    rs, rt, rd = (f"${REG_NAMES[r]}" for r in (rs, rt, rd))
+    branch = f"0x{(pc + 4 + (s16(imm) << 2)) & MASK:08X}"
+
+    if name in ('sll', 'srl', 'sra'):
+        operands = f"{rd}, {rt}, {sa}"
+    elif name in ('sllv', 'srlv', 'srav'):
+        operands = f"{rd}, {rt}, {rs}"
+    elif name in ('jr', 'mthi', 'mtlo'):
+        operands = rs
+    elif name == 'jalr':
+        operands = rs if rd == '$ra' else f"{rd}, {rs}"
+    elif name in ('mfhi', 'mflo'):
+        operands = rd
+    elif name in CYCLES:
+        operands = f"{rs}, {rt}"
+    elif name in SPECIAL.values():
+        operands = f"{rd}, {rs}, {rt}"
+    elif name in ('j', 'jal'):
+        operands = f"0x{(pc & 0xF0000000) | (target << 2):08X}"
+    elif name in ('beq', 'bne'):
+        operands = f"{rs}, {rt}, {branch}"
+    elif name in ('blez', 'bgtz', 'bltz', 'bgez'):
+        operands = f"{rs}, {branch}"
+    elif name == 'lui':
+        operands = f"{rt}, 0x{imm:04X}"
+    elif name in ('mfc0', 'mtc0'):
+        operands = f"{rt}, ${(word >> 11) & 31}"
+    elif name in LOADS or name in STORES:
+        operands = f"{rt}, {s16(imm):#x}({rs})"
+    elif name in ('andi', 'ori', 'xori'):
+        operands = f"{rt}, {rs}, 0x{imm:X}"
+    else:
+        operands = f"{rt}, {rs}, {s16(imm):#x}"
+    return f"{name:<7} {operands}"
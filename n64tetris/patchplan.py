@@ -0,0 +1,123 @@
+import bisect
+import json
+
+class PatchPlan:
+    """
+    Disjoint [start, end) byte patches of a rom, each with the name of the
+    option (owner) that wrote it, kept sorted by start so an overlap check is a
+    bisect plus a walk over the overlapping records.
+    Contiguous patches of the same owner are merged.
+    base_sha1: hash of the rom the patches were made against (None if unknown).
+    """
+    def __init__(self, base_sha1=None):
+        self.base_sha1 = base_sha1
+        self.starts = []
+        self.ends = []
+        self.raws = []
+        self.owners = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.raws, self.owners))
+
+    def total(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def overlapping(self, start, end):
+        """
+        Indices of the records overlapping [start, end).
+        """
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        hits = []
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.ends[i] > start:
+                hits.append(i)
+            i += 1
+        return hits
+
+    def add(self, start, raw, owner, amend=False):
+        """
+        Records raw at start.  Overwriting bytes of another owner with different
+        values is a conflict (ValueError) unless amend is set: amending patches
+        are meant to rewrite another patch, e.g. filling space reserved by it.
+        """
+        raw = bytes(raw)
+        end = start + len(raw)
+        if end <= start:
+            return
+
+        hits = self.overlapping(start, end)
+        if not amend:
+            for i in hits:
+                if self.owners[i] == owner:
+                    continue
+                lo = max(start, self.starts[i])
+                hi = min(end, self.ends[i])
+                if raw[lo - start : hi - start] != self.raws[i][lo - self.starts[i] : hi - self.starts[i]]:
+                    raise ValueError(f"0x{start:06X}-0x{end:06X} ({owner}) overlaps 0x{self.starts[i]:06X}-0x{self.ends[i]:06X} ({self.owners[i]})")
+
+        # the new bytes win: keep only the parts of overlapped records outside [start, end)
+        remainders = []
+        for i in hits:
+            if self.starts[i] < start:
+                remainders.append((self.starts[i], self.raws[i][: start - self.starts[i]], self.owners[i]))
+            if self.ends[i] > end:
+                remainders.append((end, self.raws[i][end - self.starts[i] :], self.owners[i]))
+        if hits:
+            del self.starts[hits[0] : hits[-1] + 1], self.ends[hits[0] : hits[-1] + 1]
+            del self.raws[hits[0] : hits[-1] + 1], self.owners[hits[0] : hits[-1] + 1]
+
+        for r_start, r_raw, r_owner in remainders + [(start, raw, owner)]:
+            self.insert(r_start, r_raw, r_owner)
+
+    def insert(self, start, raw, owner):
+        i = bisect.bisect_left(self.starts, start)
+        end = start + len(raw)
+
+        # merge with contiguous records of the same owner
+        if i > 0 and self.ends[i-1] == start and self.owners[i-1] == owner:
+            i -= 1
+            start = self.starts[i]
+            raw = self.raws[i] + raw
+            del self.starts[i], self.ends[i], self.raws[i], self.owners[i]
+        if i < len(self.starts) and self.starts[i] == end and self.owners[i] == owner:
+            end = self.ends[i]
+            raw = raw + self.raws[i]
+            del self.starts[i], self.ends[i], self.raws[i], self.owners[i]
+
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.raws.insert(i, raw)
+        self.owners.insert(i, owner)
+
+    def apply(self, data):
+        """
+        Writes every patch into data, in one pass in address order.  A patch
+        past the end of data (a plan made for an expanded rom) is a ValueError,
+        raised before anything is written.
+        """
+        if self.ends and self.ends[-1] > len(data):
+            raise ValueError(f"0x{self.starts[-1]:06X}-0x{self.ends[-1]:06X} ({self.owners[-1]}) is past the end of the rom (0x{len(data):06X})")
+        for start, raw, _ in self:
+            data[start : start + len(raw)] = raw
+
+    def owner_totals(self):
+        totals = {}
+        for start, raw, owner in self:
+            totals[owner] = totals.get(owner, 0) + len(raw)
+        return totals
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'base_sha1': self.base_sha1, 'patches': [[start, raw.hex(), owner] for start, raw, owner in self]}, f, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            saved = json.load(f)
+        plan = cls(saved['base_sha1'])
+        for start, raw, owner in saved['patches']:
+            plan.add(start, bytes.fromhex(raw), owner)
+        return plan
@@ -0,0 +1,112 @@
+"""
+References to an address range, for moving what is in it.
+
+A reference is either an aligned 32-bit word holding an address in the range
+(anywhere in the rom, or in words_range), or an instruction pair of the boot
+segment forming one: a lui and the addiu/ori or load/store completing it (see
+CodeIndex.pairs).  repoint() rewrites them for the new location; for pairs it
+rewrites both immediates, carrying into the lui's half when the low half of
+an addiu or load/store is negative.  A lui also completed by instructions
+that are not references must keep its half.
+"""
+
+import numpy as np
+
+from .codeindex import CodeIndex, ORI_OPCODE
+
+RECORD = np.dtype([
+    ('addr', '<u4'),   # rom address of the word, or of the lui
+    ('lo', '<u4'),     # rom address of the instruction completing the lui (0 for words)
+    ('value', '<u4'),  # address referenced
+    ('kind', 'u1'),
+])
+
+KINDS = ('word', 'lui/addiu', 'lui/ori')
+
+def find_words(data, start, end, words_range=None):
+    """
+    Rom addresses of the aligned big endian words of data in [start, end).
+    """
+    lo, hi = words_range if words_range is not None else (0, len(data))
+    lo = (lo + 3) & ~3
+    hi = min(hi, len(data))
+    words = np.frombuffer(data, dtype='>u4', count=max(hi - lo, 0) // 4, offset=lo)
+    rows = np.flatnonzero((words >= start) & (words < end))
+    return lo + 4 * rows, words[rows]
+
+def in_slots(addrs, slot_ends):
+    """
+    Mask of the addrs inside one of the disjoint [start, end) ranges of
+    slot_ends ({start: end}), e.g. the asset slots of a rom.
+    """
+    starts = np.array(sorted(slot_ends), dtype=np.int64)
+    ends = np.array([slot_ends[start] for start in starts.tolist()], dtype=np.int64)
+    addrs = np.asarray(addrs, dtype=np.int64)
+    i = np.searchsorted(starts, addrs, side='right') - 1
+    return (i >= 0) & (addrs < ends[np.maximum(i, 0)]) if len(starts) else np.zeros(len(addrs), dtype=bool)
+
+def find_references(rom, start, end, words=True, pairs=True, words_range=None, index=None):
+    """
+    RECORD array of the references to [start, end), by rom address.
+    index: a CodeIndex of the rom to reuse (default: a new one of the boot segment).
+    """
+    parts = []
+    if words:
+        addrs, values = find_words(rom.data, start, end, words_range)
+        part = np.zeros(len(addrs), dtype=RECORD)
+        part['addr'] = addrs
+        part['value'] = values
+        parts.append(part)
+    if pairs:
+        if index is None:
+            index = CodeIndex(rom)
+        hi_rows, lo_rows, values = index.find_pairs(start, end)
+        part = np.zeros(len(hi_rows), dtype=RECORD)
+        part['addr'] = index.rom_addrs(hi_rows)
+        part['lo'] = index.rom_addrs(lo_rows)
+        part['value'] = values
+        part['kind'] = np.where(index.op[lo_rows] == ORI_OPCODE, 2, 1)
+        parts.append(part)
+
+    refs = np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD)
+    return refs[np.argsort(refs['addr'], kind='stable')]
+
+def repoint(rom, refs, delta, index=None):
+    """
+    Adds delta to every reference (writing with rom.insert_bytes).  A lui
+    gets one new upper half, so every instruction completing it must agree
+    on it, including those that are not in refs (they keep the lui's current
+    half); otherwise nothing is written and ValueError is raised.
+    index: a CodeIndex of the rom to reuse (default: a new one of the boot segment).
+    """
+    writes = {}
+    his = {}
+    los = {}
+    for addr, lo, value, kind in refs.tolist():
+        new = (value + delta) & 0xFFFFFFFF
+        if KINDS[kind] == 'word':
+            writes[addr] = new.to_bytes(4, byteorder='big')
+            continue
+        hi = new >> 16 if KINDS[kind] == 'lui/ori' else ((new + 0x8000) >> 16) & 0xFFFF
+        if his.setdefault(addr, hi) != hi:
+            raise ValueError(f"lui at 0x{addr:06X} is shared by references needing 0x{his[addr]:04X} and 0x{hi:04X}")
+        los.setdefault(addr, set()).add(lo)
+        writes[addr + 2] = hi.to_bytes(2, byteorder='big')
+        writes[lo + 2] = (new & 0xFFFF).to_bytes(2, byteorder='big')
+
+    if his:
+        if index is None:
+            index = CodeIndex(rom)
+        hi_rows, lo_rows, _ = index.pairs()
+        for addr, hi in his.items():
+            row = int(index.rows(addr))
+            current = int(index.imm[row])
+            if hi == current:
+                continue
+            first, last = np.searchsorted(hi_rows, [row, row + 1])
+            others = set(index.rom_addrs(lo_rows[first:last]).tolist()) - los[addr]
+            if others:
+                raise ValueError(f"lui at 0x{addr:06X} is also used at {', '.join(f'0x{lo:06X}' for lo in sorted(others))}, which needs it to stay 0x{current:04X}")
+
+    for addr, raw in sorted(writes.items()):
+        rom.insert_bytes(addr, raw)
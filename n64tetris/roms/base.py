@@ -1,7 +1,19 @@
+import os
 import sys
+import hashlib
+import functools
 from enum import Enum, auto
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 from .. import utils
+from .. import dcm
+from .. import fingerprint
+from .. import pointers
+from ..dcm import Dcm1Module
+from ..freespace import FreeSpaceMap
+from ..patchplan import PatchPlan
 
 class AssetType(Enum):
     UNKNOWN = auto()
@@ -9,6 +21,33 @@ class AssetType(Enum):
 class AssetFormat(Enum):
     UNKNOWN = auto()
 
+# rom instance of a worker process, see BaseRom.map_parallel()
+worker_rom = None
+
+def init_worker(cls, filename, verbose, force):
+    global worker_rom
+    worker_rom = cls(verbose=verbose, force=force)
+    worker_rom.from_file(filename)
+
+def call_worker(method, args):
+    return getattr(worker_rom, method)(*args)
+
+def patch(method):
+    """
+    Makes the method the owner of the bytes it (and anything it calls) writes
+    with insert_bytes(), see PatchPlan.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.patch_owner is not None:
+            return method(self, *args, **kwargs)
+        self.patch_owner = method.__name__
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.patch_owner = None
+    return wrapper
+
 class BaseRom:
     def __init__(self, game_code=None, verbose=False, force=False):
         self.game_code = game_code
@@ -17,8 +56,16 @@ class BaseRom:
         self.decoders = ()
         self.data = bytearray()
         self.asm_addr = None
+        self.slot_ends = {}
+        self.free_space = None
+        self.sample_map = {}
+        self.dcm_names = {}
+        self.filename = None
+        self.patch_plan = PatchPlan()
+        self.patch_owner = None
 
     def from_file(self, filename):
+        self.filename = filename
         self.data = bytearray(open(filename, 'rb').read())
         game_code = bytes(self.data[59 : 63])
         if self.game_code is not None and (game_code != self.game_code):
@@ -28,6 +75,7 @@ class BaseRom:
                 print(f"rom error: game_code ({game_code}) should be {self.game_code}", file=sys.stderr)
                 sys.exit(1)
         self.boot_address = int.from_bytes(self.data[8 : 12], byteorder='big')
+        self.patch_plan = PatchPlan(hashlib.sha1(self.data).hexdigest())
 
     def virt(self, addr):
         return addr + self.boot_address - 0x1000
@@ -56,25 +104,253 @@ class BaseRom:
 
         return raw, info, asset_type, asset_format, asset_info, None
 
-    def scan(self):
-        print(f"Start\tPrefix\tBuflen\tPayload\tEnd\tType\tFormat\tInfo")
+    def map_parallel(self, method, args_list, jobs=None):
+        """
+        Calls self.method(*args) for each args in a pool of processes, each of
+        which loads its own copy of the source rom.  Edits made to self.data
+        since from_file() are not seen by the workers.
+        """
+        if jobs == 1 or self.filename is None:
+            return [getattr(self, method)(*args) for args in args_list]
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(type(self), self.filename, self.verbose, self.force)) as executor:
+            return list(executor.map(call_worker, repeat(method), args_list))
+
+    def dcm_samples(self, dcm_addr, module):
+        """
+        Yields (index, s_addr, raw, format, sample_rate, loop) for each sample
+        used by a DCM1 module.  loop is a (start, end) frame range or None.
+        A sample whose length (in frames or bytes) is not the header's smplen
+        is reported and skipped, as smp_id did not map to it.
+        """
+        dcm_name = self.dcm_names[dcm_addr]
+
+        for i, (header, s_addr) in enumerate(zip(module.samples, module.sample_addrs(self.sample_map))):
+            if s_addr is None:
+                print(f"{dcm_name}: smp_id {header['smp_id']} is out of range", file=sys.stderr)
+                continue
+
+            s_raw, _, _, _, _, err = self.extract_asset(s_addr)
+            if err is not None:
+                print(err, file=sys.stderr)
+                continue
+
+            fmt, sample_rate = self.sample_map[s_addr]
+            nframes = len(s_raw) >> fmt
+            if int(header['smplen']) not in (nframes, len(s_raw)):
+                print(f"{dcm_name}: sample {i} (smp_id {header['smp_id']}) is {header['smplen']} long, but 0x{s_addr:06X} is {nframes} frames; skipped", file=sys.stderr)
+                continue
+            loop_begin = min(int(header['loopBegin']), nframes)
+            loop_end = min(int(header['loopEnd']), nframes)
+            loop = (loop_begin, loop_end) if loop_end > loop_begin else None
+
+            yield i, s_addr, s_raw, fmt, sample_rate, loop
+
+    def extract_dcm_samples(self, dcm_addr, raw):
+        """
+        Writes each sample used by a DCM1 module as a wav file, with the
+        module's loop points.
+        """
+        dcm_name = self.dcm_names[dcm_addr]
+
+        for i, s_addr, s_raw, fmt, sample_rate, loop in self.dcm_samples(dcm_addr, Dcm1Module(raw)):
+            if fmt == 0:
+                sampwidth = 1
+                frames = (np.frombuffer(s_raw, dtype=np.uint8) + 128).tobytes()
+            else:
+                sampwidth = 2
+                frames = bytes(s_raw)
+
+            utils.write_wave(f"{dcm_name}-{i:02d}-{s_addr:06X}.wav", frames, sampwidth, sample_rate, loop)
+
+    def preview_dcm_samples(self, dcm_addr, raw, sample_rate=dcm.RENDER_RATE):
+        """
+        Renders each sample used by a DCM1 module in turn to
+        {dcm_name}-samples.wav.  This is not the song: its pattern data is
+        not decoded.
+        """
+        dcm_name = self.dcm_names[dcm_addr]
+        module = Dcm1Module(raw)
+
+        voices = []
+        for _, _, s_raw, fmt, s_rate, loop in self.dcm_samples(dcm_addr, module):
+            voices.append((dcm.pcm_to_float(s_raw, fmt), s_rate, loop))
+
+        pcm = dcm.render(dcm.preview_events(voices, sample_rate), voices, sample_rate)
+        utils.write_wave(f"{dcm_name}-samples.wav", dcm.float_to_s16(pcm), 2, sample_rate)
+
+    def sample_records(self, game, addrs):
+        """
+        Decodes each sample and returns its fingerprint.SampleIndex records.
+        """
+        records = []
+        for addr in addrs:
+            raw, _, _, _, _, err = self.extract_asset(addr)
+            if err is not None:
+                print(err, file=sys.stderr)
+                continue
+            fmt, sample_rate = self.sample_map[addr]
+            records.append(fingerprint.make_record(game, addr, fmt, sample_rate, dcm.pcm_to_float(raw, fmt), raw))
+        return records
+
+    def sample_index_records(self, game, jobs=None):
+        addrs = sorted(self.sample_map)
+        n = max(1, min(len(addrs), jobs or os.cpu_count() or 1))
+        chunks = [(game, addrs[i::n]) for i in range(n)]
+        records = [record for chunk in self.map_parallel('sample_records', chunks, jobs) for record in chunk]
+        return sorted(records, key=lambda record: record[1])
+
+    def iter_assets(self):
         addr = 0
         while addr < len(self.data):
             _, info, asset_type, asset_format, asset_info, err = self.extract_asset(addr)
             if err is None:
-                print(f"0x{addr:06X}\t{info['prefix'].decode()}\t{info['buflen']}\t{info['payload_size']}\t0x{info['end']:06X}\t{asset_type.name}\t{asset_format.name}\t{asset_info}")
+                yield addr, info, asset_type, asset_format, asset_info
                 addr = info['end']
             else:
                 addr += 1
 
+    def scan(self):
+        print(f"Start\tPrefix\tBuflen\tPayload\tEnd\tType\tFormat\tInfo")
+        for addr, info, asset_type, asset_format, asset_info in self.iter_assets():
+            print(f"0x{addr:06X}\t{info['prefix'].decode()}\t{info['buflen']}\t{info['payload_size']}\t0x{info['end']:06X}\t{asset_type.name}\t{asset_format.name}\t{asset_info}")
+
+    def build_free_space_map(self, extents=None):
+        """
+        Free regions are the filler bytes between known assets (by default, the
+        slots in self.slot_ends) and the padding at the end of the rom.
+        extents may also come from scan results, ie, (addr, info['end']) pairs.
+        """
+        if extents is None:
+            extents = self.slot_ends.items()
+        extents = sorted(extents)
+
+        data = np.frombuffer(self.data, dtype=np.uint8)
+        self.free_space = FreeSpaceMap()
+
+        for (_, end), (next_start, _) in zip(extents, extents[1:]):
+            gap = data[end : next_start]
+            if gap.size and (gap == gap[0]).all() and gap[0] in (0x00, 0xFF):
+                self.free_space.free(end, next_start)
+
+        last_end = max((end for _, end in extents), default=len(data))
+        nonpad = np.flatnonzero(data[last_end:] != data[-1])
+        pad_start = last_end + (int(nonpad[-1]) + 1 if nonpad.size else 0)
+        self.free_space.free(pad_start, len(data))
+
+        if self.verbose:
+            print(f"Free space: {self.free_space.total()} bytes in {len(self.free_space)} regions (largest: {self.free_space.largest()})", file=sys.stderr)
+
+    def expand(self, size, fill=0xFF):
+        """
+        Grow the rom to size bytes and add the new region to the free space map.
+        """
+        old_size = len(self.data)
+        if size <= old_size:
+            return
+
+        if size > 0x4000000:
+            print(f"expand warning: rom size (0x{size:X}) is larger than 64 MB", file=sys.stderr)
+
+        if self.free_space is None:
+            self.build_free_space_map()
+
+        self.data.extend(bytes([fill]) * (size - old_size))
+        self.free_space.free(old_size, size)
+
+        if self.verbose:
+            print(f"Expanded rom from 0x{old_size:06X} to 0x{size:06X} bytes", file=sys.stderr)
+
+    def relocate_asset(self, addr, blob):
+        """
+        Move an asset that has outgrown its slot into the free space map.
+        Every reference to the old rom offset (word-aligned 32-bit words, and
+        lui pairs in the boot segment, see pointers.find_references) is
+        repointed, and the old slot is returned to the pool.  Words inside
+        asset slots are compressed or sample data that happens to match, so
+        they are reported and left alone.
+        """
+        refs = pointers.find_references(self, addr, addr + 1)
+        in_assets = (refs['kind'] == 0) & pointers.in_slots(refs['addr'], self.slot_ends)
+        for ref in refs['addr'][in_assets].tolist():
+            print(f"relocate warning: 0x{ref:06X} holds 0x{addr:06X} but is inside an asset, not repointed", file=sys.stderr)
+        refs = refs[~in_assets]
+        if not len(refs):
+            print(f"relocate error: No references to 0x{addr:06X} found", file=sys.stderr)
+            return None
+
+        new_addr = self.free_space.alloc(len(blob))
+        if new_addr is None:
+            print(f"relocate error: No free region of {len(blob)} bytes (largest: {self.free_space.largest()})", file=sys.stderr)
+            return None
+
+        try:
+            pointers.repoint(self, refs, new_addr - addr)
+        except ValueError as e:
+            print(f"relocate error: {e}", file=sys.stderr)
+            self.free_space.free(new_addr, new_addr + len(blob))
+            return None
+        self.insert_bytes(new_addr, blob)
+
+        self.free_space.free(addr, self.slot_ends.pop(addr))
+        self.slot_ends[new_addr] = new_addr + len(blob)
+
+        if self.verbose:
+            refs_str = ', '.join(f"0x{ref:06X}" if kind == 0 else f"0x{ref:06X}/0x{lo:06X}" for ref, lo, _, kind in refs.tolist())
+            print(f"Relocated 0x{addr:06X} to 0x{new_addr:06X} ({len(blob)} bytes), repointed: {refs_str}", file=sys.stderr)
+
+        return new_addr
+
     def word_align(self, addr):
         return (addr + 3) & ~3
 
-    def insert_bytes(self, addr, raw):
+    def insert_bytes(self, addr, raw, amend=False):
+        """
+        Writes raw at addr and records it in the patch plan.  Overwriting
+        another option's bytes is an error (a warning with --force) unless
+        amend is set.
+        """
+        try:
+            self.patch_plan.add(addr, raw, self.patch_owner or 'unknown', amend)
+        except ValueError as e:
+            if self.force:
+                print(f"patch warning: {e}", file=sys.stderr)
+                self.patch_plan.add(addr, raw, self.patch_owner or 'unknown', True)
+            else:
+                print(f"patch error: {e}", file=sys.stderr)
+                sys.exit(1)
+
         end = addr + len(raw)
         self.data[addr : end] = raw
         return end
 
+    def apply_patch_plan(self, plan):
+        """
+        Applies a saved plan in one sorted pass, and adopts it as this rom's plan.
+        The plan must have been made against this rom, before any patches.
+        """
+        if plan.base_sha1 is not None and plan.base_sha1 != self.patch_plan.base_sha1:
+            if self.force:
+                print(f"plan warning: made for a rom with sha1 {plan.base_sha1}, not {self.patch_plan.base_sha1}", file=sys.stderr)
+            else:
+                print(f"plan error: made for a rom with sha1 {plan.base_sha1}, not {self.patch_plan.base_sha1}", file=sys.stderr)
+                sys.exit(1)
+        try:
+            plan.apply(self.data)
+        except ValueError as e:
+            print(f"plan error: {e}", file=sys.stderr)
+            sys.exit(1)
+        plan.base_sha1 = self.patch_plan.base_sha1
+        self.patch_plan = plan
+        if self.verbose:
+            print(f"Applied {len(plan)} patches ({plan.total()} bytes)", file=sys.stderr)
+
+    def print_patch_plan(self):
+        for start, raw, owner in self.patch_plan:
+            print(f"0x{start:06X}-0x{start + len(raw):06X}\t{len(raw)}\t{owner}", file=sys.stderr)
+        for owner, total in self.patch_plan.owner_totals().items():
+            print(f"{owner}: {total} bytes", file=sys.stderr)
+
     def asm(self, bytes_or_hexstring):
         if self.asm_addr is None:
             print("asm error: asm_addr is None", file=sys.stderr)
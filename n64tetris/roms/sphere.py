@@ -6,8 +6,10 @@ import numpy as np
 
 #from PIL import Image
 
-from .base import BaseRom
+from .base import BaseRom, patch
 from .. import utils
+from .. import audio
+from ..dcm import Dcm1Module
 from ..mappings import sphere as spheremap
 
 class AssetType(Enum):
@@ -26,39 +28,66 @@ class AssetFormat(Enum):
     PCM_S16 = auto()
     DCM1 = auto()
 
+def lz_ring():
+    ring = bytearray(0x1000)
+    for i in range(0, 0x100):
+        ring[i] = i
+    for i in range(0x100, 0x200):
+        ring[i] = 0x1FF - i
+    for i in range(0, 0x100):
+        for j in range(0, 4):
+            ring[0x200 + (4 * i) + j] = i
+    for i in range(0x600, 0x1000):
+        ring[i] = i & 0xFF
+    return bytes(ring)
+
+# initial contents of the decompressLZ ring
+LZ_RING = lz_ring()
+
 class TetrisphereRom(BaseRom):
     def __init__(self, verbose=False, force=False):
         super().__init__(game_code=b'NTPE', verbose=verbose, force=force)
         self.decoders = (self.sqsh_decode, self.dcm1_decode, self.sample_decode)
+        self.slot_ends = dict(spheremap.END)
+        self.sample_map = spheremap.SAMPLE
+        self.dcm_names = spheremap.DCM_NAME
 
     def sqsh_decompress(self, addr, compressed_size, expected_size):
-        raw = b''
+        src = memoryview(self.data)[addr:]
+        raw = bytearray()
         p = 0
         while p < compressed_size:
-            c = self.data[addr+p]
+            c = src[p]
             p += 1
             if c & 0x80:
                 c &= 0x7f
                 c += 1
                 c <<= 1
-                b = int.from_bytes(self.data[addr+p : addr+p + 2], byteorder='big')
+                b = int.from_bytes(src[p : p + 2], byteorder='big')
                 b <<= 1
-                for i in range(0, c, 2):
-                    raw += raw[b+i : b+i + 2]
                 p += 2
+                # copies run in 2-byte steps, so an overlapping source repeats with period len(raw) - b
+                period = len(raw) - b
+                if period >= c:
+                    raw += raw[b : b + c]
+                elif period > 0:
+                    while c > 0:
+                        n = min(c, len(raw) - b)
+                        raw += raw[b : b + n]
+                        c -= n
             else:
                 c += 1
                 c <<= 1
-                raw += self.data[addr+p : addr+p + c]
+                raw += src[p : p + c]
                 p += c
 
         raw_size = len(raw)
         assert (raw_size == expected_size or
                 raw_size == expected_size + 1)
         if raw_size == expected_size + 1:
-            return raw[:-1]
+            return bytes(raw[:-1])
         else:
-            return raw
+            return bytes(raw)
 
     def sqsh_decode(self, addr):
         prefix = self.data[addr : addr + 4]
@@ -97,41 +126,39 @@ class TetrisphereRom(BaseRom):
         return raw, info, None
 
     def decompressLZ(self, addr, compressed_size):
-        ring = [0] * 0x1000
-        for i in range(0, 0x100):
-            ring[i] = i
-        for i in range(0x100, 0x200):
-            ring[i] = 0x1FF - i
-        for i in range(0, 0x100):
-            for j in range(0, 4):
-                ring[0x200 + (4 * i) + j] = i
-        for i in range(0x600, 0x1000):
-            ring[i] = i & 0xFF
-
-        raw = b''
-        r = 0
+        """
+        The 4 KB ring is unrolled into a linear buffer that starts with the
+        ring's initial contents: ring position r always sits 0x1000 bytes after
+        the last byte that was written to it, so a backreference to ring
+        position b is a copy from distance ((r - b) & 0xFFF) or 0x1000.
+        """
+        src = memoryview(self.data)[addr:]
+        buf = bytearray(LZ_RING)
         p = 0
         while p < compressed_size:
-            c = self.data[addr+p]
+            c = src[p]
             p += 1
             l = c >> 4
             if l:
                 b = (c & 0xF) << 8
-                b |= self.data[addr+p]
+                b |= src[p]
                 p += 1
-                for i in range(0, l+2):
-                    ring[r] = ring[(b+i) & 0xFFF]
-                    raw += bytes([ring[r]])
-                    r = (r+1) & 0xFFF
+                l += 2
+                w = len(buf)
+                s = w - (((w - b) & 0xFFF) or 0x1000)
+                if w - s >= l:
+                    buf += buf[s : s + l]
+                else:
+                    while l > 0:
+                        n = min(l, w - s)
+                        buf += buf[s : s + n]
+                        l -= n
             else:
-                c += 1;
-                raw += self.data[addr+p : addr+p + c]
-                for i in range(0, c):
-                    ring[r] = self.data[addr+p]
-                    p += 1
-                    r = (r+1) & 0xFFF
+                c += 1
+                buf += src[p : p + c]
+                p += c
 
-        return raw
+        return bytes(buf[0x1000:])
 
     def sample_decode(self, addr):
         if addr not in spheremap.SAMPLE:
@@ -153,12 +180,9 @@ class TetrisphereRom(BaseRom):
 
             _raw = self.decompressLZ(addr+1 + c + 4, payload_size)
 
-            raw = b''
-            old = _raw[0]
-            raw += bytes([old])
-            for i in range(1, len(_raw)):
-                old -= _raw[i]
-                raw += bytes([old & 0xFF])
+            # raw[i] = raw[i-1] - _raw[i], ie, raw[i] = 2 * _raw[0] - (_raw[0] + ... + _raw[i])
+            deltas = np.frombuffer(_raw, dtype=np.uint8)
+            raw = (np.uint8((2 * int(deltas[0])) & 0xFF) - np.cumsum(deltas, dtype=np.uint8)).tobytes()
 
             buflen = len(raw)
 
@@ -277,7 +301,7 @@ class TetrisphereRom(BaseRom):
         for s_addr, params in spheremap.SAMPLE.items():
             self.extract_sample(s_addr, as_wave)
 
-    def extract_dcm(self, dcm_addr):
+    def extract_dcm(self, dcm_addr, with_samples=False, preview_samples=False):
         raw, _, asset_type, asset_format, asset_info, err = self.extract_asset(dcm_addr)
         if err is not None:
             print(err, file=sys.stderr)
@@ -290,11 +314,14 @@ class TetrisphereRom(BaseRom):
         if asset_format == AssetFormat.DCM1:
             open(f"{dcm_addr:06X}.bin", 'wb').write(raw)
             if self.verbose:
+                module = Dcm1Module(raw)
                 print("dcm_name, dcm_addr, num_channels, num_samples, smp_id, flags, smplen, loopBegin, loopEnd")
-                num_channels, num_samples = struct.unpack('2B', raw[4:6])
-                for i in range(num_samples):
-                    smplen, loopBegin, loopEnd, flags, smp_id = struct.unpack('<3I2H', raw[14 + i * 16 : 30 + i * 16])
-                    print(f"{spheremap.DCM_NAME[dcm_addr]}, 0x{dcm_addr:06X}, {num_channels}, {num_samples}, {smp_id}, {flags:04b}, {smplen}, {loopBegin}, {loopEnd}")
+                for smplen, loopBegin, loopEnd, flags, smp_id in module.samples.tolist():
+                    print(f"{spheremap.DCM_NAME[dcm_addr]}, 0x{dcm_addr:06X}, {module.num_channels}, {module.num_samples}, {smp_id}, {flags:04b}, {smplen}, {loopBegin}, {loopEnd}")
+            if with_samples:
+                self.extract_dcm_samples(dcm_addr, raw)
+            if preview_samples:
+                self.preview_dcm_samples(dcm_addr, raw)
 
         elif asset_format == AssetFormat.UNKNOWN:
             print(f"Unknown dcm format at address: 0x{dcm_addr:06X}", file=sys.stderr)
@@ -303,6 +330,274 @@ class TetrisphereRom(BaseRom):
             print(f"Unimplemented dcm format at address: 0x{dcm_addr:06X}", file=sys.stderr)
             sys.exit(1)
 
-    def extract_all_dcms(self):
-        for dcm_name, dcm_addr in spheremap.DCM_BY_NAME.items():
-            self.extract_dcm(dcm_addr)
+    def extract_all_dcms(self, with_samples=False, preview_samples=False, jobs=None):
+        self.map_parallel('extract_dcm', [(dcm_addr, with_samples, preview_samples) for dcm_addr in spheremap.DCM_BY_NAME.values()], jobs)
+
+    def sqsh_compress(self, raw):
+        """
+        Inverse of sqsh_decompress.  Works on 2-byte words: a literal is
+        1 to 128 words, a copy is 1 to 128 words from an absolute word offset
+        below 0x10000.  Matches are found through hash chains keyed on pairs of
+        words, with one step of lazy matching.
+        """
+        if len(raw) & 1:
+            raw = bytes(raw) + b'\x00'
+        raw = bytes(raw)
+
+        words = np.frombuffer(raw, dtype='>u2')
+        n = len(words)
+        w = words.tolist()
+        keys = ((words[:-1].astype(np.uint32) << 16) | words[1:]).tolist()
+        head = {}
+        chain = [-1] * min(n, 0x10000)
+        max_chain = 32
+
+        def find_match(i):
+            best_len, best_pos = 0, 0
+            if i >= n - 1:
+                return best_len, best_pos
+            max_len = min(0x80, n - i)
+            cand = head.get(keys[i], -1)
+            depth = max_chain
+            while cand >= 0 and depth:
+                if raw[2*cand : 2*(cand + max_len)] == raw[2*i : 2*(i + max_len)]:
+                    return max_len, cand
+                l = 2
+                while l < max_len and w[cand + l] == w[i + l]:
+                    l += 1
+                if l > best_len:
+                    best_len, best_pos = l, cand
+                cand = chain[cand]
+                depth -= 1
+            return best_len, best_pos
+
+        inserted = 0
+        def insert_until(end):
+            nonlocal inserted
+            end = min(end, n - 1, 0x10000)
+            while inserted < end:
+                k = keys[inserted]
+                chain[inserted] = head.get(k, -1)
+                head[k] = inserted
+                inserted += 1
+
+        out = bytearray()
+        lit_start = 0
+        def flush_literals(end):
+            for start in range(lit_start, end, 0x80):
+                count = min(0x80, end - start)
+                out.append(count - 1)
+                out.extend(raw[2*start : 2*(start + count)])
+
+        i = 0
+        match_len, match_pos = find_match(i)
+        while i < n:
+            insert_until(i + 1)
+            if match_len >= 2 and match_len < 0x80:
+                next_len, next_pos = find_match(i + 1)
+                if next_len > match_len:
+                    i += 1
+                    match_len, match_pos = next_len, next_pos
+                    continue
+
+            if match_len >= 2:
+                flush_literals(i)
+                out.append(0x80 | (match_len - 1))
+                out.extend(match_pos.to_bytes(2, byteorder='big'))
+                i += match_len
+                lit_start = i
+                insert_until(i)
+            else:
+                i += 1
+                insert_until(i)
+            match_len, match_pos = find_match(i)
+
+        flush_literals(n)
+        return bytes(out)
+
+    def compressLZ(self, raw):
+        """
+        Inverse of decompressLZ.  Matches are searched in the same linear
+        buffer the decoder builds, so they may start in the ring's initial
+        contents or overlap the bytes being written.  A hash chain is kept
+        for every 3-byte prefix, with one step of lazy matching.
+        Copies are 3 to 17 bytes from within 0x1000 bytes, literals 1 to 16 bytes.
+        """
+        buf = LZ_RING + bytes(raw)
+        n = len(buf)
+        arr = np.frombuffer(buf, dtype=np.uint8).astype(np.uint32)
+        keys = ((arr[:-2] << 16) | (arr[1:-1] << 8) | arr[2:]).tolist()
+        head = {}
+        chain = [-1] * n
+        max_chain = 32
+
+        def find_match(i):
+            best_len, best_pos = 0, 0
+            max_len = min(17, n - i)
+            if max_len < 3:
+                return best_len, best_pos
+            cand = head.get(keys[i], -1)
+            depth = max_chain
+            while cand >= i - 0x1000 and depth:
+                l = 3
+                while l < max_len and buf[cand + l] == buf[i + l]:
+                    l += 1
+                if l > best_len:
+                    best_len, best_pos = l, cand
+                    if l == max_len:
+                        break
+                cand = chain[cand]
+                depth -= 1
+            return best_len, best_pos
+
+        inserted = 0
+        def insert_until(end):
+            nonlocal inserted
+            end = min(end, n - 2)
+            while inserted < end:
+                k = keys[inserted]
+                chain[inserted] = head.get(k, -1)
+                head[k] = inserted
+                inserted += 1
+
+        out = bytearray()
+        lit_start = 0x1000
+        def flush_literals(end):
+            for start in range(lit_start, end, 16):
+                count = min(16, end - start)
+                out.append(count - 1)
+                out.extend(buf[start : start + count])
+
+        i = 0x1000
+        insert_until(i)
+        match_len, match_pos = find_match(i)
+        while i < n:
+            insert_until(i + 1)
+            if match_len >= 3 and match_len < 17:
+                next_len, next_pos = find_match(i + 1)
+                if next_len > match_len:
+                    i += 1
+                    match_len, match_pos = next_len, next_pos
+                    continue
+
+            if match_len >= 3:
+                flush_literals(i)
+                b = match_pos & 0xFFF
+                out.append(((match_len - 2) << 4) | (b >> 8))
+                out.append(b & 0xFF)
+                i += match_len
+                lit_start = i
+                insert_until(i)
+            else:
+                i += 1
+                insert_until(i)
+            match_len, match_pos = find_match(i)
+
+        flush_literals(n)
+        return bytes(out)
+
+    def delta_encode(self, raw):
+        """
+        Inverse of the SD delta pass: _raw[i] = raw[i-1] - raw[i].
+        """
+        arr = np.frombuffer(bytes(raw), dtype=np.uint8)
+        deltas = np.empty_like(arr)
+        deltas[:1] = arr[:1]
+        deltas[1:] = arr[:-1] - arr[1:]
+        return deltas.tobytes()
+
+    def insert_asset(self, addr, raw, info):
+        buflen = len(raw)
+        slot_end = self.slot_ends.setdefault(addr, info['end'])
+
+        if info['prefix'] == b'SQSH':
+            payload = self.sqsh_compress(raw)
+            if len(payload) >= buflen:
+                # stored: sqsh_decode treats payload_size == buflen as uncompressed
+                payload = bytes(raw)
+            blob = info['prefix'] + struct.pack('>2I', buflen, len(payload)) + payload
+        elif addr in spheremap.SAMPLE:
+            if info['prefix'] == b'SD':
+                payload = self.compressLZ(self.delta_encode(raw))
+            else:
+                payload = bytes(raw)
+            blob = bytes([len(info['prefix'])]) + info['prefix'] + struct.pack('>I', len(payload)) + payload
+        else:
+            print(f"Unimplemented asset prefix at address: 0x{addr:06X}", file=sys.stderr)
+            sys.exit(1)
+
+        payload_size = len(payload)
+        if addr + len(blob) > slot_end:
+            if self.free_space is not None:
+                self.relocate_asset(addr, blob)
+                return
+            print(f"Payload size ({payload_size}) is too large", file=sys.stderr)
+        else:
+            if self.verbose:
+                print(f"Payload size: {payload_size}", file=sys.stderr)
+            self.insert_bytes(addr, blob)
+
+    @patch
+    def insert_image(self, filename, i_addr):
+        from PIL import Image
+
+        with Image.open(filename) as im:
+            rgba_im = im.convert(mode='RGBA')
+
+        _, info, asset_type, asset_format, asset_info, err = self.extract_asset(i_addr)
+        if err is not None:
+            print(err, file=sys.stderr)
+            sys.exit(1)
+
+        if asset_type != AssetType.IMAGE:
+            print(f"No image found at address: 0x{i_addr:06X}", file=sys.stderr)
+            sys.exit(1)
+
+        im = rgba_im.resize((asset_info['width'], asset_info['height']))
+
+        if asset_format == AssetFormat.RGBA5551:
+            raw = bytearray()
+            raw[:4] = struct.pack('>2H', asset_info['width'], asset_info['height'])
+            raw[4:8] = b'\x00\x00\x00\x00'
+            raw[8:] = utils.rgba8888_to_rgba5551(im.tobytes())
+
+            self.insert_asset(i_addr, raw, info)
+
+        elif asset_format == AssetFormat.UNKNOWN:
+            print(f"Unknown image format at address: 0x{i_addr:06X}", file=sys.stderr)
+            sys.exit(1)
+        else:
+            print(f"Unimplemented image format at address: 0x{i_addr:06X}", file=sys.stderr)
+            sys.exit(1)
+
+    @patch
+    def insert_sample(self, filename, s_addr, as_wave, fit=True):
+        """
+        A wav file may be any integer PCM format and rate: it is mixed to mono,
+        resampled to the sample's rate, converted to its format and, if fit,
+        trimmed or padded to the original sample's length.
+        """
+        orig, info, asset_type, asset_format, asset_info, err = self.extract_asset(s_addr)
+        if err is not None:
+            print(err, file=sys.stderr)
+            sys.exit(1)
+
+        if asset_type != AssetType.SAMPLE:
+            print(f"No sample found at address: 0x{s_addr:06X}", file=sys.stderr)
+            sys.exit(1)
+
+        if asset_format in (AssetFormat.PCM_S8, AssetFormat.PCM_S16):
+            fmt = asset_info['format']
+            if as_wave:
+                nframes = (len(orig) >> fmt) if fit else None
+                raw = bytearray(audio.import_wave(filename, fmt, asset_info['sample_rate'], nframes, self.verbose))
+            else:
+                raw = bytearray(open(filename, 'rb').read())
+            self.insert_asset(s_addr, raw, info)
+
+        elif asset_format == AssetFormat.UNKNOWN:
+            print(f"Unknown sample format at address: 0x{s_addr:06X}", file=sys.stderr)
+            sys.exit(1)
+        else:
+            print(f"Unimplemented sample format at address: 0x{s_addr:06X}", file=sys.stderr)
+            sys.exit(1)
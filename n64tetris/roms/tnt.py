@@ -7,9 +7,14 @@ import numpy as np
 #from PIL import Image
 #import lzo
 
-from .base import BaseRom
+from .base import BaseRom, patch
 from .. import utils
+from .. import audio
+from .. import mips
+from ..dcm import Dcm1Module
+from ..linker import Linker
 from ..mappings import tnt as tntmap
+from ..srams.tnt import FRAME_TIMES_SRAM, FRAME_TIMES_MAGIC, FRAME_TIME_BUCKETS, FRAME_TIMES_DTYPE
 
 class AssetType(Enum):
     UNKNOWN = auto()
@@ -29,11 +34,91 @@ class AssetFormat(Enum):
     PCM_S16 = auto()
     DCM1 = auto()
 
+# Frame times are bucketed by (count register delta) >> FRAME_TIME_SHIFT, i.e.
+# 2**15 / 46.875 MHz = 0.699 ms per bucket, the last bucket taking the rest.
+# Every FRAME_TIMES_PERIOD frames the histogram is copied to FRAME_TIMES_SRAM,
+# past the three save banks (its layout, FRAME_TIMES_DTYPE, is in n64tetris.srams.tnt).
+FRAME_TIME_SHIFT = 15
+FRAME_TIMES_PERIOD = 0x200
+
+# Bytes per entry of the overlay_symbols table: a vaddr, then a name padded with nuls
+OVERLAY_SYMBOL_SIZE = 32
+
+# Static data of the experimental features, pinned just below the new start of
+# heap (see move_heap), by name: (rom address, bytes)
+STATIC_DATA = {
+    # reserves space for seed
+    'seed': (0x100FFC, b'\x00' * 4),  # 8013AD7C
+    'fmt_seed': (0x100FF7, b'%08X\x00'),  # 8013AD77
+    'fmt_lookahead': (0x100FF1, b'%c %c\x00'),  # 8013AD71
+    # piece_count uses "%d %d %d" (8013AD68), remaining_pieces uses "%d" (8013AD6E)
+    'fmt_counts': (0x100FDC, b'%d %d %d %d %d %d %d\x00'),  # 8013AD5C
+
+    # x,y - piece_count: 1p p1, 2p p1, 2p p2
+    'xy_piece_count': (0x100FD0, b'\x01\x27\x00\x9B' b'\x00\xA9\x00\xA8' b'\x00\xA9\x00\xF7'),  # 8013AD50
+    # x,y - remaining_pieces: 1p p1 (2p p1 would be 002F00FC, 2p p2 00F000FC)
+    'xy_remaining_pieces': (0x100FC4, b'\x00\x35\x00\x66'),  # 8013AD44
+    # x,y - extra_lookahead: 1p p1, 2p p1, 2p p2
+    'xy_extra_lookahead': (0x100FB8, b'\x00\xD0\x00\x90' b'\x00\xAC\x00\x90' b'\x00\xD2\x00\x90'),  # 8013AD38
+
+    # reserves space for the linked list items, register_*() fills them
+    'item_piece_count': (0x100FA4, b'\x00' * 20),  # 8013AD24
+    'item_remaining_pieces': (0x100F90, b'\x00' * 20),  # 8013AD10
+    'item_extra_lookahead': (0x100F7C, b'\x00' * 20),  # 8013ACFC
+
+    # reserves space for the formatted seed, save_seed() fills it
+    's_seed': (0x100F70, b'\x00' * 12),  # 8013ACF0
+    # remaining_pieces as one text, lines 0x13 apart in the font
+    'fmt_remaining_lines': (0x100F58, b'%d\n%d\n%d\n%d\n%d\n%d\n%d\x00'),  # 8013ACD8
+    'item_frame_times': (0x100F44, b'\x00' * 20),  # 8013ACC4
+    # frame time histogram, mirrored as is into sram (see register_frame_times):
+    # magic, bucket shift, frames, reserved, buckets[FRAME_TIME_BUCKETS]
+    'frame_time_histogram': (0x100E30, FRAME_TIMES_MAGIC + FRAME_TIME_SHIFT.to_bytes(4, byteorder='big') + b'\x00' * (FRAME_TIMES_DTYPE.itemsize - 8)),  # 8013ABB0
+    # reserves space for the names of the linked functions, ended by a zero vaddr;
+    # link_experimental_features() fills it, overlay_symbols() reads it back
+    'overlay_symbols': (0x100B30, b'\x00' * 24 * OVERLAY_SYMBOL_SIZE),  # 8013A8B0
+}
+
+# rom addresses of the code window opened by move_heap
+CODE_WINDOW = (0x0F5A50, 0x101000)  # 8012F7D0 - 8013AD80
+
+# Game functions called by the injected code, stubbed when profiling it
+GAME_FUNCTIONS = {
+    0x800B62D4: 'sprintf',
+    0x80077960: 'display_text',
+    0x8005BBFC: 'open_display',
+    0x8005BE40: 'close_display',
+    0x800713F0: 'FUN_800713F0',
+    0x80071238: 'FUN_80071238',
+    0x80052A00: 'FUN_80052A00',
+    0x80072A84: 'FUN_80072A84',
+    0x80041260: 'FUN_80041260',
+}
+
+# Hooks of the injected routines: (rom address, original jal)
+HOOKS = {
+    'save_seed': (0x0187AC, 0x0C010498),
+    'display_seed': (0x01821C, 0x0C01CAA1),
+    'init_player_stats': (0x01AACC, 0x0C01C4FC),
+    'update_player_stats': (0x037624, 0x0C01C48E),
+    'display_player_stats': (0x01A79C, 0x0C014A80),
+}
+
+# Synthetic ram for profiling: one player_data per player, and the stack
+PROFILE_PLAYER_DATA = 0x80400000
+PROFILE_PLAYER_DATA_SIZE = 0x8000
+PROFILE_STACK = 0x80600000
+NUM_PLAYERS_ADDR = 0x8011EF20
+CUR_PLAYER_ADDR = 0x8011EF21
+
 class TheNewTetrisRom(BaseRom):
     def __init__(self, verbose=False, force=False):
         super().__init__(game_code=b'NRIE', verbose=verbose, force=force)
         self.decoders = (self.h2o_decode,)
-        self.next_sub_addr = 0x0F5A50  # 8012F7D0 (original start of heap)
+        self.next_sub_addr = CODE_WINDOW[0]  # 8012F7D0 (original start of heap)
+        self.slot_ends = dict(tntmap.END)
+        self.sample_map = tntmap.SAMPLE
+        self.dcm_names = tntmap.DCM_NAME
 
     def h2os_decompress(self, addr, buflen):
         import lzo
@@ -306,7 +391,7 @@ class TheNewTetrisRom(BaseRom):
         for s_addr, params in tntmap.SAMPLE.items():
             self.extract_sample(s_addr, as_wave)
 
-    def extract_dcm(self, dcm_addr):
+    def extract_dcm(self, dcm_addr, with_samples=False, preview_samples=False):
         raw, _, asset_type, asset_format, asset_info, err = self.extract_asset(dcm_addr)
         if err is not None:
             print(err, file=sys.stderr)
@@ -319,11 +404,14 @@ class TheNewTetrisRom(BaseRom):
         if asset_format == AssetFormat.DCM1:
             open(f"{dcm_addr:06X}.bin", 'wb').write(raw)
             if self.verbose:
+                module = Dcm1Module(raw)
                 print("dcm_name, dcm_addr, num_channels, num_samples, smp_id, flags, smplen, loopBegin, loopEnd")
-                num_channels, num_samples = struct.unpack('2B', raw[4:6])
-                for i in range(num_samples):
-                    smplen, loopBegin, loopEnd, flags, smp_id = struct.unpack('<3I2H', raw[14 + i * 16 : 30 + i * 16])
-                    print(f"{tntmap.DCM_NAME[dcm_addr]}, 0x{dcm_addr:06X}, {num_channels}, {num_samples}, {smp_id}, {flags:04b}, {smplen}, {loopBegin}, {loopEnd}")
+                for smplen, loopBegin, loopEnd, flags, smp_id in module.samples.tolist():
+                    print(f"{tntmap.DCM_NAME[dcm_addr]}, 0x{dcm_addr:06X}, {module.num_channels}, {module.num_samples}, {smp_id}, {flags:04b}, {smplen}, {loopBegin}, {loopEnd}")
+            if with_samples:
+                self.extract_dcm_samples(dcm_addr, raw)
+            if preview_samples:
+                self.preview_dcm_samples(dcm_addr, raw)
 
         elif asset_format == AssetFormat.UNKNOWN:
             print(f"Unknown dcm format at address: 0x{dcm_addr:06X}", file=sys.stderr)
@@ -332,9 +420,8 @@ class TheNewTetrisRom(BaseRom):
             print(f"Unimplemented dcm format at address: 0x{dcm_addr:06X}", file=sys.stderr)
             sys.exit(1)
 
-    def extract_all_dcms(self):
-        for dcm_name, dcm_addr in tntmap.DCM_BY_NAME.items():
-            self.extract_dcm(dcm_addr)
+    def extract_all_dcms(self, with_samples=False, preview_samples=False, jobs=None):
+        self.map_parallel('extract_dcm', [(dcm_addr, with_samples, preview_samples) for dcm_addr in tntmap.DCM_BY_NAME.values()], jobs)
 
     def h2os_compress(self, raw):
         import lzo
@@ -346,22 +433,54 @@ class TheNewTetrisRom(BaseRom):
 
         if info['prefix'] == b'H2OS':
             raw = self.h2os_compress(bytes(raw))
-            end = addr+8 + len(raw)
-        else:  # info['prefix'] == b'H2ON'
-            end = addr+8 + buflen
-
-        payload_size = end - (addr+8)
-        #if end > info['end']:
-        if end > tntmap.END[addr]:
+        # else: info['prefix'] == b'H2ON', stored uncompressed
+
+        payload_size = len(raw)
+        blob = info['prefix'] + buflen.to_bytes(4, byteorder='big') + bytes(raw)
+        if addr + len(blob) > self.slot_ends[addr]:
+            if self.free_space is not None:
+                self.relocate_asset(addr, blob)
+                return
             print(f"Payload size ({payload_size}) is too large", file=sys.stderr)
         else:
             if self.verbose:
                 print(f"Payload size: {payload_size}", file=sys.stderr)
-            self.data[addr+8 : end] = raw
+            self.insert_bytes(addr, blob)
 
-        self.data[addr : addr + 4] = info['prefix']
-        self.data[addr+4 : addr+4 + 4] = buflen.to_bytes(4, byteorder='big')
+    def screen_assets(self, screen):
+        i_addrs = [i_addr for name, i_addr in tntmap.IMAGE_BY_NAME.items() if name.startswith(f"{screen}_")]
+        p_addrs = [tntmap.PALETTE[i_addr] for i_addr in i_addrs if i_addr in tntmap.PALETTE]
+        return sorted(set(i_addrs + p_addrs))
 
+    @patch
+    def convert_to_h2on(self, addrs):
+        """
+        Store H2OS assets uncompressed (H2ON) in free space, so that the game
+        no longer has to run LZO decompression on them when a screen loads.
+        Returns a list of (addr, new_addr, buflen, payload_size) for the report.
+        """
+        converted = []
+        for addr in addrs:
+            raw, info, _, _, _, err = self.extract_asset(addr)
+            if err is not None:
+                print(err, file=sys.stderr)
+                sys.exit(1)
+
+            if info['prefix'] != b'H2OS':
+                if self.verbose:
+                    print(f"Skipping 0x{addr:06X}: already {info['prefix'].decode()}", file=sys.stderr)
+                continue
+
+            blob = b'H2ON' + info['buflen'].to_bytes(4, byteorder='big') + bytes(raw)
+            new_addr = self.relocate_asset(addr, blob)
+            if new_addr is None:
+                sys.exit(1)
+
+            converted.append((addr, new_addr, info['buflen'], info['payload_size']))
+
+        return converted
+
+    @patch
     def insert_image(self, filename, i_addr):
         from PIL import Image
 
@@ -458,6 +577,7 @@ class TheNewTetrisRom(BaseRom):
             print(f"Unimplemented image format at address: 0x{i_addr:06X}", file=sys.stderr)
             sys.exit(1)
 
+    @patch
     def insert_by_name(self, filename, name):
         if name in tntmap.ANIM_BY_NAME:
             print(f"Instead of providing anim name, please supply the name of the anim's images one at a time.", file=sys.stderr)
@@ -468,14 +588,14 @@ class TheNewTetrisRom(BaseRom):
             print(f"No image found by name: {name}", file=sys.stderr)
             sys.exit(1)
 
-    def insert_sample(self, filename, s_addr, as_wave):
-        if as_wave:
-            with wave.open(filename, 'rb') as wavfile:
-                pcmdata = wavfile.readframes(wavfile.getnframes())
-        else:
-            pcmdata = open(filename, 'rb').read()
-
-        _, info, asset_type, asset_format, asset_info, err = self.extract_asset(s_addr)
+    @patch
+    def insert_sample(self, filename, s_addr, as_wave, fit=True):
+        """
+        A wav file may be any integer PCM format and rate: it is mixed to mono,
+        resampled to the sample's rate, converted to its format and, if fit,
+        trimmed or padded to the original sample's length.
+        """
+        orig, info, asset_type, asset_format, asset_info, err = self.extract_asset(s_addr)
         if err is not None:
             print(err, file=sys.stderr)
             sys.exit(1)
@@ -484,15 +604,13 @@ class TheNewTetrisRom(BaseRom):
             print(f"No sample found at address: 0x{s_addr:06X}", file=sys.stderr)
             sys.exit(1)
 
-        if asset_format == AssetFormat.PCM_S16:
-            raw = bytearray(pcmdata)
-            self.insert_asset(s_addr, raw, info)
-
-        elif asset_format == AssetFormat.PCM_S8:
+        if asset_format in (AssetFormat.PCM_S8, AssetFormat.PCM_S16):
+            fmt = asset_info['format']
             if as_wave:
-                raw = bytearray(bytes(np.frombuffer(pcmdata, dtype=np.uint8) - 128))
+                nframes = (len(orig) >> fmt) if fit else None
+                raw = bytearray(audio.import_wave(filename, fmt, asset_info['sample_rate'], nframes, self.verbose))
             else:
-                raw = bytearray(pcmdata)
+                raw = bytearray(open(filename, 'rb').read())
             self.insert_asset(s_addr, raw, info)
 
         elif asset_format == AssetFormat.UNKNOWN:
@@ -502,6 +620,7 @@ class TheNewTetrisRom(BaseRom):
             print(f"Unimplemented sample format at address: 0x{s_addr:06X}", file=sys.stderr)
             sys.exit(1)
 
+    @patch
     def modify_seed(self, value):
         """
         In FUN_80052114, replace:
@@ -520,6 +639,7 @@ class TheNewTetrisRom(BaseRom):
         self.asm_addr = addr3
         self.asm('AFB10054')  # sw      $s1, 0x54($sp)
 
+    @patch
     def modify_bag(self, start, end, n):
         if start < 0:
             print("bag error: {START} must not be less than 0", file=sys.stderr)
@@ -544,13 +664,14 @@ class TheNewTetrisRom(BaseRom):
 
         bag_size = n * (end - start)
 
-        self.data[addr1 : addr1 + 3] = b'\x20\x06\x00'   # addi $a2, $zero, ...
-        self.data[addr1 + 3 : addr1 + 4] = bytes([start])
-        self.data[addr2 : addr2 + 1] = bytes([end])
-        self.data[addr3 : addr3 + 1] = bytes([n])
-        self.data[addr4 : addr4 + 1] = bytes([bag_size])
+        self.insert_bytes(addr1, b'\x20\x06\x00')   # addi $a2, $zero, ...
+        self.insert_bytes(addr1 + 3, bytes([start]))
+        self.insert_bytes(addr2, bytes([end]))
+        self.insert_bytes(addr3, bytes([n]))
+        self.insert_bytes(addr4, bytes([bag_size]))
 
     # Sprint goal (time)
+    @patch
     def modify_sprint(self, value):
         addr1 = 0x01851A
 
@@ -558,9 +679,10 @@ class TheNewTetrisRom(BaseRom):
         value &= 0xFFFF
         time = value.to_bytes(2, byteorder='big')
 
-        self.data[addr1 : addr1 + 2] = time[0:2]
+        self.insert_bytes(addr1, time[0:2])
 
     # Ultra goal (lines)
+    @patch
     def modify_ultra(self, value):
         # for display
         addr1 = 0x01852A
@@ -570,9 +692,10 @@ class TheNewTetrisRom(BaseRom):
         value &= 0xFFFF
         lines = value.to_bytes(2, byteorder='big')
 
-        self.data[addr1 : addr1 + 2] = lines[0:2]
-        self.data[addr2 : addr2 + 2] = lines[0:2]
+        self.insert_bytes(addr1, lines[0:2])
+        self.insert_bytes(addr2, lines[0:2])
 
+    @patch
     def modify_piece_color(self, base_address, piece, r, g, b):
         if piece < 0 or piece > 6:
             print("piece error: Piece type must be between 0 and 6", file=sys.stderr)
@@ -584,53 +707,61 @@ class TheNewTetrisRom(BaseRom):
         g &= 0xFF
         b &= 0xFF
 
-        self.data[addr1 + 1 : addr1 + 2] = bytes([r])
-        self.data[addr1 + 3 : addr1 + 4] = bytes([g])
-        self.data[addr1 + 5 : addr1 + 6] = bytes([b])
+        self.insert_bytes(addr1 + 1, bytes([r]))
+        self.insert_bytes(addr1 + 3, bytes([g]))
+        self.insert_bytes(addr1 + 5, bytes([b]))
 
+    @patch
     def modify_piece_diffuse_color(self, piece, r, g, b):
         base_address = 0x096210
         self.modify_piece_color(base_address, piece, r, g, b)
 
+    @patch
     def modify_piece_specular_color(self, piece, r, g, b):
         base_address = 0x096210 + 6
         self.modify_piece_color(base_address, piece, r, g, b)
 
     # Piece spawn delay
+    @patch
     def modify_spawn_delay(self, value):
         addr1 = 0x02EB73
         value &= 0xFF
-        self.data[addr1 : addr1 + 1] = bytes([value])
+        self.insert_bytes(addr1, bytes([value]))
 
     # Piece hold delay
+    @patch
     def modify_hold_delay(self, value):
         addr1 = 0x02C7D3
         value &= 0xFF
         if value == 0:
             print("Piece hold delay of 0 will freeze the game/console.", file=sys.stderr)
             sys.exit(1)
-        self.data[addr1 : addr1 + 1] = bytes([value])
+        self.insert_bytes(addr1, bytes([value]))
 
     # Piece lock delay
+    @patch
     def modify_lock_delay(self, value):
         addr1 = 0x02D2E7
         addr2 = 0x02E0F3
         value &= 0xFF
-        self.data[addr1 : addr1 + 1] = bytes([value])
-        self.data[addr2 : addr2 + 1] = bytes([value])
+        self.insert_bytes(addr1, bytes([value]))
+        self.insert_bytes(addr2, bytes([value]))
 
     # Line clearing delay
+    @patch
     def modify_line_delay(self, value):
         addr1 = 0x02F59B
         value &= 0xFF
-        self.data[addr1 : addr1 + 1] = bytes([value])
+        self.insert_bytes(addr1, bytes([value]))
 
     # Square forming delay
+    @patch
     def modify_square_delay(self, value):
         addr1 = 0x030973
         value &= 0xFF
-        self.data[addr1 : addr1 + 1] = bytes([value])
+        self.insert_bytes(addr1, bytes([value]))
 
+    @patch
     def modify_screens(self, start, end):
         if start < 0:
             print("screens error: {START} must not be less than 0", file=sys.stderr)
@@ -645,13 +776,14 @@ class TheNewTetrisRom(BaseRom):
         for addr1, addr2, addr3 in [(0x0570E0, 0x0570E8, 0x0570D7),    # Game mode
                                     (0x0571D8, 0x0571E0, 0x0571CF)]:   # Attract mode
             # Enables all screens without needing to unlock all wonders
-            self.data[addr3 : addr3 + 1] = bytes([0])
+            self.insert_bytes(addr3, bytes([0]))
             # Now limit the set of allowable screens
-            self.data[addr1 : addr1 + 3] = b'\x24\x04\x00'   # addiu $a0, $zero, ...
-            self.data[addr1 + 3 : addr1 + 4] = bytes([start])
-            self.data[addr2 : addr2 + 3] = b'\x24\x05\x00'   # addiu $a1, $zero, ...
-            self.data[addr2 + 3 : addr2 + 4] = bytes([end])
+            self.insert_bytes(addr1, b'\x24\x04\x00')   # addiu $a0, $zero, ...
+            self.insert_bytes(addr1 + 3, bytes([start]))
+            self.insert_bytes(addr2, b'\x24\x05\x00')   # addiu $a1, $zero, ...
+            self.insert_bytes(addr2 + 3, bytes([end]))
 
+    @patch
     def modify_stat_position(self, stat, x, y):
         if stat < 1 or stat > 4:
             print("stat error: Stat type must be between 1 and 4", file=sys.stderr)
@@ -697,9 +829,11 @@ class TheNewTetrisRom(BaseRom):
         y &= 0xFFFF
         y_bytes = y.to_bytes(2, byteorder='big')
 
-        self.data[addr1 : addr1 + 2] = x_bytes[0:2]
-        self.data[addr2 : addr2 + 2] = y_bytes[0:2]
+        # the seed's position is in display_seed()'s code
+        self.insert_bytes(addr1, x_bytes[0:2], amend=(stat == 4))
+        self.insert_bytes(addr2, y_bytes[0:2], amend=(stat == 4))
 
+    @patch
     def modify_stat_color(self, stat, r, g, b, a):
         if stat < 1 or stat > 4:
             print("stat error: Stat type must be between 1 and 4", file=sys.stderr)
@@ -758,11 +892,13 @@ class TheNewTetrisRom(BaseRom):
         b &= 0xFF
         a &= 0xFF
 
-        self.data[addr1 : addr1 + 1] = bytes([r])
-        self.data[addr2 : addr2 + 1] = bytes([g])
-        self.data[addr3 : addr3 + 1] = bytes([b])
-        self.data[addr4 : addr4 + 1] = bytes([a])
+        # the seed's color is in display_seed()'s code
+        self.insert_bytes(addr1, bytes([r]), amend=(stat == 4))
+        self.insert_bytes(addr2, bytes([g]), amend=(stat == 4))
+        self.insert_bytes(addr3, bytes([b]), amend=(stat == 4))
+        self.insert_bytes(addr4, bytes([a]), amend=(stat == 4))
 
+    @patch
     def modify_initial_hold_piece(self, piece):
         if piece < 0 or piece > 6:
             print("ihp error: Piece type must be between 0 and 6", file=sys.stderr)
@@ -770,10 +906,11 @@ class TheNewTetrisRom(BaseRom):
 
         addr1 = 0x02C868
 
-        self.data[addr1 : addr1 + 3] = b'\x24\x0A\x00'   # addiu $t2, $zero, ...
-        self.data[addr1 + 3 : addr1 + 4] = bytes([piece])
+        self.insert_bytes(addr1, b'\x24\x0A\x00')   # addiu $t2, $zero, ...
+        self.insert_bytes(addr1 + 3, bytes([piece]))
 
     # value must be in the set {2, 4, 6, 8}
+    @patch
     def modify_square_size(self, value):
         """
                                                                 // For square size of 6
@@ -842,36 +979,37 @@ class TheNewTetrisRom(BaseRom):
         addr24 = 0x03059B
         addr25 = 0x0305AB
 
-        self.data[addr1 : addr1 + 1] = bytes([11 - value])
-        self.data[addr2 : addr2 + 1] = bytes([21 - value])
-        self.data[addr3 : addr3 + 1] = bytes([11 - value])
-        self.data[addr4 : addr4 + 1] = bytes([21 - value])
-
-        self.data[addr5 : addr5 + 1] = bytes([11 - value])
-        self.data[addr6 : addr6 + 1] = bytes([21 - value])
-        self.data[addr7 : addr7 + 1] = bytes([value * value // 4])
-        self.data[addr8 : addr8 + 1] = bytes([value])
-        self.data[addr9 : addr9 + 1] = bytes([value])
-        self.data[addr10 : addr10 + 1] = bytes([value * value // 4])
-        self.data[addr11 : addr11 + 1] = bytes([(10 - value) * 4])
-
-        self.data[addr12 : addr12 + 1] = bytes([257 - value])
-        self.data[addr13 : addr13 + 1] = bytes([257 - value])
-        self.data[addr14 : addr14 + 1] = bytes([11 - value])
-        self.data[addr15 : addr15 + 1] = bytes([10 - value])
-        self.data[addr16 : addr16 + 1] = bytes([21 - value])
-        self.data[addr17 : addr17 + 1] = bytes([20 - value])
-
-        self.data[addr18 : addr18 + 1] = bytes([256 - (value * 11)])
-        self.data[addr19 : addr19 + 1] = bytes([256 - (value * 11)])
-
-        self.data[addr20 : addr20 + 1] = bytes([value])
-        self.data[addr21 : addr21 + 1] = bytes([value])
-        self.data[addr22 : addr22 + 1] = bytes([value])
-        self.data[addr23 : addr23 + 1] = bytes([value])
-        self.data[addr24 : addr24 + 1] = bytes([(10 - value) * 4])
-        self.data[addr25 : addr25 + 1] = bytes([value * value])
-
+        self.insert_bytes(addr1, bytes([11 - value]))
+        self.insert_bytes(addr2, bytes([21 - value]))
+        self.insert_bytes(addr3, bytes([11 - value]))
+        self.insert_bytes(addr4, bytes([21 - value]))
+
+        self.insert_bytes(addr5, bytes([11 - value]))
+        self.insert_bytes(addr6, bytes([21 - value]))
+        self.insert_bytes(addr7, bytes([value * value // 4]))
+        self.insert_bytes(addr8, bytes([value]))
+        self.insert_bytes(addr9, bytes([value]))
+        self.insert_bytes(addr10, bytes([value * value // 4]))
+        self.insert_bytes(addr11, bytes([(10 - value) * 4]))
+
+        self.insert_bytes(addr12, bytes([257 - value]))
+        self.insert_bytes(addr13, bytes([257 - value]))
+        self.insert_bytes(addr14, bytes([11 - value]))
+        self.insert_bytes(addr15, bytes([10 - value]))
+        self.insert_bytes(addr16, bytes([21 - value]))
+        self.insert_bytes(addr17, bytes([20 - value]))
+
+        self.insert_bytes(addr18, bytes([256 - (value * 11)]))
+        self.insert_bytes(addr19, bytes([256 - (value * 11)]))
+
+        self.insert_bytes(addr20, bytes([value]))
+        self.insert_bytes(addr21, bytes([value]))
+        self.insert_bytes(addr22, bytes([value]))
+        self.insert_bytes(addr23, bytes([value]))
+        self.insert_bytes(addr24, bytes([(10 - value) * 4]))
+        self.insert_bytes(addr25, bytes([value * value]))
+
+    @patch
     def old_save_seed(self):
         addr1 = 0x0A4420
         addr2 = 0x099480
@@ -946,6 +1084,7 @@ class TheNewTetrisRom(BaseRom):
         addr5 = 0x100FF7  # 8013AD77
         self.insert_bytes(addr5, b'%08X\x00')
 
+    @patch
     def move_heap(self):
         """
         Make room for new code.
@@ -964,6 +1103,7 @@ class TheNewTetrisRom(BaseRom):
         #self.asm('3C0F8013')  # lui     $t7, 0x8013
         #self.asm('35EFAD80')  # ori     $t7, $t7, 0xAD80
 
+    @patch
     def func_display_text(self):
         addr = self.next_sub_addr
         self.jal_display_text = self.jal(self.virt(addr))
@@ -994,72 +1134,20 @@ class TheNewTetrisRom(BaseRom):
         self.asm('27bd0028')  # addiu   $sp, $sp, 0x28
         self.next_sub_addr = self.asm_addr
 
+    @patch
     def add_utility_functions(self):
         self.func_display_text()
 
-    def init_static_data(self):
-        # reserves space for seed
-        addr = 0x100FFC  # 8013AD7C
-        self.insert_bytes(addr, b'\x00' * 4)
-
-        addr = 0x100FF7  # 8013AD77
-        self.insert_bytes(addr, b'%08X\x00')
-
-        addr = 0x100FF1  # 8013AD71
-        self.insert_bytes(addr, b'%c %c\x00')
-
-        addr = 0x100FDC  # 8013AD5C
-        self.insert_bytes(addr, b'%d %d %d %d %d %d %d\x00')
-
-        # x,y - piece_count, 2p, p2
-        addr = 0x100FD8  # 8013AD58
-        self.insert_bytes(addr, b'\x00\xA9\x00\xF7')
-
-        # x,y - piece_count, 2p, p1
-        addr = 0x100FD4  # 8013AD54
-        self.insert_bytes(addr, b'\x00\xA9\x00\xA8')
-
-        # x,y - piece_count, 1p, p1
-        addr = 0x100FD0  # 8013AD50
-        self.insert_bytes(addr, b'\x01\x27\x00\x9B')
-
-        # x,y - remaining_pieces, 2p, p2
-        #addr = 0x100FCC  # 8013AD4C
-        #self.insert_bytes(addr, b'\x00\xF0\x00\xFC')
-
-        # x,y - remaining_pieces, 2p, p1
-        #addr = 0x100FC8  # 8013AD48
-        #self.insert_bytes(addr, b'\x00\x2F\x00\xFC')
-
-        # x,y - remaining_pieces, 1p, p1
-        addr = 0x100FC4  # 8013AD44
-        self.insert_bytes(addr, b'\x00\x35\x00\x66')
-
-        # x,y - extra_lookahead, 2p, p2
-        addr = 0x100FC0  # 8013AD40
-        self.insert_bytes(addr, b'\x00\xD2\x00\x90')
-
-        # x,y - extra_lookahead, 2p, p1
-        addr = 0x100FBC  # 8013AD3C
-        self.insert_bytes(addr, b'\x00\xAC\x00\x90')
-
-        # x,y - extra_lookahead, 1p, p1
-        addr = 0x100FB8  # 8013AD38
-        self.insert_bytes(addr, b'\x00\xD0\x00\x90')
-
-        # initializes linked list and reserves space for head item
-        # register_piece_count() places its item here
-        addr = 0x100FA4  # 8013AD24
-        self.insert_bytes(addr, b'\x00' * 20)
-
-        # register_remaining_pieces() places its item here
-        addr = 0x100F90  # 8013AD10
-        self.insert_bytes(addr, b'\x00' * 20)
-
-        # register_extra_lookahead() places its item here
-        addr = 0x100F7C  # 8013ACFC
-        self.insert_bytes(addr, b'\x00' * 20)
+    @patch
+    def init_static_data(self, names=None):
+        """
+        Writes the STATIC_DATA entries in names (default: all of them).
+        """
+        for name, (addr, raw) in STATIC_DATA.items():
+            if names is None or name in names:
+                self.insert_bytes(addr, raw)
 
+    @patch
     def save_seed(self):
         """
         In FUN_80052114, replace:
@@ -1081,6 +1169,14 @@ class TheNewTetrisRom(BaseRom):
         self.asm('3529ad7c')  # ori     $t1, $t1, 0xAD7C
         self.asm('ad280000')  # sw      $t0, ($t1)              ; store seed into 8013AD7C
 
+        # the seed is constant for the whole game: format it once, for display_seed()
+        self.asm('3c048013')  # lui     $a0, 0x8013
+        self.asm('3484acf0')  # ori     $a0, $a0, 0xACF0        ; s_seed
+        self.asm('3c058013')  # lui     $a1, 0x8013
+        self.asm('34a5ad77')  # ori     $a1, $a1, 0xAD77        ; "%08X"
+        self.asm('0c02d8b5')  # jal     func_800B62D4           ; sprintf()
+        self.asm('01003025')  # or      $a2, $t0, $zero         ; seed
+
         """
         # store 0x9 into 46 shorts beginning at 80110A0C
         self.asm('3c088011')  # lui     $t0, 0x8011
@@ -1099,13 +1195,14 @@ class TheNewTetrisRom(BaseRom):
         /* 0187B0 80052530 00000000 */  nop
         """
         self.asm('0c010498')  # jal     func_80041260
-        self.asm('00000000')  # nop
+        self.asm('8fa40018')  # lw      $a0, 0x18($sp)          ; seed
 
         self.asm('8fbf0014')  # lw      $ra, 0x14($sp)
         self.asm('03e00008')  # jr      $ra
         self.asm('27bd0018')  # addiu   $sp, $sp, 0x18
         self.next_sub_addr = self.asm_addr
 
+    @patch
     def display_seed(self):
         """
         In FUN_80051F30, replace:
@@ -1128,14 +1225,6 @@ class TheNewTetrisRom(BaseRom):
         self.asm('0c01caa1')  # jal     func_80072A84
         self.asm('00000000')  # nop
 
-        self.asm('3c088013')  # lui     $t0, 0x8013
-        self.asm('3508ad7c')  # ori     $t0, $t0, 0xAD7C
-        self.asm('8d060000')  # lw      $a2, ($t0)              ; seed
-        self.asm('3c058013')  # lui     $a1, 0x8013
-        self.asm('34a5ad77')  # ori     $a1, $a1, 0xAD77        ; "%08X"
-        self.asm('0c02d8b5')  # jal     func_800B62D4           ; sprintf()
-        self.asm('27a40024')  # addiu   $a0, $sp, 0x24          ; s_seed
-
         self.asm('3c10800e')  # lui     $s0, 0x800E
         self.asm('361020c0')  # ori     $s0, $s0, 0x20C0        ; ?
         self.asm('0c016eff')  # jal     func_8005BBFC           ; open_display?
@@ -1145,7 +1234,8 @@ class TheNewTetrisRom(BaseRom):
         self.seed_xpos_addr = self.asm_addr - 2
         self.asm('2407011d')  # addiu   $a3, $zero, 0x11D       ; y position for seed
         self.seed_ypos_addr = self.asm_addr - 2
-        self.asm('27a80024')  # addiu   $t0, $sp, 0x24          ; s_seed
+        self.asm('3c088013')  # lui     $t0, 0x8013
+        self.asm('3508acf0')  # ori     $t0, $t0, 0xACF0        ; s_seed, formatted by save_seed()
         self.asm('240900ff')  # addiu   $t1, $zero, 0xFF        ; red
         self.seed_red_addr = self.asm_addr - 1
         self.asm('240a00ff')  # addiu   $t2, $zero, 0xFF        ; green
@@ -1173,19 +1263,33 @@ class TheNewTetrisRom(BaseRom):
         self.asm('27bd0038')  # addiu   $sp, $sp, 0x38
         self.next_sub_addr = self.asm_addr
 
+    @patch
     def heap_alloc_player_data(self):
         """
-        Allocate extra heap space for per-player data.  Increase by 24 bytes.
+        Allocate extra heap space for per-player data.  Increase by 88 bytes.
 
-        In FUN_80052114, change 0x6848 to 0x6860
+        In FUN_80052114, change 0x6848 to 0x68A0
             FUN_8007E03C(0x6848);
 
         /* 0186E8 80052468 0C01F80F */  jal   func_8007E03C
         /* 0186EC 8005246C 24046848 */  addiu $a0, $zero, 0x6848
+
+        Layout of the extra space (offsets from player_data + 0x6848):
+            0x00  remaining_pieces_array[7], total_remaining_pieces
+            0x08  piece_count
+            0x0C  x,y for piece_count
+            0x10  x,y for remaining_pieces
+            0x14  x,y for extra_lookahead
+            0x18  last piece_count
+            0x1C  s_piece_count[16]
+            0x2C  last remaining_pieces_array[8]
+            0x34  s_remaining_pieces[7][4]
+            0x50  last count (frame_times)
         """
-        self.insert_bytes(0x0186EE, b'\x68\x60')
+        self.insert_bytes(0x0186EE, b'\x68\xA0')
 
-    def init_player_stats(self):
+    @patch
+    def init_player_stats(self, list_head=0x100FA4, funcs=None):
         """
         In FUN_800547F0, replace:
             FUN_800713F0(param_1 + 0x6690, &local_4);
@@ -1222,24 +1326,28 @@ class TheNewTetrisRom(BaseRom):
         self.asm('000B5880')  # sll     $t3, $t3, 0x2
         self.asm('AFAB0010')  # sw      $t3, 0x10($sp)          ; np_cp
 
-        # traverse linked list
-        self.asm('3C088013')  # lui     $t0, 0x8013
-        self.asm('3508AD24')  # ori     $t0, $t0, 0xAD24        ; head of linked list
-
-        # branch target for "next_item != 0"
-        self.asm('8d090008')  # lw      $t1, 0x8($t0)           ; item_init_func
-        self.asm('11200007')  # beq     $t1, $zero, 0x1C        ; branch if item_init_func == 0
-        self.asm('8d100000')  # lw      $s0, ($t0)              ; next_item
-        self.asm('8d0a0004')  # lw      $t2, 0x4($t0)           ; item_flags
-        self.asm('11400004')  # beq     $t2, $zero, 0x10        ; branch if item_flags == 0
-        self.asm('00000000')  # nop
-        self.asm('8fa50010')  # lw      $a1, 0x10($sp)          ; np_cp
-        self.asm('0120f809')  # jalr    $t1                     ; call item_init_func
-        self.asm('8fa40014')  # lw      $a0, 0x14($sp)          ; player_data + 0x6848
-
-        # branch target for "item_init_func == 0" OR "item_flags == 0"
-        self.asm('1600fff6')  # bne     $s0, $zero, -0x28       ; branch if next_item != 0
-        self.asm('02004025')  # or      $t0, $s0, $zero         ; copy $s0 to $t0
+        if funcs is not None:
+            self.call_items(funcs, True)
+        else:
+            # traverse linked list
+            head = self.virt(list_head).to_bytes(4, byteorder='big')
+            self.asm(b'\x3C\x08' + head[0 : 2])  # lui     $t0, ...
+            self.asm(b'\x35\x08' + head[2 : 4])  # ori     $t0, $t0, ...           ; head of linked list
+
+            # branch target for "next_item != 0"
+            self.asm('8d090008')  # lw      $t1, 0x8($t0)           ; item_init_func
+            self.asm('11200007')  # beq     $t1, $zero, 0x1C        ; branch if item_init_func == 0
+            self.asm('8d100000')  # lw      $s0, ($t0)              ; next_item
+            self.asm('8d0a0004')  # lw      $t2, 0x4($t0)           ; item_flags
+            self.asm('11400004')  # beq     $t2, $zero, 0x10        ; branch if item_flags == 0
+            self.asm('00000000')  # nop
+            self.asm('8fa50010')  # lw      $a1, 0x10($sp)          ; np_cp
+            self.asm('0120f809')  # jalr    $t1                     ; call item_init_func
+            self.asm('8fa40014')  # lw      $a0, 0x14($sp)          ; player_data + 0x6848
+
+            # branch target for "item_init_func == 0" OR "item_flags == 0"
+            self.asm('1600fff6')  # bne     $s0, $zero, -0x28       ; branch if next_item != 0
+            self.asm('02004025')  # or      $t0, $s0, $zero         ; copy $s0 to $t0
 
         """
         FUN_800713F0(param_1 + 0x6690, &local_4);
@@ -1255,7 +1363,8 @@ class TheNewTetrisRom(BaseRom):
         self.asm('27BD0020')  # addiu   $sp, $sp, 0x20
         self.next_sub_addr = self.asm_addr
 
-    def update_player_stats(self):
+    @patch
+    def update_player_stats(self, list_head=0x100FA4, funcs=None):
         """
         In FUN_80071394, replace:
             FUN_80071238(param_1);
@@ -1275,23 +1384,27 @@ class TheNewTetrisRom(BaseRom):
         self.asm('250801B8')  # addiu   $t0, $t0, 0x1B8
         self.asm('AFA80014')  # sw      $t0, 0x14($sp)          ; player_data + 0x6848
 
-        # traverse linked list
-        self.asm('3C088013')  # lui     $t0, 0x8013
-        self.asm('3508AD24')  # ori     $t0, $t0, 0xAD24        ; head of linked list
-
-        # branch target for "next_item != 0"
-        self.asm('8d09000c')  # lw      $t1, 0xC($t0)           ; item_update_func
-        self.asm('11200006')  # beq     $t1, $zero, 0x18        ; branch if item_update_func == 0
-        self.asm('8d100000')  # lw      $s0, ($t0)              ; next_item
-        self.asm('8d0a0004')  # lw      $t2, 0x4($t0)           ; item_flags
-        self.asm('11400003')  # beq     $t2, $zero, 0xC         ; branch if item_flags == 0
-        self.asm('00000000')  # nop
-        self.asm('0120f809')  # jalr    $t1                     ; call item_update_func
-        self.asm('8fa40014')  # lw      $a0, 0x14($sp)          ; player_data + 0x6848
-
-        # branch target for "item_update_func == 0" OR "item_flags == 0"
-        self.asm('1600fff7')  # bne     $s0, $zero, -0x24       ; branch if next_item != 0
-        self.asm('02004025')  # or      $t0, $s0, $zero         ; copy $s0 to $t0
+        if funcs is not None:
+            self.call_items(funcs, False)
+        else:
+            # traverse linked list
+            head = self.virt(list_head).to_bytes(4, byteorder='big')
+            self.asm(b'\x3C\x08' + head[0 : 2])  # lui     $t0, ...
+            self.asm(b'\x35\x08' + head[2 : 4])  # ori     $t0, $t0, ...           ; head of linked list
+
+            # branch target for "next_item != 0"
+            self.asm('8d09000c')  # lw      $t1, 0xC($t0)           ; item_update_func
+            self.asm('11200006')  # beq     $t1, $zero, 0x18        ; branch if item_update_func == 0
+            self.asm('8d100000')  # lw      $s0, ($t0)              ; next_item
+            self.asm('8d0a0004')  # lw      $t2, 0x4($t0)           ; item_flags
+            self.asm('11400003')  # beq     $t2, $zero, 0xC         ; branch if item_flags == 0
+            self.asm('00000000')  # nop
+            self.asm('0120f809')  # jalr    $t1                     ; call item_update_func
+            self.asm('8fa40014')  # lw      $a0, 0x14($sp)          ; player_data + 0x6848
+
+            # branch target for "item_update_func == 0" OR "item_flags == 0"
+            self.asm('1600fff7')  # bne     $s0, $zero, -0x24       ; branch if next_item != 0
+            self.asm('02004025')  # or      $t0, $s0, $zero         ; copy $s0 to $t0
 
         """
         FUN_80071238(param_1);
@@ -1306,7 +1419,8 @@ class TheNewTetrisRom(BaseRom):
         self.asm('27BD0020')  # addiu   $sp, $sp, 0x20
         self.next_sub_addr = self.asm_addr
 
-    def display_player_stats(self):
+    @patch
+    def display_player_stats(self, list_head=0x100FA4, funcs=None):
         """
         In FUN_8005447C, replace:
             FUN_80052A00(param_1 + 0x6808);
@@ -1341,24 +1455,28 @@ class TheNewTetrisRom(BaseRom):
         self.asm('912A0000')  # lbu     $t2, ($t1)
         self.asm('afaa0010')  # sw      $t2, 0x10($sp)          ; num_players
 
-        # traverse linked list
-        self.asm('3C088013')  # lui     $t0, 0x8013
-        self.asm('3508AD24')  # ori     $t0, $t0, 0xAD24        ; head of linked list
-
-        # branch target for "next_item != 0"
-        self.asm('8d090010')  # lw      $t1, 0x10($t0)          ; item_display_func
-        self.asm('11200007')  # beq     $t1, $zero, 0x1C        ; branch if item_display_func == 0
-        self.asm('8d100000')  # lw      $s0, ($t0)              ; next_item
-        self.asm('8d0a0004')  # lw      $t2, 0x4($t0)           ; item_flags
-        self.asm('11400004')  # beq     $t2, $zero, 0x10        ; branch if item_flags == 0
-        self.asm('00000000')  # nop
-        self.asm('8fa50010')  # lw      $a1, 0x10($sp)          ; num_players
-        self.asm('0120f809')  # jalr    $t1                     ; call item_display_func
-        self.asm('8fa40014')  # lw      $a0, 0x14($sp)          ; player_data + 0x6848
-
-        # branch target for "item_display_func == 0" OR "item_flags == 0"
-        self.asm('1600fff6')  # bne     $s0, $zero, -0x28       ; branch if next_item != 0
-        self.asm('02004025')  # or      $t0, $s0, $zero         ; copy $s0 to $t0
+        if funcs is not None:
+            self.call_items(funcs, True)
+        else:
+            # traverse linked list
+            head = self.virt(list_head).to_bytes(4, byteorder='big')
+            self.asm(b'\x3C\x08' + head[0 : 2])  # lui     $t0, ...
+            self.asm(b'\x35\x08' + head[2 : 4])  # ori     $t0, $t0, ...           ; head of linked list
+
+            # branch target for "next_item != 0"
+            self.asm('8d090010')  # lw      $t1, 0x10($t0)          ; item_display_func
+            self.asm('11200007')  # beq     $t1, $zero, 0x1C        ; branch if item_display_func == 0
+            self.asm('8d100000')  # lw      $s0, ($t0)              ; next_item
+            self.asm('8d0a0004')  # lw      $t2, 0x4($t0)           ; item_flags
+            self.asm('11400004')  # beq     $t2, $zero, 0x10        ; branch if item_flags == 0
+            self.asm('00000000')  # nop
+            self.asm('8fa50010')  # lw      $a1, 0x10($sp)          ; num_players
+            self.asm('0120f809')  # jalr    $t1                     ; call item_display_func
+            self.asm('8fa40014')  # lw      $a0, 0x14($sp)          ; player_data + 0x6848
+
+            # branch target for "item_display_func == 0" OR "item_flags == 0"
+            self.asm('1600fff6')  # bne     $s0, $zero, -0x28       ; branch if next_item != 0
+            self.asm('02004025')  # or      $t0, $s0, $zero         ; copy $s0 to $t0
 
         self.asm('3C04800E')  # lui     $a0, 0x800E
         self.asm('0C016F90')  # jal     func_8005BE40           ; close_display?
@@ -1370,44 +1488,58 @@ class TheNewTetrisRom(BaseRom):
         self.asm('27BD0020')  # addiu   $sp, $sp, 0x20
         self.next_sub_addr = self.asm_addr
 
+    def call_items(self, funcs, with_a1):
+        """
+        Direct mode of the player stats routines: instead of traversing the
+        linked list, jal each enabled item function in turn.  The arguments
+        are reloaded from the stack since the item functions may clobber them.
+        """
+        for func in funcs:
+            if with_a1:
+                self.asm('8fa50010')  # lw      $a1, 0x10($sp)          ; np_cp or num_players
+            self.asm(self.jal(self.virt(func)))  # jal     item_func
+            self.asm('8fa40014')  # lw      $a0, 0x14($sp)          ; player_data + 0x6848
+
     def ll_add_item(self, this_item_addr, next_item_addr, item_flags, item_init_func_addr, item_update_func_addr, item_display_func_addr):
+        # fills the 20 bytes that init_static_data() reserved for the item
         # next_item
         if next_item_addr is None:
-            self.insert_bytes(this_item_addr, int(0).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr, int(0).to_bytes(4, byteorder='big'), amend=True)
         else:
-            self.insert_bytes(this_item_addr, self.virt(next_item_addr).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr, self.virt(next_item_addr).to_bytes(4, byteorder='big'), amend=True)
 
         # item_flags
-        self.insert_bytes(this_item_addr + 4, item_flags.to_bytes(4, byteorder='big'))
+        self.insert_bytes(this_item_addr + 4, item_flags.to_bytes(4, byteorder='big'), amend=True)
 
         # item_init_func
         if item_init_func_addr is None:
-            self.insert_bytes(this_item_addr + 8, int(0).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr + 8, int(0).to_bytes(4, byteorder='big'), amend=True)
         else:
-            self.insert_bytes(this_item_addr + 8, self.virt(item_init_func_addr).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr + 8, self.virt(item_init_func_addr).to_bytes(4, byteorder='big'), amend=True)
 
         # item_update_func
         if item_update_func_addr is None:
-            self.insert_bytes(this_item_addr + 12, int(0).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr + 12, int(0).to_bytes(4, byteorder='big'), amend=True)
         else:
-            self.insert_bytes(this_item_addr + 12, self.virt(item_update_func_addr).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr + 12, self.virt(item_update_func_addr).to_bytes(4, byteorder='big'), amend=True)
 
         # item_display_func
         if item_display_func_addr is None:
-            self.insert_bytes(this_item_addr + 16, int(0).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr + 16, int(0).to_bytes(4, byteorder='big'), amend=True)
         else:
-            self.insert_bytes(this_item_addr + 16, self.virt(item_display_func_addr).to_bytes(4, byteorder='big'))
+            self.insert_bytes(this_item_addr + 16, self.virt(item_display_func_addr).to_bytes(4, byteorder='big'), amend=True)
 
     def ll_update_item_flags(self, this_item_addr, item_flags):
-        self.insert_bytes(this_item_addr + 4, item_flags.to_bytes(4, byteorder='big'))
+        self.insert_bytes(this_item_addr + 4, item_flags.to_bytes(4, byteorder='big'), amend=True)
 
+    @patch
     def enable_piece_count(self):
         this_item_addr = 0x100FA4  # 8013AD24
         self.ll_update_item_flags(this_item_addr, 1)
 
-    def register_piece_count(self):
+    @patch
+    def register_piece_count(self, next_item_addr=0x100F90, direct=False):
         this_item_addr = 0x100FA4  # 8013AD24
-        next_item_addr = 0x100F90  # 8013AD10
 
         self.asm_addr = self.next_sub_addr
 
@@ -1415,6 +1547,8 @@ class TheNewTetrisRom(BaseRom):
         item_init_func_addr = self.asm_addr
         self.asm('2408fffc')  # addiu   $t0, $zero, -4          ; initialize piece_count to -4
         self.asm('ac880008')  # sw      $t0, 0x8($a0)           ; store piece_count at player_data + 0x6850
+        self.asm('3c0b8000')  # lui     $t3, 0x8000             ; never a piece_count
+        self.asm('ac8b0018')  # sw      $t3, 0x18($a0)          ; store last piece_count at player_data + 0x6860
 
         self.asm('3c098013')  # lui     $t1, 0x8013
         self.asm('3529ad50')  # ori     $t1, $t1, 0xAD50        ; x,y lut for piece_count
@@ -1442,10 +1576,14 @@ class TheNewTetrisRom(BaseRom):
 
         self.asm('8fa80044')  # lw      $t0, 0x44($sp)          ; num_players
         self.asm('2d090003')  # sltiu   $t1, $t0, 0x3
-        self.asm('1120000f')  # beq     $t1, $zero, 0x3C        ; branch if num_players >= 3
+        self.asm('11200012')  # beq     $t1, $zero, 0x48        ; branch if num_players >= 3
         self.asm('8fb00040')  # lw      $s0, 0x40($sp)          ; player_data + 0x6848
 
         self.asm('8e060008')  # lw      $a2, 0x8($s0)           ; piece_count
+        self.asm('8e0a0018')  # lw      $t2, 0x18($s0)          ; last piece_count
+        self.asm('10ca000a')  # beq     $a2, $t2, 0x28          ; branch if piece_count is unchanged
+        self.asm('ae060018')  # sw      $a2, 0x18($s0)          ; store last piece_count
+
         self.asm('2408003f')  # addiu   $t0, $zero, 0x3F
         self.asm('00c8001b')  # divu    $zero, $a2, $t0
         self.asm('00003812')  # mflo    $a3                     ; num_bags
@@ -1455,9 +1593,10 @@ class TheNewTetrisRom(BaseRom):
         self.asm('3c058013')  # lui     $a1, 0x8013
         self.asm('34a5ad68')  # ori     $a1, $a1, 0xAD68        ; "%d %d %d"
         self.asm('0c02d8b5')  # jal     func_800B62D4           ; sprintf()
-        self.asm('27a40028')  # addiu   $a0, $sp, 0x28          ; s_piece_count
+        self.asm('2604001c')  # addiu   $a0, $s0, 0x1C          ; s_piece_count at player_data + 0x6864
 
-        self.asm('27a60028')  # addiu   $a2, $sp, 0x28          ; s_piece_count
+        # branch target for "piece_count is unchanged"
+        self.asm('2606001c')  # addiu   $a2, $s0, 0x1C          ; s_piece_count
         self.asm('9605000e')  # lhu     $a1, 0xE($s0)           ; y position for piece_count
         self.asm(self.jal_display_text)  # jal     func_display_text
         self.asm('9604000c')  # lhu     $a0, 0xC($s0)           ; x position for piece_count
@@ -1471,15 +1610,18 @@ class TheNewTetrisRom(BaseRom):
 
         self.next_sub_addr = self.asm_addr
 
-        self.ll_add_item(this_item_addr, next_item_addr, 0, item_init_func_addr, item_update_func_addr, item_display_func_addr)
+        if not direct:
+            self.ll_add_item(this_item_addr, next_item_addr, 0, item_init_func_addr, item_update_func_addr, item_display_func_addr)
+        return item_init_func_addr, item_update_func_addr, item_display_func_addr
 
+    @patch
     def enable_remaining_pieces(self):
         this_item_addr = 0x100F90  # 8013AD10
         self.ll_update_item_flags(this_item_addr, 1)
 
-    def register_remaining_pieces(self):
+    @patch
+    def register_remaining_pieces(self, next_item_addr=0x100F7C, direct=False, multiline=False):
         this_item_addr = 0x100F90  # 8013AD10
-        next_item_addr = 0x100F7C  # 8013ACFC
 
         self.asm_addr = self.next_sub_addr
 
@@ -1487,6 +1629,10 @@ class TheNewTetrisRom(BaseRom):
         item_init_func_addr = self.asm_addr
         self.asm('24080001')  # addiu   $t0, $zero, 1           ; initialize total_remaining_pieces to 1
         self.asm('A0880007')  # sb      $t0, 0x7($a0)           ; store total_remaining_pieces at player_data + 0x684F
+        self.asm('3C0B8080')  # lui     $t3, 0x8080
+        self.asm('356B8080')  # ori     $t3, $t3, 0x8080        ; never a piece count
+        self.asm('AC8B002C')  # sw      $t3, 0x2C($a0)          ; store last remaining_pieces_array at player_data + 0x6874
+        self.asm('AC8B0030')  # sw      $t3, 0x30($a0)
 
         self.asm('3C098013')  # lui     $t1, 0x8013
         self.asm('3529AD44')  # ori     $t1, $t1, 0xAD44        ; x,y lut for remaining_pieces
@@ -1531,62 +1677,134 @@ class TheNewTetrisRom(BaseRom):
 
 
         item_display_func_addr = self.asm_addr
+        if multiline:
+            self.display_remaining_pieces_lines()
+        else:
+            self.asm('27bdffc0')  # addiu   $sp, $sp, -0x40
+            self.asm('afbf0024')  # sw      $ra, 0x24($sp)
+            self.asm('afa40040')  # sw      $a0, 0x40($sp)          ; player_data + 0x6848
+            self.asm('afa50044')  # sw      $a1, 0x44($sp)          ; num_players
+            self.asm('afb0003c')  # sw      $s0, 0x3C($sp)
+            self.asm('afb10038')  # sw      $s1, 0x38($sp)
+            self.asm('afb20034')  # sw      $s2, 0x34($sp)
+            self.asm('afb30030')  # sw      $s3, 0x30($sp)
+            self.asm('afb4002c')  # sw      $s4, 0x2C($sp)
+
+            self.asm('8fa80044')  # lw      $t0, 0x44($sp)          ; num_players
+            self.asm('2d090002')  # sltiu   $t1, $t0, 0x2
+            self.asm('11200016')  # beq     $t1, $zero, 0x58        ; branch if num_players >= 2
+            self.asm('8fb00040')  # lw      $s0, 0x40($sp)          ; player_data + 0x6848
+
+            self.asm('96120010')  # lhu     $s2, 0x10($s0)          ; x position for remaining_pieces
+            self.asm('96130012')  # lhu     $s3, 0x12($s0)          ; y position for remaining_pieces
+            self.asm('26140034')  # addiu   $s4, $s0, 0x34          ; s_remaining_pieces[0] at player_data + 0x687C
+
+            self.asm('24110007')  # addiu   $s1, $zero, 0x7
+
+            self.asm('82060000')  # lb      $a2, ($s0)              ; remaining_pieces[i]
+            self.asm('8208002c')  # lb      $t0, 0x2C($s0)          ; last remaining_pieces[i]
+            self.asm('10c80005')  # beq     $a2, $t0, 0x14          ; branch if remaining_pieces[i] is unchanged
+            self.asm('a206002c')  # sb      $a2, 0x2C($s0)          ; store last remaining_pieces[i]
+
+            self.asm('3c058013')  # lui     $a1, 0x8013
+            self.asm('34a5ad6e')  # ori     $a1, $a1, 0xAD6e        ; "%d"
+            self.asm('0c02d8b5')  # jal     func_800B62D4           ; sprintf()
+            self.asm('02802025')  # or      $a0, $s4, $zero         ; s_remaining_pieces[i]
+
+            # branch target for "remaining_pieces[i] is unchanged"
+            self.asm('02803025')  # or      $a2, $s4, $zero         ; s_remaining_pieces[i]
+            self.asm('02602825')  # or      $a1, $s3, $zero
+            self.asm(self.jal_display_text)  # jal     func_display_text
+            self.asm('02402025')  # or      $a0, $s2, $zero
+
+            self.asm('26730013')  # addiu   $s3, $s3, 0x13          ; move y to next line
+            self.asm('26940004')  # addiu   $s4, $s4, 4             ; next s_remaining_pieces
+            self.asm('2631ffff')  # addiu   $s1, $s1, -1
+            self.asm('1e20fff0')  # bgtz    $s1, -0x40
+            self.asm('26100001')  # addiu   $s0, $s0, 1
+
+            # branch target for "num_players >= 2"
+            self.asm('8fbf0024')  # lw      $ra, 0x24($sp)
+            self.asm('8fb0003c')  # lw      $s0, 0x3C($sp)
+            self.asm('8fb10038')  # lw      $s1, 0x38($sp)
+            self.asm('8fb20034')  # lw      $s2, 0x34($sp)
+            self.asm('8fb30030')  # lw      $s3, 0x30($sp)
+            self.asm('8fb4002c')  # lw      $s4, 0x2C($sp)
+            self.asm('03e00008')  # jr      $ra
+            self.asm('27bd0040')  # addiu   $sp, $sp, 0x40
+
+
+        self.next_sub_addr = self.asm_addr
+
+        if not direct:
+            self.ll_add_item(this_item_addr, next_item_addr, 0, item_init_func_addr, item_update_func_addr, item_display_func_addr)
+        return item_init_func_addr, item_update_func_addr, item_display_func_addr
+
+    def display_remaining_pieces_lines(self):
+        """
+        Display function of remaining_pieces as one multi-line text: a single
+        sprintf (only when a count changed) and a single display_text per frame.
+        """
         self.asm('27bdffc0')  # addiu   $sp, $sp, -0x40
         self.asm('afbf0024')  # sw      $ra, 0x24($sp)
         self.asm('afa40040')  # sw      $a0, 0x40($sp)          ; player_data + 0x6848
         self.asm('afa50044')  # sw      $a1, 0x44($sp)          ; num_players
         self.asm('afb0003c')  # sw      $s0, 0x3C($sp)
-        self.asm('afb10038')  # sw      $s1, 0x38($sp)
-        self.asm('afb20034')  # sw      $s2, 0x34($sp)
-        self.asm('afb30030')  # sw      $s3, 0x30($sp)
 
         self.asm('8fa80044')  # lw      $t0, 0x44($sp)          ; num_players
         self.asm('2d090002')  # sltiu   $t1, $t0, 0x2
-        self.asm('11200011')  # beq     $t1, $zero, 0x44        ; branch if num_players >= 2
+        self.asm('1120001f')  # beq     $t1, $zero, 0x7C        ; branch if num_players >= 2
         self.asm('8fb00040')  # lw      $s0, 0x40($sp)          ; player_data + 0x6848
 
-        self.asm('96120010')  # lhu     $s2, 0x10($s0)          ; x position for remaining_pieces
-        self.asm('96130012')  # lhu     $s3, 0x12($s0)          ; y position for remaining_pieces
-
-        self.asm('24110007')  # addiu   $s1, $zero, 0x7
+        self.asm('8e080000')  # lw      $t0, 0x0($s0)           ; remaining_pieces_array[0-3]
+        self.asm('8e090004')  # lw      $t1, 0x4($s0)           ; remaining_pieces_array[4-6], total_remaining_pieces
+        self.asm('8e0a002c')  # lw      $t2, 0x2C($s0)          ; last remaining_pieces_array[0-3]
+        self.asm('8e0b0030')  # lw      $t3, 0x30($s0)          ; last remaining_pieces_array[4-7]
+        self.asm('150a0003')  # bne     $t0, $t2, 0xC           ; branch if remaining_pieces_array[0-3] changed
+        self.asm('00000000')  # nop
+        self.asm('112b0013')  # beq     $t1, $t3, 0x4C          ; branch if remaining_pieces_array[4-7] is unchanged
+        self.asm('00000000')  # nop
 
-        self.asm('82060000')  # lb      $a2, ($s0)              ; remaining_pieces[i]
+        # branch target for "remaining_pieces_array[0-3] changed"
+        self.asm('ae08002c')  # sw      $t0, 0x2C($s0)          ; store last remaining_pieces_array
+        self.asm('ae090030')  # sw      $t1, 0x30($s0)
+        self.asm('820c0002')  # lb      $t4, 0x2($s0)           ; remaining_pieces[2]
+        self.asm('afac0010')  # sw      $t4, 0x10($sp)
+        self.asm('820c0003')  # lb      $t4, 0x3($s0)           ; [3]
+        self.asm('afac0014')  # sw      $t4, 0x14($sp)
+        self.asm('820c0004')  # lb      $t4, 0x4($s0)           ; [4]
+        self.asm('afac0018')  # sw      $t4, 0x18($sp)
+        self.asm('820c0005')  # lb      $t4, 0x5($s0)           ; [5]
+        self.asm('afac001c')  # sw      $t4, 0x1C($sp)
+        self.asm('820c0006')  # lb      $t4, 0x6($s0)           ; [6]
+        self.asm('afac0020')  # sw      $t4, 0x20($sp)
+        self.asm('82070001')  # lb      $a3, 0x1($s0)           ; [1]
+        self.asm('82060000')  # lb      $a2, 0x0($s0)           ; [0]
         self.asm('3c058013')  # lui     $a1, 0x8013
-        self.asm('34a5ad6e')  # ori     $a1, $a1, 0xAD6e        ; "%d"
+        self.asm('34a5acd8')  # ori     $a1, $a1, 0xACD8        ; "%d\n%d\n%d\n%d\n%d\n%d\n%d"
         self.asm('0c02d8b5')  # jal     func_800B62D4           ; sprintf()
-        self.asm('27a40028')  # addiu   $a0, $sp, 0x28          ; s_remaining_pieces
+        self.asm('26040034')  # addiu   $a0, $s0, 0x34          ; s_remaining_pieces at player_data + 0x687C
 
-        self.asm('27a60028')  # addiu   $a2, $sp, 0x28          ; s_remaining_pieces
-        self.asm('02602825')  # or      $a1, $s3, $zero
+        # branch target for "remaining_pieces_array[4-7] is unchanged"
+        self.asm('26060034')  # addiu   $a2, $s0, 0x34          ; s_remaining_pieces
+        self.asm('96050012')  # lhu     $a1, 0x12($s0)          ; y position for remaining_pieces
         self.asm(self.jal_display_text)  # jal     func_display_text
-        self.asm('02402025')  # or      $a0, $s2, $zero
-
-        self.asm('26730013')  # addiu   $s3, $s3, 0x13          ; move y to next line
-        self.asm('2631ffff')  # addiu   $s1, $s1, -1
-        self.asm('1e20fff4')  # bgtz    $s1, -0x30
-        self.asm('26100001')  # addiu   $s0, $s0, 1
+        self.asm('96040010')  # lhu     $a0, 0x10($s0)          ; x position for remaining_pieces
 
         # branch target for "num_players >= 2"
         self.asm('8fbf0024')  # lw      $ra, 0x24($sp)
         self.asm('8fb0003c')  # lw      $s0, 0x3C($sp)
-        self.asm('8fb10038')  # lw      $s1, 0x38($sp)
-        self.asm('8fb20034')  # lw      $s2, 0x34($sp)
-        self.asm('8fb30030')  # lw      $s3, 0x30($sp)
         self.asm('03e00008')  # jr      $ra
         self.asm('27bd0040')  # addiu   $sp, $sp, 0x40
 
-
-        self.next_sub_addr = self.asm_addr
-
-        self.ll_add_item(this_item_addr, next_item_addr, 0, item_init_func_addr, item_update_func_addr, item_display_func_addr)
-
+    @patch
     def enable_extra_lookahead(self):
         this_item_addr = 0x100F7C  # 8013ACFC
         self.ll_update_item_flags(this_item_addr, 1)
 
-    def register_extra_lookahead(self):
+    @patch
+    def register_extra_lookahead(self, next_item_addr=None, direct=False):
         this_item_addr = 0x100F7C  # 8013ACFC
-        next_item_addr = None
 
         self.asm_addr = self.next_sub_addr
 
@@ -1656,7 +1874,296 @@ class TheNewTetrisRom(BaseRom):
 
         self.next_sub_addr = self.asm_addr
 
-        self.ll_add_item(this_item_addr, next_item_addr, 0, item_init_func_addr, item_update_func_addr, item_display_func_addr)
+        if not direct:
+            self.ll_add_item(this_item_addr, next_item_addr, 0, item_init_func_addr, item_update_func_addr, item_display_func_addr)
+        return item_init_func_addr, item_update_func_addr, item_display_func_addr
+
+    @patch
+    def enable_frame_times(self):
+        this_item_addr = 0x100F44  # 8013ACC4
+        self.ll_update_item_flags(this_item_addr, 1)
+
+    @patch
+    def register_frame_times(self, next_item_addr=None, direct=False):
+        """
+        Histogram of the time between frames, from the count register (half the
+        cpu clock), kept in frame_time_histogram and mirrored into sram.
+
+        The histogram is written through kseg1, so that it is in rdram when the
+        pi copies it.  The copy is a raw pi dma (as osPiRawStartDma would do),
+        made with interrupts disabled, and only when the pi is idle with no
+        interrupt pending; its own interrupt is cleared before they are enabled
+        again, so the game's pi manager never sees it.  The sram's domain was
+        set up by the game when it loaded the saves.  The wait for the sram
+        write (0x110 bytes) shows up in the next frame time.
+        """
+        this_item_addr = 0x100F44  # 8013ACC4
+
+        histogram = self.virt(STATIC_DATA['frame_time_histogram'][0])
+        uncached = (histogram | 0x20000000).to_bytes(4, byteorder='big')  # kseg1
+        physical = (histogram & 0x1FFFFFFF).to_bytes(4, byteorder='big')
+        sram = (0x08000000 + FRAME_TIMES_SRAM).to_bytes(4, byteorder='big')
+        size = len(STATIC_DATA['frame_time_histogram'][1])
+
+        self.asm_addr = self.next_sub_addr
+
+
+        item_init_func_addr = self.asm_addr
+        self.asm('40084800')  # mfc0    $t0, $9                 ; count
+        self.asm('03E00008')  # jr      $ra
+        self.asm('AC880050')  # sw      $t0, 0x50($a0)          ; store count at player_data + 0x6898
+
+
+        item_update_func_addr = None
+
+
+        item_display_func_addr = self.asm_addr
+        self.asm('40084800')  # mfc0    $t0, $9                 ; count
+        self.asm('8C890050')  # lw      $t1, 0x50($a0)          ; last count
+        self.asm('AC880050')  # sw      $t0, 0x50($a0)
+        self.asm('01095023')  # subu    $t2, $t0, $t1           ; frame time
+        self.asm((0x000A5002 | FRAME_TIME_SHIFT << 6).to_bytes(4, byteorder='big'))  # srl     $t2, $t2, FRAME_TIME_SHIFT
+        self.asm((0x2D4B0000 | FRAME_TIME_BUCKETS).to_bytes(4, byteorder='big'))  # sltiu   $t3, $t2, FRAME_TIME_BUCKETS
+        self.asm('15600002')  # bne     $t3, $zero, 0x8         ; branch if bucket < FRAME_TIME_BUCKETS
+        self.asm('00000000')  # nop
+        self.asm((0x240A0000 | FRAME_TIME_BUCKETS - 1).to_bytes(4, byteorder='big'))  # addiu   $t2, $zero, FRAME_TIME_BUCKETS - 1
+
+        # branch target for "bucket < FRAME_TIME_BUCKETS"
+        self.asm('000A5080')  # sll     $t2, $t2, 2             ; buckets are ints
+        self.asm(b'\x3C\x0C' + uncached[0 : 2])  # lui     $t4, ...
+        self.asm(b'\x35\x8C' + uncached[2 : 4])  # ori     $t4, $t4, ...           ; frame_time_histogram (uncached)
+        self.asm('018A6821')  # addu    $t5, $t4, $t2
+        self.asm('8DAE0010')  # lw      $t6, 0x10($t5)          ; buckets[bucket]
+        self.asm('25CE0001')  # addiu   $t6, $t6, 1
+        self.asm('ADAE0010')  # sw      $t6, 0x10($t5)
+        self.asm('8D8F0008')  # lw      $t7, 0x8($t4)           ; frames
+        self.asm('25EF0001')  # addiu   $t7, $t7, 1
+        self.asm('AD8F0008')  # sw      $t7, 0x8($t4)
+        self.asm((0x31F80000 | FRAME_TIMES_PERIOD - 1).to_bytes(4, byteorder='big'))  # andi    $t8, $t7, FRAME_TIMES_PERIOD - 1
+        self.asm('17000018')  # bne     $t8, $zero, 0x60        ; branch if frames % FRAME_TIMES_PERIOD != 0
+        self.asm('3C08A460')  # lui     $t0, 0xA460             ; pi registers
+
+        self.asm('40196000')  # mfc0    $t9, $12                ; status
+        self.asm('2409FFFE')  # addiu   $t1, $zero, -0x2
+        self.asm('03294824')  # and     $t1, $t9, $t1           ; clear IE
+        self.asm('40896000')  # mtc0    $t1, $12                ; disable interrupts
+        self.asm(b'\x3C\x0A' + physical[0 : 2])  # lui     $t2, ...
+        self.asm(b'\x35\x4A' + physical[2 : 4])  # ori     $t2, $t2, ...           ; frame_time_histogram (physical)
+
+        self.asm('8D090010')  # lw      $t1, 0x10($t0)          ; PI_STATUS
+        self.asm('3129000B')  # andi    $t1, $t1, 0xB           ; dma busy, io busy, interrupt
+        self.asm('1520000D')  # bne     $t1, $zero, 0x34        ; branch if pi busy or interrupt pending (mirror next period)
+        self.asm('00000000')  # nop
+
+        self.asm('AD0A0000')  # sw      $t2, 0x0($t0)           ; PI_DRAM_ADDR
+        self.asm(b'\x3C\x0A' + sram[0 : 2])  # lui     $t2, ...
+        self.asm(b'\x35\x4A' + sram[2 : 4])  # ori     $t2, $t2, ...           ; sram + FRAME_TIMES_SRAM
+        self.asm('AD0A0004')  # sw      $t2, 0x4($t0)           ; PI_CART_ADDR
+        self.asm((0x240A0000 | size - 1).to_bytes(4, byteorder='big'))  # addiu   $t2, $zero, size - 1
+        self.asm('AD0A0008')  # sw      $t2, 0x8($t0)           ; PI_RD_LEN, rdram to sram
+
+        # wait for the dma
+        self.asm('8D090010')  # lw      $t1, 0x10($t0)          ; PI_STATUS
+        self.asm('31290003')  # andi    $t1, $t1, 0x3
+        self.asm('1520FFFD')  # bne     $t1, $zero, -0xC        ; branch if pi busy
+        self.asm('00000000')  # nop
+        self.asm('24090002')  # addiu   $t1, $zero, 0x2
+        self.asm('AD090010')  # sw      $t1, 0x10($t0)          ; clear pi interrupt
+
+        # branch target for "pi busy or interrupt pending"
+        self.asm('40996000')  # mtc0    $t9, $12                ; restore interrupts
+
+        # branch target for "frames % FRAME_TIMES_PERIOD != 0"
+        self.asm('03E00008')  # jr      $ra
+        self.asm('00000000')  # nop
+
+
+        self.next_sub_addr = self.asm_addr
+
+        if not direct:
+            self.ll_add_item(this_item_addr, next_item_addr, 0, item_init_func_addr, item_update_func_addr, item_display_func_addr)
+        return item_init_func_addr, item_update_func_addr, item_display_func_addr
+
+    def link_experimental_features(self, seed=False, piece_count=False, remaining_pieces=False, extra_lookahead=False, frame_times=False, direct=False, multiline=False):
+        """
+        Emits only the code and static data that the enabled features reference
+        (call move_heap() first).  Disabled items are left out of the linked
+        list instead of being registered with their flags cleared.
+        With direct, the player stats routines jal the enabled item functions
+        instead of traversing a linked list (no items can be toggled at runtime).
+        With multiline, remaining_pieces is drawn as one text.
+        frame_times records a histogram of frame times into sram.
+        Returns the linker, for its layout.
+        """
+        linker = Linker(self, *CODE_WINDOW)
+
+        items = [name for name, enabled in (('piece_count', piece_count), ('remaining_pieces', remaining_pieces), ('extra_lookahead', extra_lookahead), ('frame_times', frame_times)) if enabled]
+        item_addrs = [STATIC_DATA['item_' + name][0] for name in items]
+        # the list starts at the first enabled item, and each item links to the next enabled one
+        list_head = item_addrs[0] if item_addrs else None
+        next_items = dict(zip(items, item_addrs[1:] + [None]))
+        # direct mode: (init, update, display) function addresses of each item
+        funcs = {}
+
+        def item_funcs(kind):
+            if not direct:
+                return None
+            return [funcs[name][kind] for name in items if funcs[name][kind] is not None]
+
+        linker.add_code('func_display_text', self.func_display_text)
+        for name, (addr, raw) in STATIC_DATA.items():
+            linker.add_data(name, addr, len(raw), lambda name=name: self.init_static_data([name]))
+
+        walkers = ['init_player_stats', 'update_player_stats', 'display_player_stats']
+        walker_deps = ['player_data'] + (items if direct else [])
+        linker.add_patch('player_data', self.heap_alloc_player_data)
+        linker.add_code('init_player_stats', lambda: self.init_player_stats(list_head, item_funcs(0)), walker_deps)
+        linker.add_code('update_player_stats', lambda: self.update_player_stats(list_head, item_funcs(1)), walker_deps)
+        linker.add_code('display_player_stats', lambda: self.display_player_stats(list_head, item_funcs(2)), walker_deps)
+
+        linker.add_code('save_seed', self.save_seed, ['seed', 'fmt_seed', 's_seed'])
+        linker.add_code('display_seed', self.display_seed, ['save_seed', 's_seed'])
+
+        def item(name, register, enable):
+            if name == 'remaining_pieces':
+                funcs[name] = register(next_items[name], direct, multiline)
+            else:
+                funcs[name] = register(next_items[name], direct)
+            for kind, func in zip(('init', 'update', 'display'), funcs[name]):
+                if func is not None:
+                    linker.define(f"{name}.{kind}", func)
+            if not direct:
+                enable()
+
+        for name, register, enable, data in (
+                ('piece_count', self.register_piece_count, self.enable_piece_count, ['func_display_text', 'fmt_counts', 'xy_piece_count']),
+                ('remaining_pieces', self.register_remaining_pieces, self.enable_remaining_pieces, ['func_display_text', 'fmt_remaining_lines' if multiline else 'fmt_counts', 'xy_remaining_pieces']),
+                ('extra_lookahead', self.register_extra_lookahead, self.enable_extra_lookahead, ['func_display_text', 'fmt_lookahead', 'xy_extra_lookahead']),
+                ('frame_times', self.register_frame_times, self.enable_frame_times, ['frame_time_histogram'])):
+            # in list mode the items reference the walkers, in direct mode the walkers reference the items
+            deps = data + ([] if direct else ['item_' + name] + walkers)
+            linker.add_code(name, lambda name=name, register=register, enable=enable: item(name, register, enable), deps)
+
+        roots = items + (walkers if direct and items else []) + (['display_seed'] if seed else [])
+        if roots:
+            roots.append('overlay_symbols')
+        linker.link(roots)
+        if roots:
+            self.write_overlay_symbols(linker.code_symbols())
+        return linker
+
+    @patch
+    def write_overlay_symbols(self, symbols):
+        """
+        Fills the overlay_symbols table with {rom address: name}.
+        """
+        addr, reserved = STATIC_DATA['overlay_symbols']
+        if (len(symbols) + 1) * OVERLAY_SYMBOL_SIZE > len(reserved):
+            print(f"link error: {len(symbols)} symbols do not fit in overlay_symbols", file=sys.stderr)
+            sys.exit(1)
+
+        table = bytearray()
+        for func, name in sorted(symbols.items()):
+            raw = name.encode('ascii')
+            if len(raw) >= OVERLAY_SYMBOL_SIZE - 4:
+                print(f"link error: symbol name is too long: {name}", file=sys.stderr)
+                sys.exit(1)
+            table += self.virt(func).to_bytes(4, byteorder='big') + raw.ljust(OVERLAY_SYMBOL_SIZE - 4, b'\x00')
+        self.insert_bytes(addr, table, amend=True)
+
+    def hooked_routines(self):
+        """
+        {name: vaddr} of the injected routines whose hooks are in place.
+        """
+        start, end = self.virt(CODE_WINDOW[0]), self.virt(CODE_WINDOW[1])
+        routines = {}
+        for name, (addr, original) in HOOKS.items():
+            word = int.from_bytes(self.data[addr : addr + 4], byteorder='big')
+            vaddr = 0x80000000 | ((word & 0x3FFFFFF) << 2)
+            if word != original and word >> 26 == 0b000011 and start <= vaddr < end:
+                routines[name] = vaddr
+        return routines
+
+    def overlay_symbols(self):
+        """
+        {vaddr: name} of the hooked routines and of the functions recorded in
+        the overlay_symbols table when they were linked.
+        """
+        symbols = {vaddr: name for name, vaddr in self.hooked_routines().items()}
+        addr, reserved = STATIC_DATA['overlay_symbols']
+        for offset in range(0, len(reserved), OVERLAY_SYMBOL_SIZE):
+            entry = self.data[addr + offset : addr + offset + OVERLAY_SYMBOL_SIZE]
+            vaddr = int.from_bytes(entry[0 : 4], byteorder='big')
+            if vaddr == 0:
+                break
+            symbols.setdefault(vaddr, entry[4:].rstrip(b'\x00').decode('ascii'))
+        return symbols
+
+    def profile_overlays(self, num_players=1, frames=60, piece_frames=1, stub_cycles=None, seed=0x1234ABCD):
+        """
+        Runs the injected routines in the mips interpreter against synthetic
+        player_data: save_seed and init_player_stats at the start of a game,
+        then each frame display_player_stats for every player and display_seed,
+        with update_player_stats (a new piece) every piece_frames frames.
+        Game functions are stubs; stub_cycles ({name: cycles}) estimates their cost.
+        """
+        mem = mips.Memory()
+        mem.load(self.virt(0x1000), bytes(self.data[0x1000:0x101000]))
+
+        texts = []
+
+        def display_text(cpu):
+            texts.append((cpu.arg(2), cpu.arg(3), cpu.mem.read_string(cpu.arg(4)).decode('latin-1')))
+
+        stubs = {vaddr: (name, lambda cpu: None) for vaddr, name in GAME_FUNCTIONS.items()}
+        stubs[0x800B62D4] = ('sprintf', mips.sprintf_stub)
+        stubs[0x80077960] = ('display_text', display_text)
+        cpu = mips.Cpu(mem, stubs, stub_cycles, code_range=(self.virt(CODE_WINDOW[0]), self.virt(CODE_WINDOW[1])))
+
+        routines = self.hooked_routines()
+
+        def run(name, *args):
+            if name in routines:
+                cpu.call(routines[name], args, sp=PROFILE_STACK)
+
+        # a bag of upcoming pieces (buf25 at player_data + 0x6698) for each player
+        rng = np.random.default_rng(seed)
+        players = [PROFILE_PLAYER_DATA + i * PROFILE_PLAYER_DATA_SIZE for i in range(num_players)]
+        for player_data in players:
+            mem.load(player_data + 0x6698, rng.integers(0, 7, 25).astype('>u4').tobytes())
+
+        mem.write(NUM_PLAYERS_ADDR, 1, num_players)
+        run('save_seed', seed)
+        for i, player_data in enumerate(players):
+            mem.write(CUR_PLAYER_ADDR, 1, i)
+            run('init_player_stats', player_data + 0x6690, PROFILE_STACK)
+
+        frame_instructions = []
+        frame_cycles = []
+        for frame in range(frames):
+            instructions = cpu.instructions
+            cycles = cpu.cycles
+            del texts[:]
+            for player_data in players:
+                if frame % piece_frames == 0:
+                    # next_idx and refill_idx
+                    n = frame // piece_frames
+                    mem.write(player_data + 0x6690, 4, (n + 1) % 25)
+                    mem.write(player_data + 0x6694, 4, n % 25)
+                    run('update_player_stats', player_data + 0x6690)
+                run('display_player_stats', player_data + 0x6808)
+            run('display_seed')
+            frame_instructions.append(cpu.instructions - instructions)
+            frame_cycles.append(cpu.cycles - cycles)
+
+        symbols = self.overlay_symbols()
+        return {
+            'routines': {symbols.get(entry, f"{entry:08X}"): tuple(totals) for entry, totals in cpu.calls.items()},
+            'stub_calls': dict(cpu.stub_calls),
+            'frame_instructions': frame_instructions,
+            'frame_cycles': frame_cycles,
+            'texts': list(texts),
+        }
 
     """
     def shift_piece(self, position, value):
@@ -1665,16 +2172,19 @@ class TheNewTetrisRom(BaseRom):
         self.data[addr1 + position: addr1 + position + 1] = bytes([value])
     """
 
+    @patch
     def modify_fps(self):
         addr1 = 0x096160
-        self.data[addr1 : addr1 + 1] = b'\x01'
+        self.insert_bytes(addr1, b'\x01')
 
+    @patch
     def modify_handicap(self, value):
         addr1 = 0x096180
         value &= 0xFF
-        self.data[addr1 : addr1 + 1] = bytes([value])
+        self.insert_bytes(addr1, bytes([value]))
 
     # Sets piece fall acceleration to 0.0, so that there is no speedup
+    @patch
     def modify_pieceFallAcceleration(self):
         addr1 = 0x0961E0
-        self.data[addr1 : addr1 + 4] = b'\x00\x00\x00\x00'
+        self.insert_bytes(addr1, b'\x00\x00\x00\x00')
@@ -1,22 +1,167 @@
+import os
 import sys
+import struct
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+BANKS = (0x0, 0x1900, 0x3200)
+BANK_SIZE = 0x1900
+CHECKSUM_OFFSET = 0x18FC
+
+# encoding: (encode value to a tuple for struct.pack, decode the unpacked tuple)
+ENCODINGS = {
+    'int': (lambda v: (v,), lambda t: t[0]),
+    # music and sfx levels 1-14 are stored as (level - 1) * 0x924
+    'level': (lambda v: ((v - 1) * 0x924,), lambda t: t[0] // 0x924 + 1),
+    # odd bits in the first word, even bits in the second
+    'split_bits': (lambda v: (v & 0xAAAAAAAA, v & 0x55555555), lambda t: t[0] | t[1]),
+}
+
+# name: (struct format, offset within a bank, encoding); every field is replicated in all BANKS
+FIELDS = {
+    'total_wonder_lines': ('>2I', 0xF04, 'split_bits'),
+    'music_level': ('>I', 0x639 * 4, 'level'),
+    'sfx_level': ('>I', 0x63A * 4, 'level'),
+    'song': ('>I', 0x63B * 4, 'int'),
+    'music_mode': ('>I', 0x63C * 4, 'int'),
+}
+
+def mask_ranges(mask):
+    """
+    [start, end) ranges of the True runs of a boolean array.
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+    return list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+class Field:
+    def __init__(self, name, fmt, offset, encoding):
+        self.name = name
+        self.struct = struct.Struct(fmt)
+        self.offset = offset
+        self.encode, self.decode = ENCODINGS[encoding]
+        self.count = len(self.struct.unpack(bytes(self.struct.size)))
+
+    def pack(self, value):
+        return self.struct.pack(*self.encode(value))
+
+    def unpack_from(self, data, start):
+        return self.decode(self.struct.unpack_from(data, start + self.offset))
+
+def compile_fields(fields):
+    """
+    Returns the Field objects, by offset, and a single struct.Struct that
+    unpacks all of them (with pad bytes between) in one call.
+    """
+    compiled = sorted((Field(name, *spec) for name, spec in fields.items()), key=lambda field: field.offset)
+
+    fmt = '>'
+    pos = compiled[0].offset
+    for field in compiled:
+        if field.offset < pos:
+            raise ValueError(f"Field {field.name} overlaps the previous field")
+        if field.offset > pos:
+            fmt += f"{field.offset - pos}x"
+        fmt += field.struct.format.lstrip('>')
+        pos = field.offset + field.struct.size
+    return compiled, struct.Struct(fmt)
+
+COMPILED_FIELDS, FIELDS_STRUCT = compile_fields(FIELDS)
+FIELD_BY_NAME = {field.name: field for field in COMPILED_FIELDS}
+
+# bank offsets that are not schema fields
+REGIONS = {
+    'magic': (0x18F8, 0x18FC),
+    'checksum': (CHECKSUM_OFFSET, CHECKSUM_OFFSET + 4),
+}
+
+def names_at(start, end):
+    """
+    Names of the schema fields and regions overlapping bank offsets [start, end).
+    """
+    names = [field.name for field in COMPILED_FIELDS if field.offset < end and start < field.offset + field.struct.size]
+    names += [name for name, (r_start, r_end) in REGIONS.items() if r_start < end and start < r_end]
+    return names
+
+def diff_saves(srams):
+    """
+    Compares N saves (internal big endian layout, same size).  Returns a list of
+    (start, end, banks, names): bank offset ranges where any save differs from
+    the first, folded across the three banks, with the banks they differ in and
+    the names at those offsets.  Ranges past the banks have absolute offsets and
+    banks = [].
+    """
+    data = np.stack([np.frombuffer(sram.data, dtype=np.uint8) for sram in srams])
+    changed = (data != data[0]).any(axis=0)
+    banked = changed[: len(BANKS) * BANK_SIZE].reshape(len(BANKS), BANK_SIZE)
+
+    # split ranges where fields and regions begin or end, so each maps to at most one name
+    edges = sorted({field.offset for field in COMPILED_FIELDS} | {field.offset + field.struct.size for field in COMPILED_FIELDS} |
+                   {edge for region in REGIONS.values() for edge in region})
+    ranges = []
+    for start, end in mask_ranges(banked.any(axis=0)):
+        cuts = [start] + [edge for edge in edges if start < edge < end] + [end]
+        ranges += [(a, b) for a, b in zip(cuts, cuts[1:]) if banked[:, a:b].any()]
+
+    diffs = []
+    for start, end in ranges:
+        banks = [bank for bank, bank_changed in zip(BANKS, banked[:, start:end].any(axis=1)) if bank_changed]
+        diffs.append((start, end, banks, names_at(start, end)))
+
+    tail = len(BANKS) * BANK_SIZE
+    for start, end in mask_ranges(changed[tail:]):
+        diffs.append((tail + start, tail + end, [], []))
+    return diffs
+
+# frame time histogram that tnt-modify.py -X --frametimes mirrors past the banks
+# (see register_frame_times in n64tetris.roms.tnt): one sample per player per
+# frame, bucket i counting count register deltas in [i, i + 1) << shift, the
+# last bucket everything longer
+FRAME_TIMES_SRAM = 0x7000
+FRAME_TIMES_MAGIC = b'FTH1'
+FRAME_TIME_BUCKETS = 64
+FRAME_TIMES_DTYPE = np.dtype([('magic', 'S4'), ('shift', '>u4'), ('frames', '>u4'), ('reserved', '>u4'), ('buckets', '>u4', FRAME_TIME_BUCKETS)])
+COUNT_HZ = 46875000  # half the cpu clock
+
+def frame_time_stats(histogram, percentiles=(50, 95, 99)):
+    """
+    Bucket edges in ms, and the given percentiles of the frame time in ms (as
+    the upper edge of the bucket they fall in; None for the open last bucket).
+    """
+    buckets = histogram['buckets'].astype(np.int64)
+    edges = np.arange(len(buckets) + 1) * (1 << int(histogram['shift'])) * 1000 / COUNT_HZ
+    cumulative = np.cumsum(buckets)
+    stats = {}
+    for p in percentiles:
+        i = int(np.searchsorted(cumulative, cumulative[-1] * p / 100))
+        stats[p] = float(edges[i + 1]) if i < len(buckets) - 1 else None
+    return edges, stats
+
+# one row per save of a batch, see process_saves()
+RESULT_DTYPE = np.dtype([('file', 'U256')] + [(name, '<u4') for name in FIELDS] + [('checksums_ok', '?'), ('banks_agree', '?')])
+
+class SramError(Exception):
+    pass
 
 class TheNewTetrisSram:
     def __init__(self, verbose=False):
         self.verbose = verbose
         self.data = bytearray()  # big endian
         self.orig_endianness = None
+        self.checksums = {}  # bank start -> checksum of its current data
+        self.dirty = []  # (start, end) ranges written since from_file()
 
     def reverse_endianness(self, data):
-        reversed_data = bytearray()
-        i = 0
-        while i < len(data):
-            x = data[i : i + 4]
-            x.reverse()
-            reversed_data.extend(x)
-            i += 4
+        n = len(data) & ~3
+        reversed_data = bytearray(np.frombuffer(data, dtype='>u4', count=n // 4).byteswap().tobytes())
+        # a trailing partial word is reversed on its own
+        reversed_data.extend(data[n:][::-1])
         return reversed_data
 
     def from_file(self, filename):
+        """
+        Raises SramError if the file is not a save (or is too short for its banks).
+        """
         data = bytearray(open(filename, 'rb').read())
         magic_bytes = data[0x18F8 : 0x18FC]
 
@@ -28,56 +173,199 @@ class TheNewTetrisSram:
             # convert to big endian for internal use
             self.data = self.reverse_endianness(data)
         else:
-            print("error: Unknown file type", file=sys.stderr)
-            sys.exit(1)
+            raise SramError(f"Unknown file type: {filename}")
 
-    def to_file(self, filename):
-        self.update_checksum(0x0)
-        self.update_checksum(0x1900)
-        self.update_checksum(0x3200)
+        size = len(BANKS) * BANK_SIZE
+        if len(data) < size:
+            raise SramError(f"Truncated save ({len(data)} < {size} bytes): {filename}")
 
+        self.reset_checksums()
+
+    def reset_checksums(self):
+        """
+        Recalculates each bank's checksum, after self.data was changed other than through write().
+        """
+        self.checksums = {start: self.calc_checksum(start, CHECKSUM_OFFSET) for start in BANKS}
+        self.dirty = []
+
+    def file_bytes(self, data):
         if self.orig_endianness == 'big':
-            data = self.data
+            return data
         elif self.orig_endianness == 'little':
             # convert back to little endian
-            data = self.reverse_endianness(self.data)
+            return self.reverse_endianness(data)
         else:
-            print("error: Unknown file type", file=sys.stderr)
-            sys.exit(1)
+            raise SramError("Unknown file type")
 
-        open(filename, 'wb').write(data)
+    def to_file(self, filename):
+        for start in BANKS:
+            self.update_checksum(start)
+
+        open(filename, 'wb').write(self.file_bytes(self.data))
+        self.dirty = []
+
+    def update_file(self, filename):
+        """
+        Writes only the ranges changed since from_file() (and the checksums) into
+        filename, which must be the file that was loaded.
+        """
+        for start in BANKS:
+            self.update_checksum(start)
+
+        with open(filename, 'r+b') as f:
+            for start, end in self.dirty_ranges():
+                f.seek(start)
+                f.write(self.file_bytes(self.data[start:end]))
+        self.dirty = []
+
+    def dirty_ranges(self):
+        """
+        Merged dirty ranges, widened to whole words so they can be byte swapped.
+        """
+        ranges = []
+        for start, end in sorted(self.dirty):
+            start &= ~3
+            end = (end + 3) & ~3
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return ranges
 
     def update_checksum(self, start):
-        checksum = self.calc_checksum(start, 0x18FC)
-        self.write(checksum, start, 0x18FC, 4)
+        checksum = self.checksums[start]
+        self.write(checksum, start, CHECKSUM_OFFSET, 4)
         if self.verbose:
-            print(f"Writing checksum at 0x{start+0x18FC:04X} to 0x{checksum:08X}")
+            print(f"Writing checksum at 0x{start+CHECKSUM_OFFSET:04X} to 0x{checksum:08X}")
 
     def calc_checksum(self, start, length):
-        checksum = 0
-        i = 0
-        while i < length:
-            a, b, c, d = self.data[start + i : start + i + 4]
-            checksum += a ^ 0x10
-            checksum += b ^ 0x20
-            checksum -= c
-            checksum -= d << 1
-            i += 4
+        words = np.frombuffer(self.data, dtype=np.uint8, count=length, offset=start).reshape(-1, 4)
+        a, b, c, d = words.astype(np.int64).T
+        checksum = int(((a ^ 0x10) + (b ^ 0x20) - c - (d << 1)).sum())
         return checksum & 0xFFFFFFFF
 
+    def banks(self):
+        """
+        A (3, BANK_SIZE) uint8 array copy of the three banks.
+        """
+        return np.stack([np.frombuffer(self.data, dtype=np.uint8, count=BANK_SIZE, offset=start) for start in BANKS])
+
+    def verify(self):
+        """
+        Returns (checksums_ok, ranges): whether each bank's stored checksum is
+        valid, and the [start, end) bank offsets where the banks differ.
+        """
+        checksums_ok = [int.from_bytes(self.data[start + CHECKSUM_OFFSET : start + CHECKSUM_OFFSET + 4], byteorder='big') ==
+                        self.calc_checksum(start, CHECKSUM_OFFSET) for start in BANKS]
+        banks = self.banks()
+        ranges = mask_ranges((banks[0] != banks[1]) | (banks[1] != banks[2]))
+
+        if self.verbose:
+            for r_start, r_end in ranges:
+                print(f"Banks differ at 0x{r_start:04X}-0x{r_end:04X}: " +
+                      ", ".join(banks[i, r_start:r_end].tobytes().hex() for i in range(len(BANKS))))
+
+        return checksums_ok, ranges
+
+    def repair(self):
+        """
+        Rewrites every bank with the per byte majority of the three banks.
+        Where all three differ, the first bank with a valid checksum wins
+        (bank 0x0 if none is valid).  Returns the repaired ranges.
+        """
+        checksums_ok, ranges = self.verify()
+        if not ranges:
+            return ranges
+
+        banks = self.banks()
+        fallback = banks[checksums_ok.index(True) if True in checksums_ok else 0]
+        majority = np.where(banks[0] == banks[1], banks[0],
+                   np.where(banks[1] == banks[2], banks[1],
+                   np.where(banks[0] == banks[2], banks[0], fallback)))
+
+        for i, start in enumerate(BANKS):
+            for r_start, r_end in mask_ranges(banks[i] != majority):
+                self.write_bytes(majority[r_start:r_end].tobytes(), start, r_start)
+                if self.verbose:
+                    print(f"Repaired bank 0x{start:04X} at 0x{r_start:04X}-0x{r_end:04X}")
+
+        return ranges
+
+    @staticmethod
+    def checksum_terms(offset, data):
+        """
+        Contribution of data, at offset within a bank, to the bank's checksum.
+        """
+        total = 0
+        for i, x in enumerate(data, offset):
+            if i >= CHECKSUM_OFFSET:
+                break
+            k = i & 3
+            if k == 0:
+                total += x ^ 0x10
+            elif k == 1:
+                total += x ^ 0x20
+            elif k == 2:
+                total -= x
+            else:
+                total -= x << 1
+        return total
+
     def write(self, value, start, offset, nbytes):
-        self.data[start + offset : start + offset + nbytes] = value.to_bytes(nbytes, byteorder='big')
+        self.write_bytes(value.to_bytes(nbytes, byteorder='big'), start, offset)
+
+    def write_bytes(self, new, start, offset):
+        nbytes = len(new)
+        old = self.data[start + offset : start + offset + nbytes]
+        self.data[start + offset : start + offset + nbytes] = new
+        self.dirty.append((start + offset, start + offset + nbytes))
+
+        # the checksum is a sum of per byte terms, so only the written bytes change it
+        if start in self.checksums:
+            delta = self.checksum_terms(offset, new) - self.checksum_terms(offset, old)
+            self.checksums[start] = (self.checksums[start] + delta) & 0xFFFFFFFF
 
     def write_thrice(self, value, offset, nbytes):
-        self.write(value, 0x0, offset, nbytes)
-        self.write(value, 0x1900, offset, nbytes)
-        self.write(value, 0x3200, offset, nbytes)
+        for start in BANKS:
+            self.write(value, start, offset, nbytes)
+
+    def frame_times(self):
+        """
+        The FRAME_TIMES_DTYPE record mirrored by --frametimes, or None if there is none.
+        """
+        if len(self.data) < FRAME_TIMES_SRAM + FRAME_TIMES_DTYPE.itemsize:
+            return None
+        histogram = np.frombuffer(self.data, dtype=FRAME_TIMES_DTYPE, count=1, offset=FRAME_TIMES_SRAM)[0]
+        if histogram['magic'] != FRAME_TIMES_MAGIC:
+            return None
+        return histogram
+
+    def read(self, name, start=0x0):
+        return FIELD_BY_NAME[name].unpack_from(self.data, start)
+
+    def read_all(self, start=0x0):
+        """
+        Decodes every field of a bank with a single unpack.
+        """
+        values = FIELDS_STRUCT.unpack_from(self.data, start + COMPILED_FIELDS[0].offset)
+        fields = {}
+        i = 0
+        for field in COMPILED_FIELDS:
+            fields[field.name] = field.decode(values[i : i + field.count])
+            i += field.count
+        return fields
+
+    def write_many(self, values):
+        """
+        Encodes {name: value} once and writes it to every bank, bank by bank.
+        """
+        packed = [(FIELD_BY_NAME[name].offset, FIELD_BY_NAME[name].pack(value)) for name, value in values.items()]
+        for start in BANKS:
+            for offset, raw in packed:
+                self.write_bytes(raw, start, offset)
 
     def set_total_wonder_lines(self, twl):
-        odd_bits = twl & 0xAAAAAAAA
-        even_bits = twl & 0x55555555
-        self.write_thrice(odd_bits, 0xF04, 4)
-        self.write_thrice(even_bits, 0xF08, 4)
+        self.write_many({'total_wonder_lines': twl})
 
     def set_music_level(self, mlvl):
         """
@@ -97,7 +385,7 @@ class TheNewTetrisSram:
                   13           0x00006DB0
                   14           0x000076D4
         """
-        self.write_thrice((mlvl - 1) * 0x924, 0x639 * 4, 4)
+        self.write_many({'music_level': mlvl})
 
     def set_sfx_level(self, slvl):
         """
@@ -117,7 +405,7 @@ class TheNewTetrisSram:
                   13           0x00006DB0
                   14           0x000076D4
         """
-        self.write_thrice((slvl - 1) * 0x924, 0x63A * 4, 4)
+        self.write_many({'sfx_level': slvl})
 
     def set_song(self, song):
         """
@@ -139,7 +427,7 @@ class TheNewTetrisSram:
                   JAPAN        0x0000000E
                   KALINKA      0x0000000F
         """
-        self.write_thrice(song, 0x63B * 4, 4)
+        self.write_many({'song': song})
 
     def set_music_mode(self, mode):
         """
@@ -148,4 +436,53 @@ class TheNewTetrisSram:
                   CHOOSE       0x00000001
                   RANDOM       0x00000002
         """
-        self.write_thrice(mode, 0x63C * 4, 4)
+        self.write_many({'music_mode': mode})
+
+def process_save(filename, edits=None, dest=None, in_place=False, repair=False):
+    """
+    Loads a save, optionally repairs and edits it, and writes it to dest or back
+    in place.  Returns a RESULT_DTYPE row (fields as decoded after the edits), or
+    None if the file is not a save or cannot be read or written (reported on
+    stderr, so one bad file does not abort a batch).
+    """
+    sram = TheNewTetrisSram()
+    try:
+        sram.from_file(filename)
+    except (SramError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return None
+
+    checksums_ok, ranges = sram.verify()
+    if repair:
+        sram.repair()
+    if edits:
+        sram.write_many(edits)
+
+    try:
+        if in_place:
+            sram.update_file(filename)
+        elif dest is not None:
+            sram.to_file(dest)
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return None
+
+    fields = sram.read_all()
+    return (filename, *(fields[name] for name in FIELDS), all(checksums_ok), not ranges)
+
+def process_saves(filenames, edits=None, outdir=None, in_place=False, repair=False, jobs=None):
+    """
+    process_save() for each file in a pool of processes.  Edited saves are
+    written to outdir (same file name) or in place.  Returns a RESULT_DTYPE array.
+    """
+    dests = [os.path.join(outdir, os.path.basename(filename)) if outdir is not None else None for filename in filenames]
+    args = (filenames, repeat(edits), dests, repeat(in_place), repeat(repair))
+
+    if jobs == 1:
+        rows = list(map(process_save, *args))
+    else:
+        jobs = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            rows = list(executor.map(process_save, *args, chunksize=max(1, len(filenames) // (jobs * 4))))
+
+    return np.array([row for row in rows if row is not None], dtype=RESULT_DTYPE)
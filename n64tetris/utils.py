@@ -1,4 +1,6 @@
 import struct
+import wave
+import numpy as np
 
 """
 Scales from m bits to n bits.
@@ -64,6 +66,52 @@ def rgba8888_to_rgb888(raw):
         l.extend((raw[i], raw[i+1], raw[i+2]))
     return bytes(l)
 
+def write_wave(filename, frames, sampwidth, sample_rate, loop=None):
+    """
+    Writes mono PCM frames to a wav file.
+    loop is an optional (start, end) frame range, stored in a 'smpl' chunk.
+    """
+    with wave.open(filename, 'wb') as wavfile:
+        wavfile.setparams((1, sampwidth, sample_rate, 0, 'NONE', 'not compressed'))
+        wavfile.writeframes(frames)
+
+    if loop is not None:
+        start, end = loop
+        # manufacturer, product, sample period (ns), unity note, pitch fraction, smpte format, smpte offset, num loops, sampler data
+        chunk = struct.pack('<9I', 0, 0, 1000000000 // sample_rate, 60, 0, 0, 0, 1, 0)
+        # cue id, type (forward), start, end (inclusive), fraction, play count (infinite)
+        chunk += struct.pack('<6I', 0, 0, start, max(start, end - 1), 0, 0)
+        with open(filename, 'r+b') as f:
+            f.seek(0, 2)
+            if f.tell() & 1:
+                f.write(b'\x00')
+            f.write(b'smpl' + struct.pack('<I', len(chunk)) + chunk)
+            riff_size = f.tell() - 8
+            f.seek(4)
+            f.write(struct.pack('<I', riff_size))
+
+def read_wave(filename):
+    """
+    Reads any integer PCM wav file (8, 16, 24 or 32-bit, any number of channels).
+    Returns (pcm, sample_rate), pcm as mono float32 in [-1, 1).
+    """
+    with wave.open(filename, 'rb') as wavfile:
+        sampwidth = wavfile.getsampwidth()
+        nchannels = wavfile.getnchannels()
+        sample_rate = wavfile.getframerate()
+        frames = wavfile.readframes(wavfile.getnframes())
+
+    if sampwidth == 1:
+        pcm = np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128
+    elif sampwidth == 3:
+        b = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        pcm = ((b[:, 0] << 8 | b[:, 1] << 16 | b[:, 2] << 24) >> 8).astype(np.float32)
+    else:
+        pcm = np.frombuffer(frames, dtype=f'<i{sampwidth}').astype(np.float32)
+
+    pcm = pcm.reshape(-1, nchannels).mean(axis=1, dtype=np.float32)
+    return pcm / (1 << (8 * sampwidth - 1)), sample_rate
+
 # Recalculate N64 rom checksums
 # reference code:
 # https://gist.github.com/dkosmari/ee7bb471ea12c21b008d0ecffebd6384
@@ -78,6 +126,13 @@ def read_u32_be(buffer: bytearray, offset):
 def write_u32_be(buffer: bytearray, offset, value):
     struct.pack_into(">I", buffer, offset, value)
 
+def find_u32_be(buffer, value):
+    """
+    Returns the offsets of all word-aligned big-endian occurrences of value.
+    """
+    words = np.frombuffer(buffer, dtype='>u4', count=len(buffer) // 4)
+    return (np.flatnonzero(words == value) * 4).tolist()
+
 def sm64_calc_checksums(buf: bytearray):
     #local t0, t1, t2, t3, t4, t5, t6, t7, t8, t9
     #local s0, s6
@@ -0,0 +1,154 @@
+"""
+Call graph of the code loaded at boot, from its jal and jalr instructions.
+
+Each call site is a record of its vaddr, its target, the function containing
+it and its kind.  A jalr's target is known when its register was set by a
+lui/addiu or lui/ori pair shortly before (see CodeIndex.pairs); otherwise it
+is 0.  Functions are taken to start at the jal targets, so a site belongs to
+the closest target at or before it.
+
+Decoding takes a few milliseconds, but an index is also cached in a .npz file
+named after a hash of the boot address and the code segment, so it is reused
+until the code itself changes.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+from .codeindex import CodeIndex, CODE_SEGMENT, PAIR_WINDOW
+
+RECORD = np.dtype([
+    ('site', '<u4'),
+    ('target', '<u4'),
+    ('caller', '<u4'),
+    ('kind', 'u1'),
+])
+
+KINDS = ('jal', 'jalr')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'n64tetris')
+
+def rom_key(rom, start=CODE_SEGMENT[0], end=CODE_SEGMENT[1]):
+    """
+    Hash of what the call graph depends on: the boot address and the code segment.
+    """
+    h = hashlib.sha1(rom.virt(start).to_bytes(4, byteorder='big'))
+    h.update(rom.data[start : end])
+    return h.hexdigest()
+
+class XrefIndex:
+    def __init__(self, records=(), key=None):
+        self.records = np.array(records, dtype=RECORD)
+        self.key = key
+        self.by_target = np.argsort(self.records['target'], kind='stable')
+        self.entries = np.unique(self.records['target'][self.records['kind'] == 0])
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def build(cls, index):
+        """
+        Index of the calls in a CodeIndex.
+        """
+        sites = index.vaddrs(np.arange(len(index)))
+        rows = {}
+        targets = {}
+
+        # jal: the target is in the instruction
+        jals = index.find('jal')
+        rows['jal'] = jals
+        targets['jal'] = (sites[jals] & 0xF0000000) | (index.target[jals].astype(np.int64) << 2)
+
+        # jalr: look back for the instruction that set its register; a completed
+        # lui/addiu or lui/ori pair gives the target
+        jalrs = index.find('jalr')
+        hi_rows, lo_rows, values = index.pairs()
+        arith = np.isin(index.op[lo_rows], [0x09, 0x0D])
+        pair_values = np.zeros(len(index), dtype=np.int64)
+        pair_values[lo_rows[arith]] = values[arith]
+        dests = index.dests()
+        regs = index.rs[jalrs]
+        jalr_targets = np.zeros(len(jalrs), dtype=np.int64)
+        pending = np.ones(len(jalrs), dtype=bool)
+        for k in range(1, PAIR_WINDOW + 1):
+            back = jalrs - k
+            pending &= back >= 0
+            back = np.maximum(back, 0)
+            setters = pending & (dests[back] == regs)
+            jalr_targets[setters] = pair_values[back[setters]]
+            pending &= ~setters
+        rows['jalr'] = jalrs
+        targets['jalr'] = jalr_targets
+
+        records = np.zeros(len(jals) + len(jalrs), dtype=RECORD)
+        records['site'] = np.concatenate([sites[rows['jal']], sites[rows['jalr']]])
+        records['target'] = np.concatenate([targets['jal'], targets['jalr']])
+        records['kind'] = np.concatenate([np.zeros(len(jals)), np.ones(len(jalrs))])
+        records = records[np.argsort(records['site'], kind='stable')]
+
+        # each site belongs to the closest function entry at or before it
+        entries = np.unique(records['target'][records['kind'] == 0])
+        i = np.searchsorted(entries, records['site'], side='right') - 1
+        records['caller'] = np.where(i >= 0, entries[np.maximum(i, 0)], 0)
+
+        return cls(records, rom_key(index.rom, index.start, index.end))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['records'], str(f['key']))
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            np.savez(f, records=self.records, key=np.array(self.key))
+
+    @classmethod
+    def for_rom(cls, rom, cache_dir=DEFAULT_CACHE_DIR):
+        """
+        The index of a rom's boot segment, from cache_dir if it was built
+        before (then saved there).  cache_dir None disables the cache.
+        Returns (index, whether it came from the cache).
+        """
+        key = rom_key(rom)
+        if cache_dir is None:
+            return cls.build(CodeIndex(rom)), False
+
+        filename = os.path.join(cache_dir, f"xref-{key}.npz")
+        if os.path.exists(filename):
+            xref = cls.load(filename)
+            if xref.key == key:
+                return xref, True
+
+        xref = cls.build(CodeIndex(rom))
+        os.makedirs(cache_dir, exist_ok=True)
+        xref.save(filename)
+        return xref, False
+
+    def callers(self, target):
+        """
+        Records of the calls of target.
+        """
+        targets = self.records['target'][self.by_target]
+        lo, hi = np.searchsorted(targets, [target, target + 1])
+        return self.records[np.sort(self.by_target[lo:hi])]
+
+    def calls_from(self, func):
+        """
+        Records of the calls made by the function at func.
+        """
+        return self.records[self.records['caller'] == func]
+
+    def callees(self, func):
+        """
+        Distinct targets called by the function at func (0 for unresolved jalrs).
+        """
+        return np.unique(self.calls_from(func)['target'])
+
+    def function_of(self, vaddr):
+        """
+        The function entry at or before vaddr (0 if none).
+        """
+        i = np.searchsorted(self.entries, vaddr, side='right') - 1
+        return int(self.entries[i]) if i >= 0 else 0
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""
+    # Fingerprint every sample of both games
+    $ ./sample-index.py samples.npz --tnt ~/tnt.z64 --sphere ~/tetrisphere.z64
+
+    # Where else does this sound occur?
+    $ ./sample-index.py samples.npz --query tnt:0x7C1E56
+    $ ./sample-index.py samples.npz --wav modified_7C1E56.wav -d 6
+
+    # Duplicate groups, across both games
+    $ ./sample-index.py samples.npz --dups -d 4
+"""
+
+import sys
+import argparse
+import time
+
+from n64tetris import utils
+from n64tetris.roms.tnt import TheNewTetrisRom
+from n64tetris.roms.sphere import TetrisphereRom
+from n64tetris.fingerprint import SampleIndex, fingerprint
+
+GAMES = {'tnt': TheNewTetrisRom, 'sphere': TetrisphereRom}
+
+def auto_int(x):
+    return int(x, 0)
+
+def sample_ref(x):
+    game, _, addr = x.partition(':')
+    if game not in GAMES or not addr:
+        raise argparse.ArgumentTypeError(f"expected GAME:ADDR with GAME one of {', '.join(GAMES)}")
+    return game, auto_int(addr)
+
+def print_matches(index, matches):
+    print("game, addr, format, sample_rate, nframes, distance")
+    for i, d in matches:
+        game, addr, fmt, sample_rate, nframes, _, _ = index.records[i].tolist()
+        print(f"{game}, 0x{addr:06X}, {fmt}, {sample_rate}, {nframes}, {d}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Fingerprint index of the samples of both games.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='increase verbosity')
+    parser.add_argument('-f', '--force', action='store_true', help='bypass safety checks')
+    parser.add_argument('INDEX', help='index file (written when building)')
+    parser.add_argument('--tnt', metavar='ROM', help='build: fingerprint every sample of The New Tetris rom')
+    parser.add_argument('--sphere', metavar='ROM', help='build: fingerprint every sample of the Tetrisphere rom')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, help='number of processes for building (default: number of cpus)')
+    parser.add_argument('--query', metavar='GAME:ADDR', type=sample_ref, help='samples that sound like an indexed sample')
+    parser.add_argument('--wav', metavar='FILE', help='samples that sound like a wav file')
+    parser.add_argument('--dups', action='store_true', help='list groups of duplicate samples')
+    parser.add_argument('-d', '--distance', metavar='BITS', type=int, default=0, help='max hamming distance between fingerprints (default: 0, 64 bits per fingerprint)')
+
+    args = parser.parse_args()
+
+    if args.tnt or args.sphere:
+        records = []
+        for game, filename in (('tnt', args.tnt), ('sphere', args.sphere)):
+            if filename:
+                rom = GAMES[game](verbose=args.verbose, force=args.force)
+                rom.from_file(filename)
+                records.extend(rom.sample_index_records(game, args.jobs))
+        index = SampleIndex(records)
+        index.save(args.INDEX)
+        print(f"Indexed {len(index)} samples")
+    else:
+        index = SampleIndex.load(args.INDEX)
+
+    if args.query is not None:
+        i = index.find(*args.query)
+        if i is None:
+            print(f"Sample not in index: {args.query[0]}:0x{args.query[1]:06X}", file=sys.stderr)
+            sys.exit(1)
+        t = time.perf_counter()
+        matches = index.query(int(index.records['fp'][i]), args.distance, bytes(index.records['digest'][i]))
+        t = time.perf_counter() - t
+        print_matches(index, [(j, d) for j, d in matches if j != i])
+        if args.verbose:
+            print(f"query: {t * 1e6:.0f} us", file=sys.stderr)
+
+    if args.wav is not None:
+        t = time.perf_counter()
+        matches = index.query(fingerprint(utils.read_wave(args.wav)[0]), args.distance)
+        t = time.perf_counter() - t
+        print_matches(index, matches)
+        if args.verbose:
+            print(f"fingerprint and query: {t * 1e6:.0f} us", file=sys.stderr)
+
+    if args.dups:
+        for n, rows in enumerate(index.groups(args.distance)):
+            if n:
+                print()
+            print_matches(index, [(i, 0) for i in rows])
+
+if __name__ == "__main__":
+    main()
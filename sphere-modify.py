@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+    $ ./sphere-modify.py -v ~/tetrisphere.z64 mod.z64 --image modified_title_screen.png -i 0x74271C
+
+    $ ./sphere-modify.py -v ~/tetrisphere.z64 mod.z64 --sample modified_1DCD5A.wav -w -d 0x1DCD5A
+"""
+
+import argparse
+
+from n64tetris.roms.sphere import TetrisphereRom
+
+def auto_int(x):
+    return int(x, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('-v', '--verbose', action='store_true', help='increase verbosity')
+    parser.add_argument('-f', '--force', action='store_true', help='bypass safety checks')
+    parser.add_argument('--relocate', action='store_true', help='moves oversize assets into free space')
+    parser.add_argument('SRC', help='source rom file')
+    parser.add_argument('DEST', help='output rom file')
+
+    group_image = parser.add_argument_group('image', description='Insert image by address.')
+    group_image.add_argument('--image', metavar='FILE', help='load image file')
+    group_image.add_argument('-i', metavar='ADDR', type=auto_int, help='address of image')
+
+    group_sample = parser.add_argument_group('sample', description='Insert sample by address.')
+    group_sample.add_argument('-d', metavar='ADDR', type=auto_int, help='address of sample')
+    group_sample.add_argument('--sample', metavar='FILE', help='load sample file')
+    group_sample.add_argument('-w', '--wave', action='store_true', help='as wav file')
+    group_sample.add_argument('--no-fit', action='store_true', help="keep the wav file's length instead of trimming/padding it to the original sample's")
+
+    args = parser.parse_args()
+
+    rom = TetrisphereRom(verbose=args.verbose, force=args.force)
+    rom.from_file(args.SRC)
+
+    if args.relocate:
+        rom.build_free_space_map()
+
+    if args.image is not None:
+        if args.i is not None:
+            rom.insert_image(args.image, args.i)
+
+    if args.sample is not None:
+        if args.d is not None:
+            rom.insert_sample(args.sample, args.d, args.wave, not args.no_fit)
+
+    rom.to_file(args.DEST)
+
+if __name__ == "__main__":
+    main()
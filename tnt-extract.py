@@ -32,6 +32,19 @@
     $ cd anims
     $ ../tnt-extract.py -v ~/tnt.z64 --all-anims
     $ cd ..
+
+    # extract all dcms, with each dcm's samples as wav files (loop points in a smpl chunk)
+    $ mkdir dcms
+    $ cd dcms
+    $ ../tnt-extract.py ~/tnt.z64 --all-dcms --dcm-samples
+    $ cd ..
+
+    # play each dcm's samples in turn, to <dcm_name>-samples.wav (the songs
+    # themselves are not rendered: their pattern data is not decoded)
+    $ mkdir previews
+    $ cd previews
+    $ ../tnt-extract.py ~/tnt.z64 --all-dcms --preview-samples
+    $ cd ..
 """
 
 import argparse
@@ -57,6 +70,9 @@ def main():
     parser.add_argument('-w', '--wave', action='store_true', help='as wav file(s)')
     group.add_argument('--dcm', metavar='ADDR', type=auto_int, help='address of dcm')
     group.add_argument('--all-dcms', action='store_true', help='all dcms')
+    parser.add_argument('--dcm-samples', action='store_true', help="also write each dcm's samples as wav files with loop points")
+    parser.add_argument('--preview-samples', action='store_true', help="also render each dcm's samples in turn to a wav file (not the song)")
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, help='number of processes for --all-dcms (default: number of cpus)')
 
     args = parser.parse_args()
 
@@ -85,10 +101,10 @@ def main():
         rom.extract_all_samples(args.wave)
 
     if args.dcm:
-        rom.extract_dcm(args.dcm)
+        rom.extract_dcm(args.dcm, args.dcm_samples, args.preview_samples)
 
     if args.all_dcms:
-        rom.extract_all_dcms()
+        rom.extract_all_dcms(args.dcm_samples, args.preview_samples, args.jobs)
 
 if __name__ == "__main__":
     main()
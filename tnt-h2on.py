@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+    # Store every Egyptian screen asset uncompressed
+    $ ./tnt-h2on.py -v ~/tnt.z64 mod.z64 --screen egyptian
+
+    # By address
+    $ ./tnt-h2on.py -v ~/tnt.z64 mod.z64 -i 0x28A228 0x2A54B2
+"""
+
+import argparse
+
+from n64tetris.roms.tnt import TheNewTetrisRom
+
+def auto_int(x):
+    return int(x, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert H2OS (LZO) assets to uncompressed H2ON assets in an expanded rom region.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='increase verbosity')
+    parser.add_argument('-f', '--force', action='store_true', help='bypass safety checks')
+    parser.add_argument('SRC', help='source rom file')
+    parser.add_argument('DEST', help='output rom file')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-i', nargs='+', metavar='ADDR', type=auto_int, help='address of asset')
+    group.add_argument('--screen', nargs='+', metavar='NAME', help='all images and palettes of a screen, for example: mayan, greek, egyptian, celtic, african, japanese, russian, finale')
+    parser.add_argument('--size', metavar='MB', type=int, help='expanded rom size (default: just large enough, rounded up to 1 MB)')
+
+    args = parser.parse_args()
+
+    rom = TheNewTetrisRom(verbose=args.verbose, force=args.force)
+    rom.from_file(args.SRC)
+
+    if args.i:
+        addrs = args.i
+    else:
+        addrs = []
+        for screen in args.screen:
+            screen_addrs = rom.screen_assets(screen)
+            if not screen_addrs:
+                parser.error(f"No assets found for screen: {screen}")
+            addrs.extend(screen_addrs)
+
+    # an asset listed twice would be converted twice
+    addrs = list(dict.fromkeys(addrs))
+
+    orig_size = len(rom.data)
+    if args.size is not None:
+        size = args.size << 20
+    else:
+        # worst case: none of the freed slots can be reused
+        needed = sum(8 + int.from_bytes(rom.data[addr+4 : addr+8], byteorder='big') + 1 for addr in addrs)
+        size = (orig_size + needed + 0xFFFFF) & ~0xFFFFF
+
+    rom.build_free_space_map()
+    rom.expand(size)
+    converted = rom.convert_to_h2on(addrs)
+
+    print(f"Asset\tNew\tBuflen\tPayload\tAdded")
+    total_buflen = 0
+    total_payload = 0
+    for addr, new_addr, buflen, payload_size in converted:
+        print(f"0x{addr:06X}\t0x{new_addr:06X}\t{buflen}\t{payload_size}\t{buflen - payload_size}")
+        total_buflen += buflen
+        total_payload += payload_size
+
+    print(f"Converted {len(converted)} of {len(addrs)} assets")
+    print(f"Bytes added: {total_buflen - total_payload} (rom grew by {len(rom.data) - orig_size} bytes)")
+    print(f"LZO work removed: {total_payload} compressed bytes in, {total_buflen} decompressed bytes out")
+
+    rom.to_file(args.DEST)
+
+if __name__ == "__main__":
+    main()
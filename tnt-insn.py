@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+    # Every addiu $a0, $zero, 0x14
+    $ ./tnt-insn.py ~/tnt.z64 addiu --rt a0 --rs zero --imm 0x14
+
+    # Every slti $at, ..., 0x11, as in modify_square_size
+    $ ./tnt-insn.py ~/tnt.z64 slti --rt at --imm 0x11
+
+    # Every call of sprintf
+    $ ./tnt-insn.py ~/tnt.z64 jal --target 0x800B62D4
+
+    # lui/addiu, lui/ori (and lui + load/store) pairs forming an address
+    $ ./tnt-insn.py ~/tnt.z64 --address 0x8013AD7C
+
+    # Everything pointing into the static data of -X (words and instruction pairs)
+    $ ./tnt-insn.py mod.z64 --refs 0x8013A8B0 0x8013AD80
+"""
+
+import sys
+import argparse
+import time
+
+from n64tetris.roms.tnt import TheNewTetrisRom
+from n64tetris.codeindex import CodeIndex, CODE_SEGMENT, register
+from n64tetris.pointers import find_references, KINDS
+
+def auto_int(x):
+    return int(x, 0)
+
+def reg(x):
+    try:
+        return register(x)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def main():
+    parser = argparse.ArgumentParser(description='Find instructions in the code loaded at boot.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='increase verbosity')
+    parser.add_argument('-f', '--force', action='store_true', help='bypass safety checks')
+    parser.add_argument('SRC', help='source rom file')
+    parser.add_argument('MNEMONIC', nargs='?', help='instruction to find, e.g. addiu (default: any)')
+    parser.add_argument('--rs', type=reg, help='rs register, by name or number')
+    parser.add_argument('--rt', type=reg, help='rt register, by name or number')
+    parser.add_argument('--rd', type=reg, help='rd register, by name or number')
+    parser.add_argument('--sa', type=int, help='shift amount')
+    parser.add_argument('--imm', type=auto_int, help='16-bit immediate (negative values are sign extended)')
+    parser.add_argument('--target', type=auto_int, help='j/jal target vaddr')
+    parser.add_argument('--address', metavar='VADDR', type=auto_int, help='find the instruction pairs forming VADDR instead')
+    parser.add_argument('--refs', nargs=2, metavar=('START', 'END'), type=auto_int, help='find the words and instruction pairs referencing [START, END) instead')
+    parser.add_argument('--start', type=auto_int, default=CODE_SEGMENT[0], help=f'rom address to start at (default: 0x{CODE_SEGMENT[0]:X})')
+    parser.add_argument('--end', type=auto_int, default=CODE_SEGMENT[1], help=f'rom address to end at (default: 0x{CODE_SEGMENT[1]:X})')
+    args = parser.parse_args()
+
+    rom = TheNewTetrisRom(verbose=args.verbose, force=args.force)
+    rom.from_file(args.SRC)
+
+    t0 = time.perf_counter()
+    index = CodeIndex(rom, args.start, args.end)
+    t1 = time.perf_counter()
+
+    if args.refs is not None:
+        refs = find_references(rom, *args.refs, words_range=(index.start, index.end), index=index)
+        t2 = time.perf_counter()
+        print("rom, vaddr, kind, value, instruction")
+        for addr, lo, value, kind in refs.tolist():
+            if kind == 0:
+                print(f"0x{addr:06X}, {rom.virt(addr):08X}, {KINDS[kind]}, {value:08X}, ")
+            else:
+                hi, lo = index.rows([addr, lo]).tolist()
+                print(f"0x{addr:06X}, {rom.virt(addr):08X}, {KINDS[kind]}, {value:08X}, {index.disassemble(hi)} / {index.disassemble(lo)}")
+        found = len(refs)
+    elif args.address is not None:
+        hi_rows, lo_rows, _ = index.find_pairs(args.address & 0xFFFFFFFF)
+        t2 = time.perf_counter()
+        print("rom, vaddr, instruction, rom, vaddr, instruction")
+        for hi, lo in zip(hi_rows.tolist(), lo_rows.tolist()):
+            print(f"0x{index.rom_addrs(hi):06X}, {index.vaddrs(hi):08X}, {index.disassemble(hi)}, "
+                  f"0x{index.rom_addrs(lo):06X}, {index.vaddrs(lo):08X}, {index.disassemble(lo)}")
+        found = len(hi_rows)
+    else:
+        try:
+            rows = index.find(args.MNEMONIC, args.rs, args.rt, args.rd, args.sa, args.imm, args.target)
+        except ValueError as e:
+            print(f"insn error: {e}", file=sys.stderr)
+            sys.exit(1)
+        t2 = time.perf_counter()
+        print("rom, vaddr, word, instruction")
+        for row in rows.tolist():
+            print(f"0x{index.rom_addrs(row):06X}, {index.vaddrs(row):08X}, {index.words[row]:08X}, {index.disassemble(row)}")
+        found = len(rows)
+
+    if args.verbose:
+        print(f"{found} found; decoded {len(index)} words in {1000 * (t1 - t0):.1f} ms, query took {1000 * (t2 - t1):.1f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -26,11 +26,35 @@
 
     # Totally uncapped and unlocked
     $ ./tnt-modify.py -v ~/tnt.z64 mod.z64 --spawn 1 --hold 1 --lock 10 --square 0 --line 1 --screens 0 7
+
+    # Any PCM wav (stereo, 16/24-bit, 44.1 kHz, ...) is converted to the sample's rate and format
+    $ ./tnt-modify.py -v ~/tnt.z64 mod.z64 --sample my_sound_44k_stereo.wav -w -d 0x7C1E56
+
+    # Move an image that no longer fits its slot into free space
+    $ ./tnt-modify.py -v ~/tnt.z64 mod.z64 --relocate --image modified_finale_boiler.png -n finale_boiler
+
+    # Build the common patches once, then apply them to each variant
+    $ ./tnt-modify.py ~/tnt.z64 base.z64 -X -s -p -r -l --save-plan base.plan
+    $ ./tnt-modify.py ~/tnt.z64 blues.z64 --plan base.plan --bag 5 6 9
+
+    # Only the enabled displays are linked in; see what they take and what is left
+    $ ./tnt-modify.py ~/tnt.z64 mod.z64 -X -s -l --show-layout
+
+    # No linked list: the enabled displays are called with straight-line jals
+    $ ./tnt-modify.py ~/tnt.z64 mod.z64 -X -p -r -l --direct
+
+    # Remaining pieces as one text draw instead of seven
+    $ ./tnt-modify.py ~/tnt.z64 mod.z64 -X -r --multiline
+
+    # Record how long frames take, then read the histogram from the save
+    $ ./tnt-modify.py ~/tnt.z64 mod.z64 -X -p -r -l --frametimes
+    $ ./tnt-sram.py ~/tnt.sra --frametimes
 """
 
 import argparse
 
 from n64tetris.roms.tnt import TheNewTetrisRom
+from n64tetris.patchplan import PatchPlan
 
 def auto_int(x):
     return int(x, 0)
@@ -44,8 +68,16 @@ def main():
     parser.add_argument('-p', action='store_true', help='displays piece count (requires -X)')
     parser.add_argument('-r', action='store_true', help='displays remaining pieces (requires -X)')
     parser.add_argument('-l', action='store_true', help='displays extra lookahead (requires -X)')
+    parser.add_argument('--frametimes', action='store_true', help='records a frame time histogram into sram, for tnt-sram.py (requires -X)')
+    parser.add_argument('--direct', action='store_true', help='calls the enabled displays directly instead of walking a linked list (requires -X)')
+    parser.add_argument('--multiline', action='store_true', help='draws the remaining pieces as one multi-line text (requires -X -r)')
     parser.add_argument('-a', action='store_true', help='disables piece fall acceleration')
     parser.add_argument('--fps', action='store_true', help='displays fps measurement')
+    parser.add_argument('--relocate', action='store_true', help='moves oversize assets into free space')
+    parser.add_argument('--save-plan', metavar='FILE', help='save the patches made by the other options, to apply with --plan')
+    parser.add_argument('--plan', metavar='FILE', help='apply a saved patch plan (before any other options)')
+    parser.add_argument('--show-layout', action='store_true', help='list the code and static data linked by -X, and the free bytes left')
+    parser.add_argument('--show-plan', action='store_true', help='list the patched byte ranges and the options that own them')
     parser.add_argument('SRC', help='source rom file')
     parser.add_argument('DEST', help='output rom file')
 
@@ -100,37 +132,26 @@ def main():
     group_sample.add_argument('-d', metavar='ADDR', type=auto_int, help='address of sample')
     group_sample.add_argument('--sample', metavar='FILE', help='load sample file')
     group_sample.add_argument('-w', '--wave', action='store_true', help='as wav file')
+    group_sample.add_argument('--no-fit', action='store_true', help="keep the wav file's length instead of trimming/padding it to the original sample's")
 
     args = parser.parse_args()
 
     rom = TheNewTetrisRom(verbose=args.verbose, force=args.force)
     rom.from_file(args.SRC)
 
-    if args.X:
-        rom.move_heap()
-        rom.add_utility_functions()
-        rom.init_static_data()
-        rom.heap_alloc_player_data()
-        rom.init_player_stats()
-        rom.update_player_stats()
-        rom.display_player_stats()
-
-        rom.save_seed()
-        if args.s:
-            rom.display_seed()
+    if args.relocate:
+        rom.build_free_space_map()
 
-        rom.register_piece_count()
-        rom.register_remaining_pieces()
-        rom.register_extra_lookahead()
+    if args.plan is not None:
+        rom.apply_patch_plan(PatchPlan.load(args.plan))
 
-        if args.p:
-            rom.enable_piece_count()
+    # the seed display is also needed to move or recolor it
+    seed_stat = args.stat == 4 and ((args.xy is not None) or (args.rgba is not None))
 
-        if args.r:
-            rom.enable_remaining_pieces()
-
-        if args.l:
-            rom.enable_extra_lookahead()
+    linker = None
+    if args.X:
+        rom.move_heap()
+        linker = rom.link_experimental_features(seed=args.s or seed_stat, piece_count=args.p, remaining_pieces=args.r, extra_lookahead=args.l, frame_times=args.frametimes, direct=args.direct, multiline=args.multiline)
 
     if args.seed is not None:
         rom.modify_seed(args.seed)
@@ -179,14 +200,8 @@ def main():
         rom.modify_screens(start, end)
 
     if args.stat is not None:
-        skip = False
-        if args.stat == 4 and ((args.xy is not None) or (args.rgba is not None)):
-            if args.X:
-                if not args.s:
-                    rom.display_seed()
-            else:
-                skip = True
-        if not skip:
+        # without -X there is no seed display to modify
+        if not (seed_stat and not args.X):
             if args.xy is not None:
                 x, y = args.xy
                 rom.modify_stat_position(args.stat, x, y)
@@ -211,7 +226,16 @@ def main():
 
     if args.sample is not None:
         if args.d is not None:
-            rom.insert_sample(args.sample, args.d, args.wave)
+            rom.insert_sample(args.sample, args.d, args.wave, not args.no_fit)
+
+    if args.show_layout and linker is not None:
+        linker.print_layout()
+
+    if args.show_plan:
+        rom.print_patch_plan()
+
+    if args.save_plan is not None:
+        rom.patch_plan.save(args.save_plan)
 
     rom.to_file(args.DEST)
 
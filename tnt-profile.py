@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+    # Cost of the -X displays, per call and per frame, for 2 players
+    $ ./tnt-modify.py ~/tnt.z64 mod.z64 -X -s -p -r -l
+    $ ./tnt-profile.py mod.z64 -n 2
+
+    # Fold in estimates of the game functions they call, and show what is drawn
+    $ ./tnt-profile.py -v mod.z64 --stub-cycles sprintf=2000 display_text=5000
+"""
+
+import sys
+import argparse
+
+from n64tetris import mips
+from n64tetris.roms.tnt import TheNewTetrisRom
+
+def stub_cycles(x):
+    name, _, cycles = x.partition('=')
+    if not name or not cycles:
+        raise argparse.ArgumentTypeError("expected NAME=CYCLES")
+    return name, int(cycles, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description='Instruction and cycle counts of the code injected by tnt-modify.py -X.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='increase verbosity')
+    parser.add_argument('-f', '--force', action='store_true', help='bypass safety checks')
+    parser.add_argument('-n', '--players', type=int, choices=range(1, 5), default=1, help='number of players (default: 1)')
+    parser.add_argument('--frames', metavar='N', type=int, default=60, help='number of frames to run (default: 60)')
+    parser.add_argument('--piece-frames', metavar='N', type=int, default=1, help='frames per new piece (default: 1, a new piece every frame)')
+    parser.add_argument('--stub-cycles', metavar='NAME=CYCLES', type=stub_cycles, nargs='+', default=[], help='estimated cycles per call of a stubbed game function')
+    parser.add_argument('--fps', type=int, default=60, help='frame rate for the cycle budget (default: 60)')
+    parser.add_argument('SRC', help='rom modified with -X')
+
+    args = parser.parse_args()
+
+    rom = TheNewTetrisRom(verbose=args.verbose, force=args.force)
+    rom.from_file(args.SRC)
+
+    if not rom.hooked_routines():
+        print("No injected routines found (modify the rom with -X first)", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        report = rom.profile_overlays(args.players, args.frames, args.piece_frames, dict(args.stub_cycles))
+    except mips.MipsError as e:
+        print(f"profile error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print("routine, calls, instructions/call, cycles/call")
+    for name, (calls, instructions, cycles) in report['routines'].items():
+        print(f"{name}, {calls}, {instructions / calls:.1f}, {cycles / calls:.1f}")
+
+    frames = len(report['frame_cycles'])
+    print()
+    print("stub, calls/frame, cycles/call")
+    for name, calls in report['stub_calls'].items():
+        print(f"{name}, {calls / frames:.2f}, {dict(args.stub_cycles).get(name, 0)}")
+
+    budget = mips.CPU_HZ // args.fps
+    worst = max(report['frame_cycles'])
+    print()
+    print(f"per frame: {sum(report['frame_instructions']) / frames:.1f} instructions, "
+          f"{sum(report['frame_cycles']) / frames:.1f} cycles (max {worst}), "
+          f"{100 * worst / budget:.3f}% of {budget} cycles at {args.fps} fps")
+
+    if args.verbose:
+        for x, y, text in report['texts']:
+            print(f"display_text({x}, {y}, {text!r})", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,135 @@
 #!/usr/bin/env python3
 
+"""
+    $ ./tnt-sram.py ~/tnt.sra mod.sra --twl 100000 --mlvl 10 --song 15
+
+    # Write only the changed bytes (and checksums) back into the save
+    $ ./tnt-sram.py ~/tnt.sra --in-place --mode 2
+
+    $ ./tnt-sram.py ~/tnt.sra --show
+
+    # Check, then fix a save whose banks disagree
+    $ ./tnt-sram.py ~/tnt.sra --verify
+    $ ./tnt-sram.py ~/tnt.sra fixed.sra --repair
+
+    # What changed between play sessions?
+    $ ./tnt-sram.py --diff before.sra after.sra after2.sra
+
+    # Collect the fields of every save, in parallel
+    $ ./tnt-sram.py --batch 'saves/*.sra' --csv saves.csv
+
+    # Edit a whole directory of saves
+    $ ./tnt-sram.py --batch 'saves/*.sra' --outdir modded --mlvl 10 --song 15
+
+    # Frame times recorded by a rom modified with tnt-modify.py -X --frametimes
+    $ ./tnt-sram.py ~/tnt.sra --frametimes
+"""
+
+import sys
+import os
+import csv
+import glob
 import argparse
+import numpy as np
+
+from n64tetris.srams.tnt import TheNewTetrisSram, BANKS, FIELDS, FIELD_BY_NAME, FRAME_TIMES_SRAM, SramError, process_saves, diff_saves, frame_time_stats
+
+def load(filename, verbose=False):
+    sram = TheNewTetrisSram(verbose=verbose)
+    try:
+        sram.from_file(filename)
+    except SramError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    return sram
+
+def run_diff(parser, args):
+    srams = [load(filename) for filename in args.diff]
+    if len({len(sram.data) for sram in srams}) > 1:
+        parser.error("--diff files are not all the same size")
+
+    for start, end, banks, names in diff_saves(srams):
+        where = f"banks {', '.join(f'0x{bank:04X}' for bank in banks)}" if banks else "outside banks"
+        print(f"0x{start:04X}-0x{end:04X}  {where}  {', '.join(names) if names else '?'}")
+
+        # values from the first bank that differs
+        base = banks[0] if banks else 0
+        for filename, sram in zip(args.diff, srams):
+            raw = sram.data[base + start : base + min(end, start + 16)].hex()
+            decoded = [f"{name}={FIELD_BY_NAME[name].unpack_from(sram.data, base)}" for name in names if name in FIELD_BY_NAME]
+            print(f"    {raw}{'...' if end - start > 16 else ''}  {' '.join(decoded)}  {filename}")
+
+def run_batch(args, edits):
+    filenames = []
+    for pattern in args.batch:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print(f"error: No files match {pattern}", file=sys.stderr)
+        filenames.extend(matches)
 
-from n64tetris.srams.tnt import TheNewTetrisSram
+    if args.outdir is not None:
+        os.makedirs(args.outdir, exist_ok=True)
+
+    results = process_saves(filenames, edits, args.outdir, args.in_place, args.repair, args.jobs)
+
+    if args.csv is not None:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(results.dtype.names)
+            writer.writerows(results.tolist())
+
+    if args.npy is not None:
+        np.save(args.npy, results)
+
+    print(f"{len(results)} of {len(filenames)} saves processed, {np.count_nonzero(~results['checksums_ok'])} with bad checksums, {np.count_nonzero(~results['banks_agree'])} with disagreeing banks")
+    if len(results):
+        print("field, min, median, mean, max")
+        for name in FIELDS:
+            values = results[name]
+            print(f"{name}, {values.min()}, {np.median(values):g}, {values.mean():.2f}, {values.max()}")
+
+def show_frame_times(sram):
+    histogram = sram.frame_times()
+    if histogram is None:
+        print(f"error: No frame times at 0x{FRAME_TIMES_SRAM:04X} (record them with tnt-modify.py -X --frametimes)", file=sys.stderr)
+        sys.exit(1)
+
+    frames = int(histogram['frames'])
+    buckets = histogram['buckets']
+    edges, stats = frame_time_stats(histogram)
+    print(f"frames: {frames} (one per player per frame)")
+    if not buckets.any():
+        return
+
+    print("ms, frames, %")
+    for i in np.flatnonzero(buckets):
+        upper = f"{edges[i + 1]:.1f}" if i < len(buckets) - 1 else ""
+        print(f"{edges[i]:.1f}-{upper}, {buckets[i]}, {100 * buckets[i] / buckets.sum():.2f}")
+    print(", ".join(f"p{p}: {'>' + format(edges[-2], '.1f') if ms is None else '<' + format(ms, '.1f')} ms" for p, ms in stats.items()))
+    for fps in (60, 30, 20):
+        first = min(int(np.searchsorted(edges, 1000 / fps)), len(buckets) - 1)
+        slow = buckets[first:].sum()
+        print(f"over {edges[first]:.1f} ms (below {fps} fps): {slow} ({100 * slow / buckets.sum():.2f}%)")
 
 def main():
     parser = argparse.ArgumentParser(description='')
     parser.add_argument('-v', '--verbose', action='store_true', help='increase verbosity')
-    parser.add_argument('SRC', help='source sram file')
-    parser.add_argument('DEST', help='output sram file')
+    parser.add_argument('SRC', nargs='?', help='source sram file')
+    parser.add_argument('DEST', nargs='?', help='output sram file')
+    parser.add_argument('--in-place', action='store_true', help='write only the changed bytes back into SRC, instead of DEST')
+    parser.add_argument('--show', action='store_true', help='print the decoded fields (after any changes)')
+    parser.add_argument('--verify', action='store_true', help='check the checksums and that the three banks agree (exit status 2 if not, even once repaired)')
+    parser.add_argument('--repair', action='store_true', help='fix banks that disagree by per byte majority vote')
+    parser.add_argument('--frametimes', action='store_true', help='print the frame time histogram recorded by tnt-modify.py -X --frametimes')
+
+    parser.add_argument('--diff', nargs='+', metavar='FILE', help='show the byte ranges (and fields) that differ between saves (instead of SRC)')
+
+    group_batch = parser.add_argument_group('batch', description='Apply the same options to many saves in parallel, and collect their fields.')
+    group_batch.add_argument('--batch', nargs='+', metavar='FILE', help='sram files or glob patterns (instead of SRC)')
+    group_batch.add_argument('--outdir', metavar='DIR', help='write edited saves here, under their own names (or use --in-place)')
+    group_batch.add_argument('--csv', metavar='FILE', help='write the decoded fields of every save as csv')
+    group_batch.add_argument('--npy', metavar='FILE', help='write the decoded fields of every save as a numpy structured array')
+    group_batch.add_argument('-j', '--jobs', metavar='N', type=int, help='number of processes (default: number of cpus)')
 
     parser.add_argument('--twl', metavar='VALUE', type=int, help='set total wonder lines')
 
@@ -20,25 +141,73 @@ def main():
 
     args = parser.parse_args()
 
-    sram = TheNewTetrisSram(verbose=args.verbose)
-    sram.from_file(args.SRC)
+    edits = {}
+    for name, value in (('total_wonder_lines', args.twl), ('music_level', args.mlvl), ('sfx_level', args.slvl), ('music_mode', args.mode), ('song', args.song)):
+        if value is not None:
+            edits[name] = value
+
+    if args.diff:
+        if args.SRC is not None or args.batch:
+            parser.error("--diff takes its own files, without SRC or --batch")
+        if edits or args.repair or args.in_place:
+            parser.error("--diff only compares saves, without edits, --repair or --in-place")
+        if len(args.diff) < 2:
+            parser.error("--diff needs at least two files")
+        run_diff(parser, args)
+        return
+
+    if args.batch:
+        if args.SRC is not None:
+            parser.error("SRC and --batch are mutually exclusive")
+        if args.outdir is not None and args.in_place:
+            parser.error("--outdir and --in-place are mutually exclusive")
+        if edits and args.outdir is None and not args.in_place:
+            parser.error("edits in --batch mode need --outdir or --in-place")
+        run_batch(args, edits)
+        return
+
+    if args.SRC is None:
+        parser.error("SRC, --diff or --batch is required")
+    if args.DEST is not None and args.in_place:
+        parser.error("DEST and --in-place are mutually exclusive")
+    if args.DEST is None and not args.in_place and not (args.show or args.verify or args.frametimes):
+        parser.error("one of DEST, --in-place, --show, --verify or --frametimes is required")
+    if (edits or args.repair) and args.DEST is None and not args.in_place:
+        parser.error("edits and --repair need DEST or --in-place")
+
+    sram = load(args.SRC, args.verbose)
+
+    verify_failed = False
+    if args.verify:
+        checksums_ok, ranges = sram.verify()
+        for start, ok in zip(BANKS, checksums_ok):
+            print(f"bank 0x{start:04X}: checksum {'ok' if ok else 'BAD'}")
+        for start, end in ranges:
+            print(f"banks differ: 0x{start:04X}-0x{end:04X}")
+        verify_failed = not (all(checksums_ok) and not ranges)
+        if verify_failed and not args.repair:
+            sys.exit(2)
 
-    if args.twl is not None:
-        sram.set_total_wonder_lines(args.twl)
+    if args.repair:
+        sram.repair()
 
-    if args.mlvl is not None:
-        sram.set_music_level(args.mlvl)
+    if edits:
+        sram.write_many(edits)
 
-    if args.slvl is not None:
-        sram.set_sfx_level(args.slvl)
+    if args.show:
+        for name, value in sram.read_all().items():
+            print(f"{name}: {value}")
 
-    if args.mode is not None:
-        sram.set_music_mode(args.mode)
+    if args.frametimes:
+        show_frame_times(sram)
 
-    if args.song is not None:
-        sram.set_song(args.song)
+    if args.in_place:
+        sram.update_file(args.SRC)
+    elif args.DEST is not None:
+        sram.to_file(args.DEST)
 
-    sram.to_file(args.DEST)
+    if verify_failed:
+        sys.exit(2)
 
 if __name__ == "__main__":
     main()
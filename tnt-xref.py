@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+    # Most called functions
+    $ ./tnt-xref.py ~/tnt.z64
+
+    # Every call of display_text, and the functions making them
+    $ ./tnt-xref.py ~/tnt.z64 --callers 0x80077960
+
+    # What FUN_80052114 (which allocates player_data) calls
+    $ ./tnt-xref.py ~/tnt.z64 --callees 0x80052114
+
+    # The hooks of -X: what each replaced, whether it is in place, and the
+    # other calls of the same function (the next hook sites)
+    $ ./tnt-xref.py -v mod.z64 --hooks
+"""
+
+import sys
+import argparse
+import time
+import numpy as np
+
+from n64tetris.roms.tnt import TheNewTetrisRom, GAME_FUNCTIONS, HOOKS, CODE_WINDOW
+from n64tetris.xref import XrefIndex, KINDS, DEFAULT_CACHE_DIR
+
+def auto_int(x):
+    return int(x, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description='Call graph of the code loaded at boot, from its jal/jalr instructions.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='increase verbosity')
+    parser.add_argument('-f', '--force', action='store_true', help='bypass safety checks')
+    parser.add_argument('SRC', help='source rom file')
+    parser.add_argument('--callers', metavar='VADDR', type=auto_int, help='list the calls of the function at VADDR')
+    parser.add_argument('--callees', metavar='VADDR', type=auto_int, help='list the calls made by the function at VADDR')
+    parser.add_argument('--hooks', action='store_true', help='check the hook sites of the -X routines')
+    parser.add_argument('--top', metavar='N', type=int, default=20, help='number of most called functions to list (default: 20)')
+    parser.add_argument('--cache', metavar='DIR', default=DEFAULT_CACHE_DIR, help=f'where indexes are cached, by hash of the code (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='always rebuild the index, and do not save it')
+    args = parser.parse_args()
+
+    rom = TheNewTetrisRom(verbose=args.verbose, force=args.force)
+    rom.from_file(args.SRC)
+
+    t0 = time.perf_counter()
+    xref, cached = XrefIndex.for_rom(rom, None if args.no_cache else args.cache)
+    if args.verbose:
+        print(f"{'Loaded' if cached else 'Built'} index of {len(xref)} calls in {1000 * (time.perf_counter() - t0):.1f} ms", file=sys.stderr)
+
+    names = dict(GAME_FUNCTIONS)
+    if rom.hooked_routines():
+        names.update(rom.overlay_symbols())
+
+    def name(vaddr):
+        if vaddr == 0:
+            return '?'
+        return names.get(vaddr, f"func_{vaddr:08X}")
+
+    def print_calls(records):
+        print("site, rom, kind, caller, target")
+        for site, target, caller, kind in records.tolist():
+            print(f"{site:08X}, 0x{site - rom.virt(0):06X}, {KINDS[kind]}, {name(caller)}, {name(target)}")
+
+    if args.callers is not None:
+        print_calls(xref.callers(args.callers))
+    elif args.callees is not None:
+        print_calls(xref.calls_from(args.callees))
+    elif args.hooks:
+        start, end = rom.virt(CODE_WINDOW[0]), rom.virt(CODE_WINDOW[1])
+        print("hook, site, original, current, state, other calls of original")
+        for hook, (addr, original) in HOOKS.items():
+            site = rom.virt(addr)
+            word = int.from_bytes(rom.data[addr : addr + 4], byteorder='big')
+            callee = 0x80000000 | ((original & 0x3FFFFFF) << 2)
+            current = 0x80000000 | ((word & 0x3FFFFFF) << 2)
+            if word == original:
+                state = 'original'
+            elif word >> 26 == 0b000011 and start <= current < end:
+                state = 'hooked'
+            else:
+                state = 'CONFLICT'
+            # the calls made by the -X routines themselves are not hook sites
+            others = xref.callers(callee)
+            others = others[(others['site'] != site) & ((others['site'] < start) | (others['site'] >= end))]
+            print(f"{hook}, {site:08X}, {name(callee)}, {name(current) if word >> 26 == 0b000011 else f'{word:08X}'}, {state}, {len(others)}")
+            if args.verbose:
+                for other, _, caller, _ in others.tolist():
+                    print(f"    {other:08X} (0x{other - rom.virt(0):06X}) in {name(caller)}", file=sys.stderr)
+    else:
+        targets, counts = np.unique(xref.records['target'], return_counts=True)
+        print("target, calls, callers")
+        for i in np.argsort(-counts, kind='stable')[: args.top].tolist():
+            callers = len(np.unique(xref.callers(targets[i])['caller']))
+            print(f"{name(int(targets[i]))}, {counts[i]}, {callers}")
+
+if __name__ == "__main__":
+    main()